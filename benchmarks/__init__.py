@@ -0,0 +1,6 @@
+"""Benchmarks of the monitor overhead
+
+python -m benchmarks --output bench.json
+python -m benchmarks --sizes --workloads --imports trio_vis
+python -m benchmarks.compare base.json bench.json
+"""
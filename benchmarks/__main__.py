@@ -0,0 +1,118 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from .analytics import bench_analytics
+from .importtime import bench_import
+from .synthetic import SHAPES, bench_case
+from .workloads import WORKLOADS, bench_workload
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def report(result: Dict):
+    if result["kind"] == "synthetic":
+        name = f"{result['shape']}-{result['size']}-{result['sink']}"
+        latency = result["latencyNs"]
+        peak = result["peakMemoryBytes"]
+        print(
+            f"{name:<28} {result['eventsPerSec']:>12,.0f} ev/s"
+            f"  p50 {latency['p50']:>7,} ns  p99 {latency['p99']:>9,} ns"
+            + ("" if peak is None else f"  peak {peak / 2**20:8.1f} MiB")
+        )
+    elif result["kind"] == "import":
+        eager = ", ".join(result["eagerDeps"]) or "-"
+        print(
+            f"import:{result['module']:<21} {result['importUs'] / 1000:>9.1f} ms"
+            f"  modules {result['modules']:>4}  eager deps {eager}"
+        )
+    elif result["kind"] == "analytics":
+        seconds = "  ".join(f"{k} {v:6.2f} s" for k, v in result["seconds"].items())
+        print(f"analytics-{result['events']:<18,} {seconds}")
+    else:
+        print(
+            f"trio:{result['workload']:<23} {result['eventsPerSec']:>12,.0f} ev/s"
+            f"  overhead {result['overhead'] * 100:6.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trio-vis monitor")
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument(
+        "--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES)
+    )
+    parser.add_argument(
+        "--sinks",
+        nargs="+",
+        choices=["memory", "ndjson", "binary", "background"],
+        default=["memory"],
+    )
+    parser.add_argument(
+        "--workloads", nargs="*", choices=list(WORKLOADS), default=list(WORKLOADS)
+    )
+    parser.add_argument(
+        "--imports",
+        nargs="*",
+        default=["trio_vis", "trio_vis.sc_monitor"],
+        help="modules to measure the import time of",
+    )
+    parser.add_argument(
+        "--analytics",
+        type=int,
+        nargs="*",
+        default=[],
+        help="tasks of the columnar analytics cases (4 events per task)",
+    )
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory")
+    args = parser.parse_args()
+
+    results: List[Dict] = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            for sink in args.sinks:
+                result = bench_case(shape, size, sink, memory=not args.no_memory)
+                report(result)
+                results.append(result)
+    for workload in args.workloads:
+        result = bench_workload(workload)
+        report(result)
+        results.append(result)
+    for size in args.analytics:
+        result = bench_analytics(size)
+        report(result)
+        results.append(result)
+    for module in args.imports:
+        result = bench_import(module)
+        report(result)
+        results.append(result)
+
+    meta = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+    }
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
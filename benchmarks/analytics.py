@@ -0,0 +1,85 @@
+import time
+from typing import Dict
+
+from trio_vis.binary_log import NO_PARENT, TYPE_IDS
+from trio_vis.columnar import CREATED, EXITED, TASK, EventColumns
+from trio_vis.registry import SCOPE_SUFFIX
+
+""" Columnar analytics over millions of events
+
+    The columns are filled straight from NumPy arrays, a flat nursery
+    spawning `size` tasks (4 events per task) with overlapping lifetimes.
+"""
+
+SCOPE = TYPE_IDS["scope"]
+CORO_NAMES = ("fetch", "parse", "store", "notify")
+
+
+def synthetic_columns(size: int, seed: int = 0) -> EventColumns:
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    start = np.arange(size, dtype=np.int64) * 1_000 + 1
+    end = start + rng.integers(1_000, 1_000_000, size)
+
+    columns = EventColumns()
+    columns.names.append("nursery-0")
+    for i in range(size):
+        name = f"{CORO_NAMES[i % len(CORO_NAMES)]}-{i}"
+        columns.names.append(name + SCOPE_SUFFIX)
+        columns.names.append(name)
+    columns.name_ids = {name: i for i, name in enumerate(columns.names)}
+    scope_ids = np.arange(size, dtype=np.uint32) * 2 + 1
+
+    # per task: scope created, task created, task exited, scope exited
+    ts = np.stack([start, start, end, end], axis=1).ravel()
+    desc = np.tile(np.array([CREATED, CREATED, EXITED, EXITED], np.uint8), size)
+    types = np.tile(np.array([SCOPE, TASK, TASK, SCOPE], np.uint8), size)
+    names = np.stack([scope_ids, scope_ids + 1, scope_ids + 1, scope_ids], 1).ravel()
+    parent = np.stack(
+        [np.zeros(size, np.uint32), scope_ids, scope_ids, np.zeros(size, np.uint32)],
+        axis=1,
+    ).ravel()
+
+    order = np.argsort(ts, kind="stable")
+    # the nursery opens first & exits last
+    columns.ts.fromlist([0])
+    columns.ts.frombytes(ts[order].tobytes())
+    columns.ts.append(int(end.max()) + 1)
+    columns.desc.fromlist([CREATED])
+    columns.desc.frombytes(desc[order].tobytes())
+    columns.desc.append(EXITED)
+    columns.type.fromlist([SCOPE])
+    columns.type.frombytes(types[order].tobytes())
+    columns.type.append(SCOPE)
+    columns.name.fromlist([0])
+    columns.name.frombytes(names[order].tobytes())
+    columns.name.append(0)
+    columns.parent.fromlist([NO_PARENT])
+    columns.parent.frombytes(parent[order].tobytes())
+    columns.parent.append(NO_PARENT)
+    nm_events = len(columns.ts)
+    columns.seq.frombytes(np.arange(nm_events, dtype=np.uint64).tobytes())
+    columns.outcome.frombytes(bytes(nm_events))
+    return columns
+
+
+def bench_analytics(size: int) -> Dict:
+    columns = synthetic_columns(size)
+    timings = {}
+    for name, run in (
+        ("concurrency", lambda: columns.concurrency(bucket_ns=1_000_000)),
+        ("lifetimes", columns.lifetimes),
+        ("spawnRates", lambda: columns.spawn_rates(n=10)),
+    ):
+        begin = time.perf_counter()
+        run()
+        timings[name] = time.perf_counter() - begin
+    total = sum(timings.values())
+    return {
+        "kind": "analytics",
+        "size": size,
+        "events": len(columns),
+        "seconds": timings,
+        "eventsPerSec": len(columns) / total if total > 0 else 0.0,
+    }
@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+from typing import Dict, Tuple
+
+""" Compare two benchmark result files
+
+    Exit with 1 if any case got slower than the threshold
+"""
+
+
+def case_key(result: Dict) -> Tuple:
+    if result["kind"] == "synthetic":
+        return ("synthetic", result["shape"], result["size"], result["sink"])
+    if result["kind"] == "import":
+        return ("import", result["module"])
+    if result["kind"] == "analytics":
+        return ("analytics", result["size"])
+    return ("trio", result["workload"])
+
+
+def speed(result: Dict) -> float:
+    if result["kind"] == "import":
+        return 1 / result["importUs"]
+    return result["eventsPerSec"]
+
+
+def load(filename: str) -> Dict[Tuple, Dict]:
+    with open(filename) as f:
+        return {case_key(r): r for r in json.load(f)["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare trio-vis benchmark results")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="allowed slowdown (ratio)"
+    )
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    regressed = False
+    for key, result in new.items():
+        if key not in base:
+            continue
+        ratio = speed(result) / speed(base[key])
+        slower = ratio < 1 - args.threshold
+        regressed |= slower
+        mark = "REGRESSED" if slower else ""
+        print(f"{'-'.join(map(str, key)):<36} {ratio:6.2f}x {mark}")
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+""" Import time of trio-vis, measured with `python -X importtime`
+
+    Every round imports the module in a fresh interpreter, the fastest round
+    is kept. Dependencies which should only be imported on use are reported
+    when they show up anyway.
+"""
+
+# only needed to validate a config (pydantic) or print the tree (rich)
+LAZY_DEPS = ("pydantic", "rich")
+
+# self, cumulative (us) by module
+ImportTimes = Dict[str, Tuple[int, int]]
+
+
+def parse_importtime(stderr: str) -> ImportTimes:
+    times: ImportTimes = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # the header line
+            continue
+        times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return times
+
+
+def import_times(module: str) -> ImportTimes:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr)
+
+
+def bench_import(module: str, rounds: int = 5) -> Dict:
+    best: ImportTimes = {}
+    for _ in range(rounds):
+        times = import_times(module)
+        if not best or times[module][1] < best[module][1]:
+            best = times
+    heaviest: List[Tuple[str, int]] = sorted(
+        ((name, cumulative) for name, (_, cumulative) in best.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return {
+        "kind": "import",
+        "module": module,
+        "importUs": best[module][1],
+        "modules": len(best),
+        "heaviest": heaviest[1:11],
+        "eagerDeps": [dep for dep in LAZY_DEPS if dep in best],
+    }
@@ -0,0 +1,183 @@
+import contextlib
+import io
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, cast
+
+from trio_vis.config import VisConfig
+from trio_vis.histogram import Histogram
+from trio_vis.sc_logger import SCLogger
+from trio_vis.sc_monitor import SC_Monitor
+from trio_vis.trio_fake import FakeTrioTask, build_tree_from_json
+
+""" Drive SC_Monitor with synthetic task trees
+
+    A tree is built once with `build_tree_from_json`, then replayed into the
+    monitor as spawn/exit events. The fake tree itself is never mutated,
+    nurseries stay listed until their parent task exits, so every nursery
+    is exited along with its task.
+
+    Shapes, `size` is the number of tasks:
+    1. wide: the root nursery holds chunks of sibling tasks
+    2. deep: chains of nested task -> nursery -> task
+    3. churn: tasks spawn & exit continuously, few of them alive at once
+"""
+
+# siblings per nursery, building fake trees is quadratic in it
+CHUNK = 1000
+DEPTH = 100
+CHURN_WINDOW = 64
+
+Op = Tuple[str, FakeTrioTask]
+
+
+def _task(name: str, nurseries: List[Dict]) -> Dict:
+    return {"name": name, "nurseries": nurseries}
+
+
+def _nursery(name: str, tasks: List[Dict]) -> Dict:
+    return {"name": name, "tasks": tasks}
+
+
+def _chunked(tasks: List[Dict]) -> List[Dict]:
+    return [
+        _nursery(f"n{i}", tasks[i : i + CHUNK]) for i in range(0, len(tasks), CHUNK)
+    ]
+
+
+def wide_shape(size: int) -> Dict:
+    return _task("root", _chunked([_task(f"t{i}", []) for i in range(size)]))
+
+
+def deep_shape(size: int) -> Dict:
+    chains: List[Dict] = []
+    counter = 0
+    while counter < size:
+        chain: Optional[Dict] = None
+        for _ in range(min(DEPTH, size - counter)):
+            nurseries = [] if chain is None else [_nursery(f"n{counter}", [chain])]
+            chain = _task(f"t{counter}", nurseries)
+            counter += 1
+        assert chain is not None
+        chains.append(chain)
+    return _task("root", _chunked(chains))
+
+
+SHAPES: Dict[str, Callable[[int], Dict]] = {
+    "wide": wide_shape,
+    "deep": deep_shape,
+    "churn": wide_shape,
+}
+
+
+def build(shape: str, size: int) -> FakeTrioTask:
+    # fake tasks print on creation
+    with contextlib.redirect_stdout(io.StringIO()):
+        return build_tree_from_json(SHAPES[shape](size))
+
+
+def _subtree_ops(task: FakeTrioTask) -> Iterator[Op]:
+    """Spawn the whole subtree (parents first), then exit it (children first)"""
+    yield ("spawn", task)
+    for nursery in task.child_nurseries:
+        for child in nursery.child_tasks:
+            yield from _subtree_ops(child)
+    yield ("exit", task)
+
+
+def replay_ops(root: FakeTrioTask, shape: str) -> List[Op]:
+    ops: List[Op] = []
+    for nursery in root.child_nurseries:
+        children = list(nursery.child_tasks)
+        if shape != "churn":
+            for child in children:
+                ops.extend(op for op in _subtree_ops(child) if op[0] == "spawn")
+            for child in reversed(children):
+                ops.extend(op for op in _subtree_ops(child) if op[0] == "exit")
+            continue
+        for i, child in enumerate(children):
+            ops.append(("spawn", child))
+            if i >= CHURN_WINDOW:
+                ops.append(("exit", children[i - CHURN_WINDOW]))
+        for child in children[-CHURN_WINDOW:]:
+            ops.append(("exit", child))
+    return ops
+
+
+def sink_config(sink: str, log_filename: str) -> VisConfig:
+    sink_options: Dict[str, Dict] = {
+        "memory": {},
+        "ndjson": {"log_streaming": True},
+        "binary": {"log_binary": True},
+        "background": {"log_in_background": True},
+    }
+    options = sink_options[sink]
+    return VisConfig(
+        only_vis_user_scope=False,
+        print_task_tree=False,
+        log_filename=log_filename,
+        **options,
+    )
+
+
+def _run(root: FakeTrioTask, ops: List[Op], cfg: VisConfig, timed: bool):
+    monitor = SC_Monitor(config=cfg)
+    hist = Histogram()
+    clock = time.perf_counter_ns
+    spawned, exited = monitor.task_spawned, monitor.task_exited
+
+    start = clock()
+    spawned(root)
+    for kind, task in ops:
+        if timed:
+            t0 = clock()
+            spawned(task) if kind == "spawn" else exited(task)
+            hist.record(clock() - t0)
+        else:
+            spawned(task) if kind == "spawn" else exited(task)
+    exited(root)
+    elapsed = clock() - start
+
+    finalize_start = clock()
+    cast(SCLogger, monitor.sc_logger)._write_log()
+    return hist, elapsed, clock() - finalize_start
+
+
+def bench_case(shape: str, size: int, sink: str, memory: bool = True) -> Dict:
+    root = build(shape, size)
+    ops = replay_ops(root, shape)
+    with tempfile.TemporaryDirectory() as tmp:
+        log_filename = str(Path(tmp) / "sc-logs.json")
+        # throughput without per-event clocks, then latencies
+        _, elapsed, finalize_ns = _run(
+            root, ops, sink_config(sink, log_filename), timed=False
+        )
+        hist, _, _ = _run(root, ops, sink_config(sink, log_filename), timed=True)
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            _run(root, ops, sink_config(sink, log_filename), timed=False)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    nm_events = len(ops) + 2
+    return {
+        "kind": "synthetic",
+        "shape": shape,
+        "size": size,
+        "sink": sink,
+        "events": nm_events,
+        "seconds": elapsed / 1e9,
+        "eventsPerSec": nm_events / (elapsed / 1e9),
+        "finalizeSeconds": finalize_ns / 1e9,
+        "latencyNs": {
+            "p50": hist.percentile(50),
+            "p90": hist.percentile(90),
+            "p99": hist.percentile(99),
+            "max": hist.max,
+        },
+        "peakMemoryBytes": peak,
+    }
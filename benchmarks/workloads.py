@@ -0,0 +1,93 @@
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, cast
+
+import trio
+
+from trio_vis.config import VisConfig
+from trio_vis.sc_logger import SCLogger
+from trio_vis.sc_monitor import SC_Monitor
+
+""" Real `trio.run` workloads, similar to the programs in examples/
+
+    Each workload is run without and with the monitor, the best of a few
+    rounds is kept for both.
+"""
+
+
+async def fanout():
+    async def child():
+        await trio.sleep(0)
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(2000):
+            nursery.start_soon(child)
+
+
+async def nested_jobs():
+    async def submit(i: int):
+        for _ in range(3):
+            await trio.sleep(0)
+
+    async def do_job(i: int):
+        async with trio.open_nursery() as nursery:
+            for k in range(20):
+                nursery.start_soon(submit, k)
+
+    async with trio.open_nursery() as nursery:
+        for i in range(50):
+            nursery.start_soon(do_job, i)
+
+
+async def churn():
+    async def short():
+        await trio.sleep(0)
+
+    for _ in range(100):
+        async with trio.open_nursery() as nursery:
+            for _ in range(50):
+                nursery.start_soon(short)
+
+
+WORKLOADS: Dict[str, Callable[[], Awaitable[None]]] = {
+    "fanout": fanout,
+    "nested_jobs": nested_jobs,
+    "churn": churn,
+}
+
+
+def _timed(main: Callable[[], Awaitable[None]], monitor: Optional[SC_Monitor]):
+    instruments: List = [] if monitor is None else [monitor]
+    start = time.perf_counter()
+    trio.run(main, instruments=instruments)
+    return time.perf_counter() - start
+
+
+def bench_workload(name: str, rounds: int = 3) -> Dict:
+    main = WORKLOADS[name]
+    baseline = min(_timed(main, None) for _ in range(rounds))
+
+    monitored = []
+    events = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(rounds):
+            cfg = VisConfig(
+                print_task_tree=False, log_filename=str(Path(tmp) / "sc-logs.json")
+            )
+            monitor = SC_Monitor(config=cfg)
+            monitored.append(_timed(main, monitor))
+            sc_logger = cast(SCLogger, monitor.sc_logger)
+            events = sc_logger.event_id
+            sc_logger._write_log()
+
+    best = min(monitored)
+    return {
+        "kind": "trio",
+        "workload": name,
+        "baselineSeconds": baseline,
+        "monitoredSeconds": best,
+        "overhead": best / baseline - 1,
+        "events": events,
+        "eventsPerSec": events / best,
+    }
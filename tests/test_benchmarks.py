@@ -0,0 +1,51 @@
+from collections import Counter
+
+import pytest
+
+from benchmarks.importtime import bench_import, parse_importtime
+from benchmarks.synthetic import CHURN_WINDOW, bench_case, build, replay_ops
+
+
+@pytest.mark.parametrize("shape", ["wide", "deep", "churn"])
+def test_replay_ops(shape):
+    root = build(shape, 300)
+    ops = replay_ops(root, shape)
+    assert Counter(kind for kind, _ in ops) == {"spawn": 300, "exit": 300}
+
+    alive = set()
+    peak = 0
+    for kind, task in ops:
+        if kind == "spawn":
+            assert task not in alive
+            alive.add(task)
+        else:
+            alive.remove(task)
+        peak = max(peak, len(alive))
+    assert peak == (CHURN_WINDOW + 1 if shape == "churn" else 300)
+
+
+def test_bench_case():
+    result = bench_case("deep", 200, "binary", memory=False)
+    assert result["events"] == 402
+    assert result["latencyNs"]["p50"] > 0
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   trio_vis.protocol\n"
+        "import time:       300 |        420 | trio_vis\n"
+    )
+    assert parse_importtime(stderr) == {
+        "trio_vis.protocol": (120, 120),
+        "trio_vis": (300, 420),
+    }
+
+
+@pytest.mark.parametrize(
+    "module", ["trio_vis", "trio_vis.sc_monitor", "trio_vis.query"]
+)
+def test_import_stays_lazy(module):
+    result = bench_import(module, rounds=1)
+    assert result["importUs"] > 0
+    assert result["eagerDeps"] == []
@@ -0,0 +1,52 @@
+import pytest
+
+from trio_vis.bg_writer import BackgroundWriter
+from trio_vis.log_sink import MemorySink
+
+
+def test_writer_drain_all_on_stop():
+    sink = MemorySink("unused.json")
+    writer = BackgroundWriter(lambda e: sink.emit({"time": e[0]}), batch_size=2)
+    for i in range(5):
+        writer.put((i,))
+    writer.stop()
+
+    assert sink.events == [{"time": i} for i in range(5)]
+    assert writer.written == 5
+    assert writer.queue_depth == 0
+    assert writer.dropped == 0
+
+
+def test_writer_drop_when_full():
+    sink = MemorySink("unused.json")
+    writer = BackgroundWriter(lambda e: sink.emit({"time": e[0]}))
+    writer.stop()
+
+    writer.max_queue_size = 2
+    for i in range(5):
+        writer.put((i,))
+    assert writer.queue_depth == 2
+    assert writer.dropped == 3
+
+
+def test_writer_failure_raised_on_stop():
+    sink = MemorySink("unused.json")
+
+    def write(event):
+        if event[0] == 1:
+            raise TypeError("not serializable")
+        sink.emit({"time": event[0]})
+
+    writer = BackgroundWriter(write, interval=0)
+    for i in range(3):
+        writer.put((i,))
+    writer._thread.join(1)
+    # nothing is queued once the thread died
+    writer.put((3,))
+    assert writer.queue_depth == 0
+
+    with pytest.raises(RuntimeError) as info:
+        writer.stop()
+    assert isinstance(info.value.__cause__, TypeError)
+    assert sink.events == [{"time": 0}]
+    assert writer.written + writer.dropped == 4
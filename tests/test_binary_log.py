@@ -0,0 +1,149 @@
+import json
+
+import pytest
+
+from trio_vis.binary_log import BinaryLogReader, BinarySink, binary_to_sc_vis
+from trio_vis.registry import SCRegistry
+from trio_vis.sc_logger import SCLogger
+from trio_vis.trio_fake import FakeTrioTask
+
+CONFIG = {"makeDirectScopeTransparent": True}
+
+EVENTS = [
+    {
+        "time": 0,
+        "desc": "created",
+        "name": "main-0__TRIO_VIS_Tscope",
+        "type": "scope",
+        "ts": 0,
+    },
+    {
+        "time": 1,
+        "desc": "created",
+        "name": "main-0",
+        "type": "task",
+        "parent": "main-0__TRIO_VIS_Tscope",
+        "ts": 150,
+    },
+    {
+        "time": 2,
+        "desc": "exited",
+        "name": "main-0",
+        "type": "task",
+        "parent": "main-0__TRIO_VIS_Tscope",
+        "ts": 2000,
+        "outcome": "error",
+        "cancelCalled": True,
+        "exception": "ValueError",
+        "runNs": 1200,
+        "steps": 3,
+        "maxStepNs": 800,
+    },
+    {
+        "time": 3,
+        "desc": "exited",
+        "name": "main-0__TRIO_VIS_Tscope",
+        "type": "task",
+        "ts": 2100,
+    },
+]
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+def test_binary_log_round_trip(tmp_path, compression):
+    filename = str(tmp_path / "sc-logs.bin")
+    sink = BinarySink(filename, batch_size=3, compression=compression)
+    for e in EVENTS:
+        sink.emit(e)
+    sink.close(CONFIG)
+
+    reader = BinaryLogReader(filename)
+    assert list(reader) == EVENTS
+    assert reader.config == CONFIG
+
+
+def test_binary_sink_drop_exited_names(tmp_path):
+    sink = BinarySink(str(tmp_path / "sc-logs.bin"))
+    for e in EVENTS:
+        sink.emit(e)
+    assert sink.name_ids == {}
+    assert sink.nm_names == 2
+
+
+def test_binary_sink_reuse_name_ids(tmp_path):
+    filename = str(tmp_path / "sc-logs.bin")
+    sink = BinarySink(filename, batch_size=4)
+    events = [
+        {"time": 2 * i + j, "desc": desc, "name": f"t-{i}", "type": "task", "ts": i}
+        for i in range(100)
+        for j, desc in enumerate(("created", "exited"))
+    ]
+    for e in events:
+        sink.emit(e)
+    sink.close(CONFIG)
+
+    # only ids freed in earlier blocks are handed out again
+    assert sink.nm_names == 2
+    assert list(BinaryLogReader(filename)) == events
+
+
+def test_binary_sink_name_too_long(tmp_path):
+    sink = BinarySink(str(tmp_path / "sc-logs.bin"))
+    with pytest.raises(ValueError):
+        sink.emit(dict(EVENTS[0], name="x" * 70000))
+
+
+def test_binary_to_sc_vis(tmp_path):
+    filename = str(tmp_path / "sc-logs.bin")
+    sink = BinarySink(filename, batch_size=2, compression="zlib")
+    for e in EVENTS:
+        sink.emit(e)
+    sink.close(CONFIG)
+
+    log_file = tmp_path / "sc-logs.json"
+    binary_to_sc_vis(filename, str(log_file))
+    assert json.loads(log_file.read_text()) == {"config": CONFIG, "runRecords": EVENTS}
+
+
+def test_not_a_binary_log(tmp_path):
+    filename = tmp_path / "sc-logs.json"
+    filename.write_text("{}" * 10)
+    with pytest.raises(ValueError):
+        list(BinaryLogReader(str(filename)))
+
+
+def test_binary_outcome_without_extras(tmp_path):
+    filename = str(tmp_path / "sc-logs.bin")
+    sink = BinarySink(filename)
+    event = dict(EVENTS[1], desc="exited", outcome="cancelled", cancelCalled=True)
+    sink.emit(event)
+    assert sink._extras == []
+    sink.close(CONFIG)
+    assert list(BinaryLogReader(filename)) == [event]
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_binary_sink_raw_events(tmp_path, background):
+    filename = str(tmp_path / "sc-logs.bin")
+    sink = BinarySink(filename, batch_size=2)
+    logger = SCLogger(
+        SCRegistry(), log_filename=filename, sink=sink, background=background
+    )
+    task = FakeTrioTask(name="t0")
+    logger.log_start(child=task, parent=None)
+    logger.log_exit(child=task, parent=None, extra={"outcome": "ok", "steps": 2})
+    logger._write_log()
+
+    scope = "t0-0__TRIO_VIS_Tscope"
+    events = list(BinaryLogReader(filename))
+    assert [(e["desc"], e["name"], e.get("parent")) for e in events] == [
+        ("created", scope, None),
+        ("created", "t0-0", scope),
+        ("exited", "t0-0", scope),
+        ("exited", scope, None),
+    ]
+    assert events[2]["outcome"] == "ok"
+    assert events[2]["steps"] == 2
+    # names are interned by ref, each scope once
+    assert sink.nm_names == 2
+    assert sink.name_ids == {}
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from trio_vis.columnar import ColumnarSink, EventColumns
+from trio_vis.config import VisConfig
+from trio_vis.log_sink import sink_from_config
+
+from .test_query import run_events
+
+
+def test_round_trip():
+    events = run_events()
+    for event in events:
+        if event["parent"] is None:
+            del event["parent"]
+    events[-4]["runNs"] = 1200
+    events[-4]["cancelCalled"] = True
+    columns = EventColumns.from_events(events)
+
+    assert len(columns) == len(events)
+    assert list(columns) == events
+    # exception type of the errored leaf, run stats of the last event
+    assert columns.extras[16] == {"exception": "KeyError"}
+    assert list(columns.extras) == [16, len(events) - 4]
+    assert len(columns.names) == 14
+
+
+def test_columnar_sink(tmp_path):
+    filename = str(tmp_path / "sc-logs.json")
+    sink = sink_from_config(
+        VisConfig(log_columnar=True, log_filename=filename, log_index=True)
+    )
+    assert isinstance(sink, ColumnarSink)
+    for event in run_events():
+        sink.emit(event)
+    sink.close({"makeDirectScopeTransparent": True})
+
+    with open(filename) as f:
+        assert len(json.load(f)["runRecords"]) == len(run_events())
+    assert (tmp_path / "sc-logs.index.json").exists()
+
+
+def test_concurrency():
+    np = pytest.importorskip("numpy")
+    columns = EventColumns.from_events(run_events())
+
+    ts, live = columns.concurrency()
+    assert live.max() == 6
+    assert ts[live.argmax()] == 7
+    assert live[-1] == 0
+
+    starts, peaks = columns.concurrency(bucket_ns=20)
+    assert starts.tolist() == [0, 20, 40, 80, 100]
+    assert peaks.tolist() == [6, 5, 4, 2, 1]
+    assert isinstance(peaks, np.ndarray)
+
+
+def test_lifetimes():
+    pytest.importorskip("numpy")
+    lifetimes = EventColumns.from_events(run_events()).lifetimes()
+
+    assert set(lifetimes) == {"main", "job", "leaf"}
+    # job-0..2 lived 8, 47 & 86 ns
+    assert lifetimes["job"] == {
+        "count": 3,
+        "meanNs": pytest.approx(47.0),
+        "p50Ns": 47,
+        "p90Ns": 47,
+        "p99Ns": 47,
+        "maxNs": 86,
+    }
+    assert lifetimes["leaf"]["count"] == 2
+
+
+def test_spawn_rates():
+    pytest.importorskip("numpy")
+    rates = EventColumns.from_events(run_events()).spawn_rates()
+
+    assert list(rates) == ["nursery-0", "nursery-1"]
+    assert rates["nursery-0"]["spawned"] == 3
+    assert rates["nursery-0"]["durationNs"] == 94
+    assert rates["nursery-1"]["perSec"] == pytest.approx(2 * 1e9 / 40)
+    assert list(EventColumns.from_events(run_events()).spawn_rates(n=1)) == [
+        "nursery-0"
+    ]
+
+
+def test_empty_store():
+    pytest.importorskip("numpy")
+    columns = EventColumns()
+    assert len(columns.concurrency()[0]) == 0
+    assert columns.lifetimes() == {}
+    assert columns.spawn_rates() == {}
@@ -1,5 +1,12 @@
+import gc
+import weakref
+
+import pytest
+import trio
+
 from trio_vis.desc_tree import DescTree
-from trio_vis.trio_fake import FakeTrioTask
+from trio_vis.registry import SCRegistry
+from trio_vis.trio_fake import FakeTrioNursery, FakeTrioTask
 
 
 def test_build_state_tree(fake_tree: FakeTrioTask):
@@ -44,6 +51,118 @@ def test_remove_task(fake_tree: FakeTrioTask):
     assert desc_tree.ref_2node.get(t2, None) is None
 
 
+def test_insert_task_under_known_nursery(fake_tree: FakeTrioTask):
+    desc_tree = DescTree.build(fake_tree)
+
+    n1 = fake_tree.get_nursery_node("n1")
+    t4 = FakeTrioTask(name="t4")
+    n1._add_task(t4)
+
+    inserted = desc_tree.insert_task(t4)
+    assert [n.ref for n in inserted] == [t4]
+    assert desc_tree.get_parent_ref(t4) is n1
+    desc_tree.check_consistency(fake_tree)
+
+
+def test_insert_task_discover_nursery(fake_tree: FakeTrioTask):
+    desc_tree = DescTree.build(fake_tree)
+
+    t2 = fake_tree.get_task_node("t2")
+    n2 = FakeTrioNursery(name="n2")
+    t4 = FakeTrioTask(name="t4")
+    n2._add_task(t4)
+    t2._add_nursery(n2)
+
+    inserted = desc_tree.insert_task(t4)
+    assert [n.ref for n in inserted] == [n2, t4]
+    assert desc_tree.get_parent_ref(n2) is t2
+    desc_tree.check_consistency(fake_tree)
+
+
+def test_insert_task_untraced_parent(fake_tree: FakeTrioTask):
+    desc_tree = DescTree.build(fake_tree)
+
+    n2 = FakeTrioNursery(name="n2")
+    t4 = FakeTrioTask(name="t4")
+    n2._add_task(t4)
+
+    assert desc_tree.insert_task(t4) == []
+    assert desc_tree.ref_2node.get(t4, None) is None
+
+
+def test_closed_nurseries(fake_tree: FakeTrioTask):
+    desc_tree = DescTree.build(fake_tree)
+    n1 = fake_tree.get_nursery_node("n1")
+
+    for name in ["t2", "t3"]:
+        t = fake_tree.get_task_node(name)
+        fake_tree.tree_remove(name)
+        desc_tree.remove_ref(t)
+    assert desc_tree.closed_nurseries(fake_tree) == []
+
+    fake_tree.tree_remove("n1")
+    assert [n.ref for n in desc_tree.closed_nurseries(fake_tree)] == [n1]
+    # closed nurseries are tolerated until they're dropped
+    desc_tree.check_consistency(fake_tree)
+
+
+def test_check_consistency_missing_task(fake_tree: FakeTrioTask):
+    desc_tree = DescTree.build(fake_tree)
+
+    t4 = FakeTrioTask(name="t4")
+    fake_tree.get_nursery_node("n1")._add_task(t4)
+
+    with pytest.raises(RuntimeError):
+        desc_tree.check_consistency(fake_tree)
+    desc_tree.check_consistency(fake_tree, should_trace=lambda t: t is not t4)
+
+
+def test_weak_tree_purge_collected(fake_tree: FakeTrioTask):
+    registry = SCRegistry(weak=True)
+    desc_tree = DescTree.build(fake_tree, registry=registry)
+
+    # t2 is released by trio without an exit event
+    t2 = fake_tree.get_task_node("t2")
+    fake_tree.tree_remove("t2")
+    t2_node = desc_tree.ref_2node[t2]
+    del t2
+    gc.collect()
+
+    assert t2_node.ref is None
+    desc_tree.purge_collected()
+    assert t2_node not in desc_tree.ref_2node[fake_tree.get_nursery_node("n1")].children
+    assert desc_tree.node_by_name("t2") is None
+    assert len(desc_tree.ref_2node) == 3
+    assert len(registry.registered) == 3
+    desc_tree.check_consistency(fake_tree)
+
+
+def test_weak_tree_releases_nursery_owner():
+    registry = SCRegistry(weak=True)
+    trees = []
+    owners = []
+
+    async def owner():
+        owners.append(weakref.ref(trio.lowlevel.current_task()))
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(trio.sleep, 0)
+            root = trio.lowlevel.current_root_task()
+            trees.append(DescTree.build(root, registry=registry))
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(owner)
+
+    trio.run(main)
+
+    # the tree never saw any task exit, the nursery doesn't pin its task
+    gc.collect()
+    assert owners[0]() is None
+    assert len(registry.registered) == 0
+    trees[0].purge_collected()
+    assert trees[0].root.children == []
+
+
 # @pytest.mark.dev
 # def test_add_task(tmpl1):
 #     internal_tree: FakeTrioTask = cast(FakeTrioTask, gen_tree_from_json(tmpl1))
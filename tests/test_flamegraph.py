@@ -0,0 +1,81 @@
+import io
+
+import pytest
+
+from trio_vis.flamegraph import FoldedStacks, fold_events
+
+
+def task_events(name, parent, start, end, run_ns):
+    scope = f"{name}__TRIO_VIS_Tscope"
+    return [
+        {"time": 0, "desc": "created", "name": scope, "type": "scope", "parent": parent, "ts": start},
+        {"time": 0, "desc": "created", "name": name, "type": "task", "parent": scope, "ts": start},
+        {"time": 0, "desc": "exited", "name": name, "type": "task", "parent": scope, "ts": end, "runNs": run_ns},
+        {"time": 0, "desc": "exited", "name": scope, "type": "scope", "parent": parent, "ts": end},
+    ]  # fmt: skip
+
+
+def run_events():
+    root = task_events("main-0", None, 0, 100_000, 10_000)
+    nursery = [
+        {"time": 0, "desc": "created", "name": "nursery-0", "type": "scope", "parent": "main-0__TRIO_VIS_Tscope", "ts": 1000},
+        {"time": 0, "desc": "exited", "name": "nursery-0", "type": "scope", "parent": "main-0__TRIO_VIS_Tscope", "ts": 90_000},
+    ]  # fmt: skip
+    # concurrent jobs
+    jobs = [
+        task_events(f"do_job-{i}", "nursery-0", 2000, 12_000, 3000) for i in range(3)
+    ]
+    created = [e for job in jobs for e in job[:2]]
+    exited = [e for job in jobs for e in job[2:]]
+    return root[:2] + nursery[:1] + created + exited + nursery[1:] + root[2:]
+
+
+@pytest.mark.parametrize(
+    "weight, aggregate, expected",
+    [
+        ("wall", True, "main 90\nmain;nursery;do_job 30\n"),
+        ("cpu", True, "main 10\nmain;nursery;do_job 9\n"),
+        (
+            "cpu",
+            False,
+            "main-0 10\n"
+            "main-0;nursery-0;do_job-0 3\n"
+            "main-0;nursery-0;do_job-1 3\n"
+            "main-0;nursery-0;do_job-2 3\n",
+        ),
+    ],
+)
+def test_fold_events(weight, aggregate, expected):
+    stacks = fold_events(run_events(), weight=weight, aggregate=aggregate)
+    out = io.StringIO()
+    stacks.write(out)
+    assert out.getvalue() == expected
+    # only live scopes are kept
+    assert stacks.paths == {} and stacks.started == {}
+    assert stacks.owners == {} and stacks.children == {}
+
+
+def test_fold_self_time():
+    # sequential children, nested one level deeper
+    root = task_events("main-0", None, 0, 100_000, 0)
+    nursery = [
+        {"time": 0, "desc": "created", "name": "nursery-0", "type": "scope", "parent": "main-0__TRIO_VIS_Tscope", "ts": 1000},
+        {"time": 0, "desc": "exited", "name": "nursery-0", "type": "scope", "parent": "main-0__TRIO_VIS_Tscope", "ts": 90_000},
+    ]  # fmt: skip
+    first = task_events("fetch-0", "nursery-0", 2000, 12_000, 0)
+    second = task_events("parse-0", "nursery-0", 12_000, 30_000, 0)
+    events = root[:2] + nursery[:1] + first + second + nursery[1:] + root[2:]
+
+    stacks = fold_events(events).stacks
+    assert stacks == {
+        "main": 72_000,
+        "main;nursery;fetch": 10_000,
+        "main;nursery;parse": 18_000,
+    }
+    # the root frame is as wide as the run
+    assert sum(stacks.values()) == 100_000
+
+
+def test_unknown_weight():
+    with pytest.raises(ValueError):
+        FoldedStacks(weight="gpu")
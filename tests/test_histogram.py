@@ -0,0 +1,29 @@
+import pytest
+
+from trio_vis.histogram import Histogram
+
+
+def test_bucket_bounds():
+    hist = Histogram(sub_bucket_bits=3)
+    for value in [0, 1, 15, 16, 17, 100, 12345, 10**12]:
+        lower, upper = hist.bounds_of(hist.index_of(value))
+        assert lower <= value < upper
+        # relative error is bounded by the sub-bucket precision
+        assert upper - lower <= max(1, lower // 8)
+
+
+def test_bucket_index_continuous():
+    hist = Histogram(sub_bucket_bits=2)
+    indexes = [hist.index_of(v) for v in range(1000)]
+    assert indexes == sorted(indexes)
+    assert set(indexes) == set(range(indexes[-1] + 1))
+
+
+@pytest.mark.parametrize("pct, expected", [(50, 50), (90, 90), (100, 100)])
+def test_percentile(pct, expected):
+    hist = Histogram(sub_bucket_bits=5)
+    for v in range(1, 101):
+        hist.record(v)
+    assert hist.count == 100
+    assert hist.min == 1 and hist.max == 100
+    assert abs(hist.percentile(pct) - expected) <= expected / 32 + 1
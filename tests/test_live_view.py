@@ -0,0 +1,63 @@
+import io
+
+from rich.console import Console
+
+from trio_vis.desc_tree import DescTree
+from trio_vis.live_view import LiveTreeView
+from trio_vis.trio_fake import (FakeTrioTask, build_tree_from_json,
+                                generate_fake_attr)
+
+
+def render_text(view: LiveTreeView) -> str:
+    console = Console(width=80, record=True, file=io.StringIO())
+    console.print(view.render())
+    return console.export_text()
+
+
+def build_view():
+    tmpl = {
+        "name": "main",
+        "nurseries": [
+            {
+                "name": "n1",
+                "tasks": [{"name": f"job{i}", "nurseries": []} for i in range(3)]
+                + [{"name": "other", "nurseries": []}],
+            }
+        ],
+    }
+    root = build_tree_from_json(tmpl)
+    # fake tasks need unique names, give them the same coroutine
+    for i in range(3):
+        task = root.get_task_node(f"job{i}")
+        task.coro = generate_fake_attr(["cr_code", "co_name"], "job")
+    view = LiveTreeView()
+    view.tree = DescTree.build(root)
+    return view, root
+
+
+def test_collapse_siblings():
+    view, _ = build_view()
+    text = render_text(view)
+    assert "job x 3" in text
+    assert "other-0" in text
+
+
+def test_only_changed_subtrees_rendered():
+    view, root = build_view()
+    tree = view.tree
+    view.render()
+    nursery_node = tree.root.children[0]
+    other_node = nursery_node.children[-1]
+    cached_other = view._cache[other_node][1]
+    cached_root = view._cache[tree.root][1]
+
+    n1 = root.get_nursery_node("n1")
+    t = FakeTrioTask(name="late")
+    n1._add_task(t)
+    tree.insert_task(t)
+    view.render()
+
+    # the changed path is rendered again, the untouched sibling is reused
+    assert view._cache[tree.root][1] is not cached_root
+    assert view._cache[other_node][1] is cached_other
+    assert "late-0" in render_text(view)
@@ -0,0 +1,90 @@
+import io
+import json
+
+import pytest
+
+from trio_vis.binary_log import BinarySink, binary_to_sc_vis
+from trio_vis.log_index import LogIndex, LogIndexBuilder, index_filename_of
+from trio_vis.log_sink import ndjson_to_sc_vis, write_sc_vis_log
+from trio_vis.query import subtree_events, window_events, write_subtree
+
+from .test_query import run_events
+
+CONFIG = {"makeDirectScopeTransparent": True}
+
+
+def timed_events():
+    events = run_events()
+    for i, event in enumerate(events):
+        event["time"] = i
+        if event["parent"] is None:
+            del event["parent"]
+    return events
+
+
+def write_log(tmp_path, how: str) -> str:
+    filename = str(tmp_path / "sc-logs.json")
+    events = timed_events()
+    if how == "memory":
+        write_sc_vis_log(filename, CONFIG, events, index=True)
+    elif how == "ndjson":
+        src = tmp_path / "sc-logs.ndjson"
+        src.write_text("".join(json.dumps(e) + "\n" for e in events))
+        ndjson_to_sc_vis(str(src), filename, CONFIG, index=True)
+    else:
+        sink = BinarySink(str(tmp_path / "sc-logs.bin"))
+        for event in events:
+            sink.emit(event)
+        sink.close(CONFIG)
+        binary_to_sc_vis(str(tmp_path / "sc-logs.bin"), filename, index=True)
+    return filename
+
+
+@pytest.mark.parametrize("how", ["memory", "ndjson", "binary"])
+def test_scope_offsets(tmp_path, how):
+    filename = write_log(tmp_path, how)
+    index = LogIndex.load(filename)
+    assert index is not None
+
+    names = {e["name"] for e in timed_events()}
+    assert set(index.scopes) == names
+    for name, (created, exited) in index.scopes.items():
+        first, last = next(index.read(created)), next(index.read(exited))
+        assert (first["name"], first["desc"]) == (name, "created")
+        assert (last["name"], last["desc"]) == (name, "exited")
+
+    # the log is still a valid sc-vis log
+    with open(filename) as f:
+        assert json.load(f)["runRecords"] == timed_events()
+
+
+def test_index_subtree(tmp_path):
+    filename = write_log(tmp_path, "memory")
+    events = list(subtree_events(filename, "job-1"))
+    # only the span of job-1 is read
+    assert len(events) < len(timed_events())
+
+    indexed, scanned = io.StringIO(), io.StringIO()
+    write_subtree("job-1", events, indexed)
+    write_subtree("job-1", timed_events(), scanned)
+    assert indexed.getvalue() == scanned.getvalue()
+    assert list(subtree_events(filename, "missing-0")) == []
+
+
+def test_index_window(tmp_path):
+    filename = write_log(tmp_path, "memory")
+    builder = LogIndexBuilder(interval_ns=10)
+    for offset, event in enumerate(timed_events()):
+        builder.add(event, offset)
+    assert [ts for ts, _ in builder.times] == [0, 10, 30, 40, 50, 90, 100]
+
+    expected = [e for e in timed_events() if 20 <= e["ts"] <= 45]
+    assert list(window_events(filename, 20, 45)) == expected
+
+
+def test_no_index(tmp_path):
+    filename = str(tmp_path / "sc-logs.json")
+    write_sc_vis_log(filename, CONFIG, timed_events())
+    assert LogIndex.load(filename) is None
+    assert not (tmp_path / index_filename_of("sc-logs.json")).exists()
+    assert len(list(subtree_events(filename, "job-1"))) == len(timed_events())
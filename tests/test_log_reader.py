@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from trio_vis.log_reader import SCVisLogReader, iter_log_events, log_format
+from trio_vis.log_sink import ndjson_to_sc_vis, write_sc_vis_log
+
+CONFIG = {"makeDirectScopeTransparent": True, "scopeDurations": {"byName": {}}}
+
+EVENTS = [
+    {"time": i, "desc": "created", "name": f"t-{i}", "type": "task", "ts": 10**i}
+    for i in range(20)
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 1 << 16])
+def test_stream_sc_vis_log(tmp_path, chunk_size):
+    filename = str(tmp_path / "sc-logs.json")
+    write_sc_vis_log(filename, CONFIG, EVENTS)
+
+    reader = SCVisLogReader(filename, chunk_size=chunk_size)
+    assert list(reader) == EVENTS
+    assert reader.config == CONFIG
+
+
+def test_stream_config_after_events(tmp_path):
+    # the layout written by the binary log converter
+    filename = str(tmp_path / "sc-logs.json")
+    with open(filename, "w") as f:
+        f.write('{"runRecords": [\n')
+        f.write(",\n".join(json.dumps(e) for e in EVENTS))
+        f.write(f'\n],\n"config": {json.dumps(CONFIG)}}}\n')
+
+    reader = SCVisLogReader(filename, chunk_size=5)
+    assert list(reader) == EVENTS
+    assert reader.config == CONFIG
+
+
+def test_stream_empty_log(tmp_path):
+    filename = str(tmp_path / "sc-logs.json")
+    write_sc_vis_log(filename, CONFIG, [])
+    assert list(SCVisLogReader(filename, chunk_size=2)) == []
+
+
+def test_truncated_log(tmp_path):
+    filename = str(tmp_path / "sc-logs.json")
+    write_sc_vis_log(filename, CONFIG, EVENTS)
+    with open(filename, "r+") as f:
+        f.truncate(len(f.read()) // 2)
+    with pytest.raises(ValueError):
+        list(SCVisLogReader(filename))
+
+
+def test_log_format(tmp_path):
+    ndjson = tmp_path / "events.log"
+    ndjson.write_text("".join(json.dumps(e) + "\n" for e in EVENTS))
+    sc_vis = str(tmp_path / "sc-logs.json")
+    ndjson_to_sc_vis(str(ndjson), sc_vis, CONFIG)
+
+    assert log_format(str(ndjson)) == "ndjson"
+    assert log_format(sc_vis) == "sc-vis"
+    assert log_format(str(tmp_path / "sc-logs.bin")) == "binary"
+    assert list(iter_log_events(str(ndjson))) == EVENTS
+    assert list(iter_log_events(sc_vis)) == EVENTS
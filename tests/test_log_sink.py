@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from trio_vis.config import VisConfig
+from trio_vis.log_sink import (MemorySink, NDJSONSink, RingBufferSink,
+                               ndjson_to_sc_vis)
+
+CONFIG = {"makeDirectScopeTransparent": True}
+
+
+def events(n: int):
+    return [
+        {"time": i, "desc": "created", "name": f"t-{i}", "type": "task"}
+        for i in range(n)
+    ]
+
+
+def test_memory_sink(tmp_path):
+    log_file = tmp_path / "sc-logs.json"
+    sink = MemorySink(str(log_file))
+    for e in events(3):
+        sink.emit(e)
+    sink.close(CONFIG)
+
+    logs = json.loads(log_file.read_text())
+    assert logs == {"config": CONFIG, "runRecords": events(3)}
+
+
+def test_ndjson_sink_flush_in_batches(tmp_path):
+    log_file = tmp_path / "sc-logs.json"
+    sink = NDJSONSink(str(log_file), batch_size=2)
+    for e in events(5):
+        sink.emit(e)
+
+    # only full batches are written before closing
+    lines = (tmp_path / "sc-logs.ndjson").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == events(4)
+    assert len(sink.batch) == 1
+
+    sink.close(CONFIG)
+    lines = (tmp_path / "sc-logs.ndjson").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == events(5)
+
+    logs = json.loads(log_file.read_text())
+    assert logs == {"config": CONFIG, "runRecords": events(5)}
+
+
+def test_ndjson_to_sc_vis_empty(tmp_path):
+    src = tmp_path / "empty.ndjson"
+    src.write_text("")
+    dst = tmp_path / "sc-logs.json"
+    ndjson_to_sc_vis(str(src), str(dst), CONFIG)
+    assert json.loads(dst.read_text()) == {"config": CONFIG, "runRecords": []}
+
+
+def lifetimes(n: int):
+    """Scope t-i lives from ts=10*i to ts=10*i+15"""
+    out = []
+    # fmt: off
+    for i in range(n):
+        out.append({"time": 2 * i, "desc": "created", "name": f"t-{i}", "type": "task", "ts": 10 * i})
+        out.append({"time": 2 * i + 1, "desc": "exited", "name": f"t-{i - 1}", "type": "task", "ts": 10 * i + 5})
+    # fmt: on
+    return out
+
+
+def test_ring_buffer_keeps_latest(tmp_path):
+    sink = RingBufferSink(str(tmp_path / "sc-logs.json"), capacity=3)
+    history = lifetimes(4)
+    for e in history:
+        sink.emit(e)
+
+    dumped, left_out = sink.snapshot()
+    # t-1, t-2 were created before the window, but exit within it
+    assert dumped == [history[2], history[4]] + history[-3:]
+    assert left_out == 5
+
+
+def test_ring_buffer_max_age(tmp_path):
+    sink = RingBufferSink(str(tmp_path / "sc-logs.json"), capacity=100)
+    history = lifetimes(10)
+    for e in history:
+        sink.emit(e)
+
+    dumped, left_out = sink.snapshot(max_age_ns=12)
+    assert dumped == [history[14], history[16]] + history[-3:]
+    assert left_out == 17
+    # the sink itself is untouched
+    assert sink.live == {}
+
+
+def test_ring_buffer_dump(tmp_path):
+    log_file = tmp_path / "sc-logs.json"
+    sink = RingBufferSink(str(log_file), capacity=2)
+    for e in events(3):
+        sink.emit(e)
+    sink.close(CONFIG)
+    assert not log_file.exists()
+
+    assert sink.dump(CONFIG) == str(log_file)
+    logs = json.loads(log_file.read_text())
+    assert logs["runRecords"] == events(3)
+    assert logs["config"]["flightRecorder"] == {
+        "capacity": 2,
+        "recorded": 3,
+        "leftOut": 1,
+    }
+
+
+def test_flight_recorder_config():
+    with pytest.raises(ValidationError):
+        VisConfig(log_in_background=True, flight_recorder=True)
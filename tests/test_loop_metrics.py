@@ -0,0 +1,30 @@
+import json
+
+from trio_vis.config import VisConfig
+from trio_vis.loop_metrics import LoopMetrics
+from trio_vis.trio_fake import FakeTrioTask
+
+
+def test_loop_metrics(mocker, tmp_path):
+    clock = mocker.patch("trio_vis.loop_metrics.perf_counter_ns")
+    metrics = LoopMetrics(config=VisConfig(log_filename=str(tmp_path / "log.json")))
+    t0 = FakeTrioTask(name="t0")
+
+    for now, hook, args in [
+        (0, metrics.before_run, ()),
+        (10, metrics.task_scheduled, (t0,)),
+        (40, metrics.before_task_step, (t0,)),
+        (100, metrics.after_task_step, (t0,)),
+        (100, metrics.before_io_wait, (1.0,)),
+        (1100, metrics.after_io_wait, (1.0,)),
+        (1200, metrics.after_run, ()),
+    ]:
+        clock.return_value = now
+        hook(*args)
+
+    summary = json.loads((tmp_path / "log.metrics.json").read_text())
+    assert summary["runNs"] == 1200
+    assert summary["ioWaitNs"] == 1000
+    assert summary["taskRunNs"] == 60
+    assert summary["schedLatency"]["count"] == 1
+    assert summary["schedLatency"]["max"] == 30
@@ -0,0 +1,65 @@
+from trio_vis.overhead import OverheadCounters, TimedLogger
+
+
+def test_timed_counts_calls():
+    counters = OverheadCounters()
+    double = counters.timed("double", lambda x: 2 * x)
+    assert [double(i) for i in range(3)] == [0, 2, 4]
+    assert counters.calls["double"] == 3
+    assert counters.ns["double"] >= 0
+
+
+def test_timed_counts_raising_calls():
+    counters = OverheadCounters()
+
+    def fail():
+        raise KeyError()
+
+    timed_fail = counters.timed("fail", fail)
+    try:
+        timed_fail()
+    except KeyError:
+        pass
+    assert counters.calls["fail"] == 1
+
+
+def test_summary_only_adds_top_level():
+    counters = OverheadCounters()
+    counters.add("task_spawned", 300, calls=3)
+    counters.add("logging", 200, calls=3)
+    counters.start_ns, counters.end_ns = 1000, 2000
+
+    summary = counters.summary(["task_spawned", "task_exited"])
+    assert summary["monitorNs"] == 300
+    assert summary["elapsedNs"] == 1000
+    assert summary["share"] == 0.3
+    assert summary["callbacks"]["logging"] == {"calls": 3, "ns": 200}
+
+
+def test_run_spans_the_callbacks_starting_and_ending_it():
+    counters = OverheadCounters()
+    start = counters.timed("start", lambda: counters.run_started(), True)
+    end = counters.timed("end", lambda: counters.run_ended(), True)
+    start()
+    end()
+
+    summary = counters.summary(["start", "end"])
+    assert 0 < summary["monitorNs"] <= summary["elapsedNs"]
+
+
+def test_timed_logger_forwards():
+    class Logger:
+        def log_start(self, child, parent):
+            return child
+
+        log_exit = log_slow_step = log_start
+
+        def dump(self):
+            return "dumped"
+
+    counters = OverheadCounters()
+    logger = TimedLogger(Logger(), counters)
+    assert logger.log_start(child=1, parent=None) == 1
+    logger.log_exit(child=1, parent=None)
+    assert logger.dump() == "dumped"
+    assert counters.calls["logging"] == 2
@@ -0,0 +1,179 @@
+import io
+import json
+
+import pytest
+
+from trio_vis.query import (Concurrency, CriticalPath, FanOut, LongestScopes,
+                            Outcomes, main, run_query, write_subtree)
+
+
+# fmt: off
+def task_events(name, parent, start, end, **outcome):
+    scope = f"{name}__TRIO_VIS_Tscope"
+    created = [
+        {"time": 0, "desc": "created", "name": scope, "type": "scope", "parent": parent, "ts": start},
+        {"time": 0, "desc": "created", "name": name, "type": "task", "parent": scope, "ts": start},
+    ]
+    exited = [
+        {"time": 0, "desc": "exited", "name": name, "type": "task", "parent": scope, "ts": end, **outcome},
+        {"time": 0, "desc": "exited", "name": scope, "type": "scope", "parent": parent, "ts": end},
+    ]
+    return created, exited
+
+
+def nursery_events(name, parent_task, start, end):
+    scope = f"{parent_task}__TRIO_VIS_Tscope"
+    return (
+        [{"time": 0, "desc": "created", "name": name, "type": "scope", "parent": scope, "ts": start}],
+        [{"time": 0, "desc": "exited", "name": name, "type": "scope", "parent": scope, "ts": end}],
+    )
+
+
+def run_events():
+    """main-0 -> nursery-0 -> job-0..2, job-1 -> nursery-1 -> leaf-0..1"""
+    main_c, main_e = task_events("main-0", None, 0, 100)
+    n0_c, n0_e = nursery_events("nursery-0", "main-0", 1, 95)
+    jobs = [task_events(f"job-{i}", "nursery-0", 2 + i, 10 + 40 * i) for i in range(3)]
+    n1_c, n1_e = nursery_events("nursery-1", "job-1", 5, 45)
+    leaf0 = task_events("leaf-0", "nursery-1", 6, 30, outcome="error", exception="KeyError")
+    leaf1 = task_events("leaf-1", "nursery-1", 7, 40, outcome="cancelled")
+
+    return (
+        main_c + n0_c
+        + jobs[0][0] + jobs[1][0] + jobs[2][0]
+        + n1_c + leaf0[0] + leaf1[0]
+        + jobs[0][1]
+        + leaf0[1] + leaf1[1] + n1_e
+        + jobs[1][1] + jobs[2][1]
+        + n0_e + main_e
+    )
+# fmt: on
+
+
+def test_longest_scopes():
+    query = run_query(LongestScopes(n=3), run_events())
+    assert [(r["name"], r["durationNs"]) for r in query.result()] == [
+        ("main-0", 100),
+        ("nursery-0", 94),
+        ("job-2", 86),
+    ]
+
+
+def test_concurrency():
+    query = run_query(Concurrency(bucket_ns=20), run_events())
+    result = query.result()
+    # main, 3 jobs & 2 leaves
+    assert result["peak"] == 6
+    assert result["peakNs"] == 7
+    assert result["series"] == [
+        [0, 6],
+        [20, 5],
+        [40, 4],
+        [60, 2],
+        [80, 2],
+        [100, 1],
+    ]
+
+
+def test_fan_out():
+    query = run_query(FanOut(n=2), run_events())
+    assert query.result() == [
+        {"name": "nursery-0", "task": "main-0", "spawned": 3, "maxConcurrent": 3},
+        {"name": "nursery-1", "task": "job-1", "spawned": 2, "maxConcurrent": 2},
+    ]
+    # only live nurseries are kept
+    assert query.nurseries == {}
+
+
+def test_subtree():
+    out = io.StringIO()
+    assert write_subtree("job-1", run_events(), out) == 14
+    names = {json.loads(line)["name"] for line in out.getvalue().splitlines()}
+    assert names == {
+        "job-1",
+        "job-1__TRIO_VIS_Tscope",
+        "nursery-1",
+        "leaf-0",
+        "leaf-0__TRIO_VIS_Tscope",
+        "leaf-1",
+        "leaf-1__TRIO_VIS_Tscope",
+    }
+
+
+def test_outcomes():
+    query = run_query(Outcomes(), run_events())
+    assert query.result() == {
+        "nursery-1": {
+            "cancelled": 1,
+            "errored": 1,
+            "firstErrorNs": 30,
+            "firstError": "KeyError",
+        }
+    }
+    assert query.nursery_of == {}
+
+
+def test_critical_path():
+    query = run_query(CriticalPath(), run_events())
+    result = query.result()
+
+    assert result["root"] == [
+        {"name": "main-0", "type": "task", "startNs": 0, "endNs": 100},
+        {"name": "nursery-0", "type": "nursery", "startNs": 1, "endNs": 90},
+        {"name": "job-2", "type": "task", "startNs": 4, "endNs": 90},
+    ]
+    nursery_0, nursery_1 = result["nurseries"]
+    assert nursery_0["durationNs"] == 94
+    assert [hop["name"] for hop in nursery_0["criticalPath"]] == ["job-2"]
+    assert nursery_0["slackNs"] == {"job-2": 0, "job-1": 40, "job-0": 80}
+
+    # job-1 waited for nursery-1, bounded by its slowest leaf
+    assert nursery_1["task"] == "job-1"
+    assert [hop["name"] for hop in nursery_1["criticalPath"]] == ["leaf-1"]
+    assert nursery_1["slackNs"] == {"leaf-1": 0, "leaf-0": 10}
+    # only live scopes are kept
+    assert query.tasks == query.nurseries == query.nursery_of == {}
+
+
+def test_critical_path_single_child():
+    # the nursery exit is logged after its only child's, at the next step of main
+    main_c, main_e = task_events("main-0", None, 0, 100)
+    n0_c, n0_e = nursery_events("nursery-0", "main-0", 1, 60)
+    job_c, job_e = task_events("job-0", "nursery-0", 2, 50)
+    query = run_query(CriticalPath(), main_c + n0_c + job_c + job_e + n0_e + main_e)
+    result = query.result()
+
+    assert result["root"][1]["endNs"] == 50
+    assert result["nurseries"][0]["slackNs"] == {"job-0": 0}
+
+
+def test_critical_path_truncated():
+    # the log ends while job-2 is still running
+    query = run_query(CriticalPath(n=1), run_events()[:23])
+    result = query.result()
+
+    assert result["root"] == [
+        {"name": "main-0", "type": "task", "startNs": 0, "endNs": None}
+    ]
+    assert [n["name"] for n in result["nurseries"]] == ["nursery-1"]
+
+
+def test_query_cli(tmp_path, capsys):
+    filename = tmp_path / "sc-logs.ndjson"
+    filename.write_text("".join(json.dumps(e) + "\n" for e in run_events()))
+
+    with pytest.raises(SystemExit):
+        main([str(filename)])
+    capsys.readouterr()
+
+    main([str(filename), "--json", "fanout", "-n", "1"])
+    assert json.loads(capsys.readouterr().out)[0]["name"] == "nursery-0"
+
+    main([str(filename), "longest", "-n", "1"])
+    assert capsys.readouterr().out == "       0.000 ms  main-0 (task)\n"
+
+    main([str(filename), "critical-path", "-n", "1"])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "critical path:"
+    assert [line.split()[-2] for line in lines[1:4]] == ["main-0", "nursery-0", "job-2"]
+    assert lines[5] == "nursery-0 (in main-0) 0.000 ms: job-2"
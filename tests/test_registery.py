@@ -1,3 +1,5 @@
+import gc
+
 import pytest
 
 from trio_vis.registry import *
@@ -43,3 +45,31 @@ def test_registry_remove(registry: SCRegistry):
     assert True == registry.remove(t0)
     with pytest.raises(RuntimeError):
         registry.remove(t0)
+
+
+def test_weak_registry_drop_collected():
+    registry = SCRegistry(weak=True)
+    t0 = FakeTrioTask(name="func1")
+    assert "func1-0" == registry.get_name(t0)
+    assert len(registry.registered) == 1
+
+    del t0
+    gc.collect()
+    assert len(registry.registered) == 0
+
+
+def test_registry_ids(registry: SCRegistry):
+    t0 = FakeTrioTask(name="func1")
+    n0 = FakeTrioNursery(name="n0")
+    t0_info = registry.get_info(t0)
+    n0_info = registry.get_info(n0)
+
+    assert (t0_info.id, n0_info.id) == (0, 1)
+    assert t0_info.scope_name == "func1-0__TRIO_VIS_Tscope"
+    assert len({t0_info.ref, t0_info.scope_ref, n0_info.ref}) == 3
+    with pytest.raises(RuntimeError):
+        n0_info.scope_ref
+
+    # ids are never reused
+    registry.remove(t0)
+    assert registry.get_info(FakeTrioTask(name="func2")).id == 2
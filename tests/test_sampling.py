@@ -0,0 +1,40 @@
+import pytest
+
+from trio_vis.sampling import SamplingPolicy
+from trio_vis.trio_fake import FakeTrioTask
+
+
+def decisions(policy: SamplingPolicy, n: int):
+    return [policy.should_trace(FakeTrioTask(name="job")) for _ in range(n)]
+
+
+def test_hash_sampling_is_deterministic():
+    first = decisions(SamplingPolicy(mode="hash", rate=0.3), 1000)
+    assert first == decisions(SamplingPolicy(mode="hash", rate=0.3), 1000)
+    assert 200 < sum(first) < 400
+
+
+def test_random_sampling():
+    policy = SamplingPolicy(mode="random", rate=0.5, seed=7)
+    picked = decisions(policy, 1000)
+    assert picked == decisions(SamplingPolicy(mode="random", rate=0.5, seed=7), 1000)
+    assert policy.summary()["seen"] == {"job": 1000}
+    assert policy.summary()["traced"] == {"job": sum(picked)}
+    assert decisions(SamplingPolicy(mode="random", rate=0.0), 10) == [False] * 10
+
+
+def test_rate_limit_per_name(mocker):
+    clock = mocker.patch("trio_vis.slow_step.perf_counter_ns")
+    clock.return_value = 0
+    policy = SamplingPolicy(max_per_sec_per_name=2)
+
+    assert decisions(policy, 3) == [True, True, False]
+    assert policy.should_trace(FakeTrioTask(name="other"))
+    clock.return_value = 1_000_000_000
+    assert decisions(policy, 3) == [True, True, False]
+    assert policy.summary()["ratios"] == {"job": 4 / 6, "other": 1.0}
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        SamplingPolicy(mode="random", rate=1.5)
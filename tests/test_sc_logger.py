@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+from trio_vis.log_sink import MemorySink, RingBufferSink
+from trio_vis.registry import SCRegistry
+from trio_vis.sc_logger import NameTable, SCLogger, ScopeDurations
+from trio_vis.trio_fake import FakeTrioTask
+
+
+def test_log_root_task(tmp_path, mocker, fake_tree: FakeTrioTask):
+    mocker.patch("trio_vis.sc_logger.perf_counter_ns", side_effect=[5, 5, 10, 20, 30])
+    log_file = tmp_path / "sc-logs.json"
+    registry = SCRegistry()
+    sink = MemorySink(str(log_file))
+    logger = SCLogger(registry, log_filename=str(log_file), sink=sink)
+
+    logger.log_start(child=fake_tree, parent=None)
+    logger.log_exit(child=fake_tree, parent=None)
+    logger._write_log()
+
+    log = json.loads(log_file.read_text())
+    assert log["config"]["scopeDurations"] == {
+        "byName": {"t1": {"count": 1, "totalNs": 10, "maxNs": 10}},
+        "slowest": [{"name": "t1-0", "durationNs": 10}],
+    }
+    assert log["runRecords"] == [
+        {
+            "time": 0,
+            "desc": "created",
+            "name": "t1-0__TRIO_VIS_Tscope",
+            "type": "scope",
+            "ts": 0,
+        },
+        {
+            "time": 1,
+            "desc": "created",
+            "name": "t1-0",
+            "type": "task",
+            "parent": "t1-0__TRIO_VIS_Tscope",
+            "ts": 5,
+        },
+        {
+            "time": 2,
+            "desc": "exited",
+            "name": "t1-0",
+            "type": "task",
+            "parent": "t1-0__TRIO_VIS_Tscope",
+            "ts": 15,
+        },
+        {
+            "time": 3,
+            "desc": "exited",
+            "name": "t1-0__TRIO_VIS_Tscope",
+            "type": "task",
+            "ts": 25,
+        },
+    ]
+    # names are only kept until their scopes exit
+    assert logger.names.names == {}
+
+
+def test_name_table_encode():
+    registry = SCRegistry()
+    names = NameTable()
+    info = registry.get_info(FakeTrioTask(name="t0"))
+    names.add(info)
+
+    event = names.encode(
+        names.raw_event(3, "created", info.ref, "task", info.scope_ref, None, 120)
+    )
+    assert event == {
+        "time": 3,
+        "desc": "created",
+        "name": "t0-0",
+        "type": "task",
+        "parent": "t0-0__TRIO_VIS_Tscope",
+        "ts": 120,
+    }
+
+
+def test_background_names_across_reattach(tmp_path):
+    logger = SCLogger(
+        SCRegistry(), log_filename=str(tmp_path / "sc-logs.json"), background=True
+    )
+    # a writer lagging behind the Trio thread
+    queued = []
+    logger.writer.put = queued.append
+    task = FakeTrioTask(name="t0")
+    for _ in range(2):
+        logger.log_start(child=task, parent=None, extra={"attached": True})
+        logger.log_exit(child=task, parent=None, extra={"detached": True})
+
+    events = [logger.names.encode(event) for event in queued]
+    scope = "t0-0__TRIO_VIS_Tscope"
+    assert [e["name"] for e in events] == [scope, "t0-0", "t0-0", scope] * 2
+    logger.writer.stop()
+
+
+def test_scope_durations():
+    durations = ScopeDurations(nm_slowest=2)
+    for ref, name, start, end in [
+        (2, "worker-0", 0, 100),
+        (3, "worker-0__TRIO_VIS_Tscope", 0, 100),
+        (4, "worker-1", 10, 310),
+        (6, "nursery-0", 5, 400),
+    ]:
+        durations.start(ref, start)
+        durations.stop(ref, name, end)
+
+    assert durations.summary() == {
+        "byName": {
+            "worker": {"count": 2, "totalNs": 400, "maxNs": 300},
+            "nursery": {"count": 1, "totalNs": 395, "maxNs": 395},
+        },
+        "slowest": [
+            {"name": "nursery-0", "durationNs": 395},
+            {"name": "worker-1", "durationNs": 300},
+        ],
+    }
+
+
+def test_flight_recorder_dump(tmp_path, fake_tree: FakeTrioTask):
+    log_file = tmp_path / "sc-logs.json"
+    logger = SCLogger(
+        SCRegistry(),
+        log_filename=str(log_file),
+        sink=RingBufferSink(str(log_file), capacity=3),
+    )
+    logger.log_start(child=fake_tree, parent=None)
+    logger.log_exit(child=fake_tree, parent=None)
+    logger._write_log()
+    assert not log_file.exists()
+
+    logger.dump()
+    records = json.loads(log_file.read_text())["runRecords"]
+    assert [e["time"] for e in records] == [0, 1, 2, 3]
+
+
+def test_dump_without_flight_recorder(tmp_path):
+    log_file = str(tmp_path / "sc-logs.json")
+    logger = SCLogger(SCRegistry(), log_filename=log_file)
+    with pytest.raises(RuntimeError):
+        logger.dump()
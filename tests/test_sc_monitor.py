@@ -1,5 +1,14 @@
+import gc
+import signal
+import threading
+import warnings
+import weakref
 from unittest.mock import Mock, call
 
+import pytest
+import trio
+import trio.testing
+
 from trio_vis.config import VisConfig
 from trio_vis.sc_monitor import SC_Monitor
 from trio_vis.trio_fake import (FakeTrioNursery, FakeTrioTask,
@@ -12,10 +21,13 @@ class fake_logger:
     def __init__(self):
         self.log_start = Mock()
         self.log_exit = Mock()
+        self.log_slow_step = Mock()
+        self.add_config_source = Mock()
 
     def clear_cache(self):
         self.log_start.reset_mock()
         self.log_exit.reset_mock()
+        self.log_slow_step.reset_mock()
 
 
 def test_root_spawned():
@@ -176,3 +188,507 @@ def test_root_task_exit():
 
     logger.log_exit.assert_called_once_with(child=t1, parent=None)
     assert sc_mon.root_exited == True
+
+
+def test_closed_nursery_exit_on_new_nursery():
+    start_state = {
+        "name": "t1",
+        "nurseries": [
+            {
+                "name": "n1",
+                "tasks": [
+                    {
+                        "name": "t2",
+                        "nurseries": [],
+                    },
+                ],
+            }
+        ],
+    }
+    logger = fake_logger()
+    task_tree = build_tree_from_json(start_state)
+    sc_mon = SC_Monitor.from_tree(
+        root_task=task_tree,
+        sc_logger=Mock(return_value=logger),
+    )
+    logger.clear_cache()
+
+    t2 = task_tree.get_task_node("t2")
+    n1 = task_tree.get_nursery_node("n1")
+    task_tree.tree_remove("t2")
+    sc_mon.task_exited(t2)
+    task_tree.tree_remove("n1")
+
+    # the task opens another nursery after the first one closed
+    n2 = FakeTrioNursery(name="n2")
+    t3 = FakeTrioTask(name="t3")
+    n2._add_task(t3)
+    task_tree._add_nursery(n2)
+    sc_mon.task_spawned(t3)
+
+    logger.log_exit.assert_called_with(child=n1, parent=task_tree)
+    required_logs = [call(child=n2, parent=task_tree), call(child=t3, parent=n2)]
+    logger.log_start.assert_has_calls(required_logs)
+    assert sc_mon.desc_tree.ref_2node.get(n1, None) is None
+
+
+@pytest.mark.parametrize("time_task_steps", [False, True])
+def test_closed_nursery_exit_on_next_step(time_task_steps):
+    logger = fake_logger()
+    exited_at = {}
+    logger.log_exit.side_effect = lambda child, **_: exited_at.setdefault(
+        child, trio.current_time()
+    )
+    sc_mon = SC_Monitor(
+        config=VisConfig(print_task_tree=False, time_task_steps=time_task_steps),
+        sc_logger=Mock(return_value=logger),
+    )
+    nurseries = []
+    steps = []
+    close_emptied = sc_mon.close_emptied
+    sc_mon.close_emptied = lambda task: steps.append(task) or close_emptied(task)
+
+    async def child():
+        await trio.sleep(1)
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            nurseries.append(nursery)
+            nursery.start_soon(child)
+        # the nursery is closed long before main opens another one or exits
+        await trio.sleep(10)
+        await trio.sleep(0)
+
+    trio.run(
+        main, instruments=[sc_mon], clock=trio.testing.MockClock(autojump_threshold=0)
+    )
+
+    assert exited_at[nurseries[0]] == 1
+    assert exited_at[sc_mon.root_task] == 11
+    assert len(sc_mon.emptied) == 0
+    # the step hook is only there until the nursery is closed: the last step
+    # of the child, then the one of main closing it
+    assert hasattr(sc_mon, "after_task_step") is time_task_steps
+    assert [task.name.rpartition(".")[2] for task in steps] == ["child", "main"]
+
+
+def test_task_exit_with_step_stats():
+    start_state = {
+        "name": "t1",
+        "nurseries": [
+            {
+                "name": "n1",
+                "tasks": [
+                    {
+                        "name": "t2",
+                        "nurseries": [],
+                    },
+                ],
+            }
+        ],
+    }
+    logger = fake_logger()
+    task_tree = build_tree_from_json(start_state)
+    sc_mon = SC_Monitor.from_tree(
+        root_task=task_tree,
+        config=VisConfig(print_task_tree=False, time_task_steps=True),
+        sc_logger=Mock(return_value=logger),
+    )
+    logger.clear_cache()
+
+    t2 = task_tree.get_task_node("t2")
+    n1 = task_tree.get_nursery_node("n1")
+    sc_mon.before_task_step(t2)
+    sc_mon.after_task_step(t2)
+
+    task_tree.tree_remove("t2")
+    sc_mon.task_exited(t2)
+    _, kwargs = logger.log_exit.call_args
+    assert kwargs["child"] is t2 and kwargs["parent"] is n1
+    assert kwargs["extra"]["steps"] == 1
+    assert sc_mon.step_timer.stats == {}
+
+
+def test_slow_step(mocker):
+    start_state = {
+        "name": "t1",
+        "nurseries": [
+            {
+                "name": "n1",
+                "tasks": [
+                    {
+                        "name": "t2",
+                        "nurseries": [],
+                    },
+                ],
+            }
+        ],
+    }
+    clock = mocker.patch("trio_vis.step_timer.perf_counter_ns")
+    logger = fake_logger()
+    task_tree = build_tree_from_json(start_state)
+    sc_mon = SC_Monitor.from_tree(
+        root_task=task_tree,
+        config=VisConfig(print_task_tree=False, slow_step_threshold=0.001),
+        sc_logger=Mock(return_value=logger),
+    )
+    logger.clear_cache()
+
+    t2 = task_tree.get_task_node("t2")
+    for start, end in [(0, 10_000), (20_000, 5_020_000)]:
+        clock.return_value = start
+        sc_mon.before_task_step(t2)
+        clock.return_value = end
+        sc_mon.after_task_step(t2)
+
+    logger.log_slow_step.assert_called_once()
+    args, kwargs = logger.log_slow_step.call_args
+    assert args == (t2,)
+    assert kwargs["extra"]["durationNs"] == 5_000_000
+    assert len(kwargs["extra"]["path"]) == 3
+    assert kwargs["extra"]["suppressed"] == 0
+
+    # step stats are only attached when asked for
+    task_tree.tree_remove("t2")
+    sc_mon.task_exited(t2)
+    assert "extra" not in logger.log_exit.call_args[1]
+
+
+def test_skip_unsampled_subtree(fake_tree: FakeTrioTask):
+    logger = fake_logger()
+    sc_mon = SC_Monitor.from_tree(
+        root_task=fake_tree,
+        config=VisConfig(print_task_tree=False, sample_mode="hash", sample_rate=0.0),
+        sc_logger=Mock(return_value=logger),
+    )
+    logger.clear_cache()
+
+    # a child of the root task is not sampled, neither are its descendants
+    n1 = fake_tree.get_nursery_node("n1")
+    t4 = FakeTrioTask(name="t4")
+    n1._add_task(t4)
+    sc_mon.task_spawned(t4)
+    n2 = FakeTrioNursery(name="n2")
+    t5 = FakeTrioTask(name="t5")
+    t4._add_nursery(n2)
+    n2._add_task(t5)
+    sc_mon.task_spawned(t5)
+
+    logger.log_start.assert_not_called()
+    assert t4 not in sc_mon.desc_tree.ref_2node
+    assert set(sc_mon.unsampled) == {t4, t5}
+
+    sc_mon.task_exited(t5)
+    sc_mon.task_exited(t4)
+    logger.log_exit.assert_not_called()
+    assert len(sc_mon.unsampled) == 0
+
+    # a task missing its exit event isn't kept alive
+    t6 = FakeTrioTask(name="t6")
+    n1._add_task(t6)
+    sc_mon.task_spawned(t6)
+    assert len(sc_mon.unsampled) == 1
+    fake_tree.tree_remove("t6")
+    del t6
+    gc.collect()
+    assert len(sc_mon.unsampled) == 0
+
+    sources = [c.args[0]() for c in logger.add_config_source.call_args_list]
+    assert any("sampling" in source for source in sources)
+
+
+def test_weak_registry_collected_nursery(tmp_path):
+    sc_mon = SC_Monitor(
+        config=VisConfig(
+            print_task_tree=False,
+            weak_registry=True,
+            check_task_tree=True,
+            log_filename=str(tmp_path / "sc-logs.json"),
+        )
+    )
+    nurseries = []
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            nurseries.append(weakref.ref(nursery))
+            nursery.start_soon(trio.sleep, 0)
+        del nursery
+        gc.collect()
+        await trio.sleep(0)
+
+    trio.run(main, instruments=[sc_mon])
+
+    # the nursery was released before it was seen closed, it's still exited
+    assert nurseries[0]() is None
+    events = sc_mon.sc_logger.sink.events
+    exited = [e["name"] for e in events if e["desc"] == "exited"]
+    assert exited.index("nursery-0") < exited.index("main-0")
+    assert len(sc_mon.registry.registered) == 1
+
+
+def test_dump_signal_chains_previous_handler(tmp_path):
+    previous = Mock()
+    old = signal.signal(signal.SIGUSR1, previous)
+    try:
+        sc_mon = SC_Monitor(
+            config=VisConfig(
+                flight_recorder=True,
+                print_task_tree=False,
+                log_filename=str(tmp_path / "sc-logs.json"),
+            )
+        )
+        handler = signal.getsignal(signal.SIGUSR1)
+    finally:
+        signal.signal(signal.SIGUSR1, old)
+    dump = sc_mon.dump_flight_recorder = Mock(wraps=sc_mon.dump_flight_recorder)
+
+    # no run, the next callback dumps
+    handler(signal.SIGUSR1, None)
+    previous.assert_called_once_with(signal.SIGUSR1, None)
+    assert sc_mon.dump_requested and dump.call_count == 0
+
+    async def main():
+        assert dump.call_count == 1
+        # never dumped in the handler, but soon after in the Trio thread
+        handler(signal.SIGUSR1, None)
+        assert dump.call_count == 1
+        await trio.testing.wait_all_tasks_blocked()
+        assert dump.call_count == 2
+
+    trio.run(main, instruments=[sc_mon])
+    assert not sc_mon.dump_requested and dump.call_count == 2
+
+
+def test_dump_signal_unavailable(tmp_path):
+    old = signal.getsignal(signal.SIGUSR1)
+    with pytest.warns(UserWarning, match="SIGNOPE"):
+        SC_Monitor(
+            config=VisConfig(
+                flight_recorder=True,
+                flight_recorder_signal="SIGNOPE",
+                log_filename=str(tmp_path / "sc-logs.json"),
+            )
+        )
+
+    # signal.signal() raises outside of the main thread
+    monitors = []
+
+    def build():
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            monitors.append(
+                SC_Monitor(
+                    config=VisConfig(
+                        flight_recorder=True,
+                        log_filename=str(tmp_path / "sc-logs.json"),
+                    )
+                )
+            )
+        monitors.extend(str(w.message) for w in caught)
+
+    thread = threading.Thread(target=build)
+    thread.start()
+    thread.join()
+    assert len(monitors) == 2 and "main thread" in monitors[1]
+    assert signal.getsignal(signal.SIGUSR1) is old
+
+
+def test_attach_detach_at_runtime():
+    logger = fake_logger()
+    sc_mon = SC_Monitor(
+        config=VisConfig(print_task_tree=False, check_task_tree=True),
+        sc_logger=Mock(return_value=logger),
+    )
+
+    async def child():
+        await trio.sleep(1)
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(child)
+            await trio.sleep(0)
+            sc_mon.attach()
+            nursery.start_soon(child)
+            await trio.sleep(0)
+            sc_mon.detach()
+            nursery.cancel_scope.cancel()
+
+    trio.run(main)
+
+    # main, its nursery & the running child, then the child spawned later
+    starts = [c.kwargs for c in logger.log_start.call_args_list]
+    assert [s.get("extra") for s in starts] == [{"attached": True}] * 3 + [None]
+    assert starts[0]["parent"] is None
+    # everything alive at detach is exited, children first
+    exits = [c.kwargs for c in logger.log_exit.call_args_list]
+    assert [e["extra"] for e in exits] == [{"detached": True}] * 4
+    assert [e["child"] for e in reversed(exits)] == [s["child"] for s in starts]
+    assert exits[-1]["parent"] is None
+    # still alive, they stay registered
+    assert sc_mon.desc_tree is None and len(sc_mon.registry.registered) == 4
+
+
+def test_reattach_keeps_names():
+    sc_mon = SC_Monitor(
+        config=VisConfig(print_task_tree=False, check_task_tree=True),
+        sc_logger=Mock(return_value=fake_logger()),
+    )
+    names = []
+
+    async def long():
+        await trio.sleep(10)
+
+    async def short():
+        await trio.sleep(1)
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(long)
+            nursery.start_soon(short)
+            await trio.sleep(0)
+            sc_mon.attach()
+            names.append(sorted(sc_mon.desc_tree._nodes))
+            sc_mon.detach()
+            await trio.sleep(2)
+            sc_mon.attach()
+            names.append(sorted(sc_mon.desc_tree._nodes))
+            registered = len(sc_mon.registry.registered)
+            sc_mon.detach()
+            nursery.cancel_scope.cancel()
+        names.append(registered)
+
+    trio.run(main, clock=trio.testing.MockClock(autojump_threshold=0))
+
+    assert names[0] == ["long-0", "main-0", "nursery-0", "short-0"]
+    # the exited task is unregistered, the others keep their names
+    assert names[1] == ["long-0", "main-0", "nursery-0"]
+    assert names[2] == 3
+
+
+def test_overhead_counters():
+    logger = fake_logger()
+    sc_mon = SC_Monitor(
+        config=VisConfig(print_task_tree=False, track_overhead=True),
+        sc_logger=Mock(return_value=logger),
+    )
+
+    async def child():
+        await trio.sleep(0)
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            for _ in range(3):
+                nursery.start_soon(child)
+
+    trio.run(main, instruments=[sc_mon])
+
+    overhead = sc_mon.overhead()
+    callbacks = overhead["callbacks"]
+    assert callbacks["task_exited"]["calls"] == callbacks["task_spawned"]["calls"]
+    assert callbacks["logging"]["calls"] == 2 * 5
+    assert callbacks["tree"]["calls"] > 0
+    assert 0 < overhead["monitorNs"] <= overhead["elapsedNs"]
+    assert 0 < overhead["share"] <= 1
+
+    # reported in the config section of the log
+    sources = [c.args[0]() for c in logger.add_config_source.call_args_list]
+    assert any("monitorOverhead" in source for source in sources)
+
+
+def test_overhead_disabled():
+    sc_mon = SC_Monitor(
+        config=VisConfig(print_task_tree=False),
+        sc_logger=Mock(return_value=fake_logger()),
+    )
+    assert sc_mon.overhead() == {}
+    # the hooks aren't wrapped
+    assert sc_mon.task_spawned.__func__ is SC_Monitor.task_spawned
+
+
+def test_task_outcomes():
+    logger = fake_logger()
+    sc_mon = SC_Monitor(
+        config=VisConfig(print_task_tree=False, track_outcomes=True),
+        sc_logger=Mock(return_value=logger),
+    )
+    errors = []
+
+    class JobError(Exception):
+        pass
+
+    async def ok():
+        pass
+
+    async def fail():
+        error = JobError()
+        errors.append(weakref.ref(error))
+        raise error
+
+    async def wait():
+        await trio.sleep_forever()
+
+    async def main():
+        try:
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(ok)
+                await trio.sleep(0)
+                nursery.start_soon(wait)
+                nursery.start_soon(fail)
+        except JobError:
+            pass
+
+    trio.run(main, instruments=[sc_mon])
+
+    extras = {
+        c.kwargs["child"].name.rpartition(".")[2]: c.kwargs.get("extra", {})
+        for c in logger.log_exit.call_args_list
+        if hasattr(c.kwargs["child"], "coro")
+    }
+    assert extras["ok"] == {"outcome": "ok"}
+    assert extras["wait"] == {"outcome": "cancelled", "cancelCalled": True}
+    assert extras["fail"]["outcome"] == "error"
+    assert extras["fail"]["exception"].endswith("JobError")
+    assert extras["main"] == {"outcome": "ok"}
+
+    # only the type is kept
+    gc.collect()
+    assert errors[0]() is None
+
+
+def test_outcomes_only_read_for_traced_tasks(mocker):
+    sc_mon = SC_Monitor(
+        config=VisConfig(
+            print_task_tree=False, time_task_steps=True, track_outcomes=True
+        ),
+        sc_logger=Mock(return_value=fake_logger()),
+    )
+    outcome = mocker.patch("trio_vis.sc_monitor.exited_outcome", return_value=None)
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(trio.sleep, 0)
+
+    trio.run(main, instruments=[sc_mon])
+
+    # trio's own tasks exit untraced, their step stats are still dropped
+    traced = [c.args[0].name for c in outcome.call_args_list]
+    assert len(traced) == 2 and traced[0].endswith("sleep")
+    assert len(sc_mon.step_timer.stats) == 0
+
+
+def test_main_task_outcome():
+    logger = fake_logger()
+    sc_mon = SC_Monitor(
+        config=VisConfig(print_task_tree=False, track_outcomes=True),
+        sc_logger=Mock(return_value=logger),
+    )
+
+    async def main():
+        raise KeyError()
+
+    with pytest.raises(KeyError):
+        trio.run(main, instruments=[sc_mon])
+    assert logger.log_exit.call_args.kwargs["extra"] == {
+        "outcome": "error",
+        "exception": "KeyError",
+    }
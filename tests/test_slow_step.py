@@ -0,0 +1,42 @@
+import time
+
+from trio_vis.slow_step import RateLimiter, StackSampler
+from trio_vis.step_timer import StepTimer
+from trio_vis.trio_fake import FakeTrioTask
+
+
+def test_rate_limiter(mocker):
+    clock = mocker.patch("trio_vis.slow_step.perf_counter_ns")
+    clock.return_value = 0
+    limiter = RateLimiter(rate=2)
+
+    assert [limiter.allow() for _ in range(3)] == [True, True, False]
+    assert limiter.take_suppressed() == 1
+    assert limiter.take_suppressed() == 0
+
+    # refilled by one token after half a second
+    clock.return_value = 500_000_000
+    assert [limiter.allow() for _ in range(2)] == [True, False]
+
+
+def busy_step():
+    time.sleep(0.2)
+
+
+def test_stack_sampler():
+    timer = StepTimer()
+    sampler = StackSampler(timer, threshold_ns=20_000_000, interval=0.005)
+    t0 = FakeTrioTask(name="t0")
+
+    sampler.start()
+    try:
+        timer.before_task_step(t0)
+        busy_step()
+        timer.after_task_step(t0)
+    finally:
+        sampler.stop()
+
+    stack = sampler.take(timer.step_id)
+    assert stack is not None
+    assert any("busy_step" in line for line in stack)
+    assert sampler.take(timer.step_id) is None
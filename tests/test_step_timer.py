@@ -0,0 +1,37 @@
+from trio_vis.step_timer import StepTimer
+from trio_vis.trio_fake import FakeTrioTask
+
+
+def test_step_stats(mocker):
+    clock = mocker.patch("trio_vis.step_timer.perf_counter_ns")
+    timer = StepTimer()
+    t0 = FakeTrioTask(name="t0")
+
+    for start, end in [(0, 100), (150, 450), (500, 550)]:
+        clock.return_value = start
+        timer.before_task_step(t0)
+        clock.return_value = end
+        timer.after_task_step(t0)
+
+    stats = timer.pop(t0)
+    assert stats is not None
+    assert stats.as_dict() == {"runNs": 450, "steps": 3, "maxStepNs": 300}
+    assert timer.pop(t0) is None
+
+
+def test_close_step_on_exit(mocker):
+    clock = mocker.patch("trio_vis.step_timer.perf_counter_ns")
+    timer = StepTimer()
+    t0 = FakeTrioTask(name="t0")
+
+    clock.return_value = 0
+    timer.before_task_step(t0)
+    # trio calls task_exited before after_task_step of the last step
+    clock.return_value = 70
+    stats = timer.pop(t0)
+    clock.return_value = 90
+    timer.after_task_step(t0)
+
+    assert stats is not None
+    assert stats.as_dict() == {"runNs": 70, "steps": 1, "maxStepNs": 70}
+    assert timer.stats == {}
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from trio_vis.task_filter import TaskFilter
+
+
+async def user_job():
+    pass
+
+
+def make_task(code, module=None):
+    frame = None if module is None else SimpleNamespace(f_globals={"__name__": module})
+    return SimpleNamespace(coro=SimpleNamespace(cr_code=code, cr_frame=frame))
+
+
+class FakeCode:
+    def __init__(self, filename: str):
+        self.co_filename = filename
+        self.co_name = "job"
+
+
+def test_default_rules():
+    is_user_task = TaskFilter(exclude_paths=["*trio/_core/*"])
+    assert is_user_task(make_task(user_job.__code__))
+    assert not is_user_task(make_task(FakeCode("/lib/trio/_core/_run.py")))
+
+
+def test_include_take_precedence():
+    is_user_task = TaskFilter(
+        include_modules=["trio.testing"], exclude_modules=["trio"]
+    )
+    assert not is_user_task(make_task(FakeCode("a.py"), module="trio._core._run"))
+    assert is_user_task(make_task(FakeCode("b.py"), module="trio.testing._foo"))
+    # prefixes only match whole module names
+    assert is_user_task(make_task(FakeCode("c.py"), module="trio_vis"))
+
+
+def test_classify_once_per_code():
+    is_user_task = TaskFilter(exclude_paths=["*/internal/*"])
+    code = FakeCode("/src/internal/job.py")
+    assert not is_user_task(make_task(code))
+
+    # cached by code object
+    code.co_filename = "/src/job.py"
+    assert not is_user_task(make_task(code))
+    assert len(is_user_task._cache) == 1
+
+
+def test_finished_coroutine_without_frame():
+    is_user_task = TaskFilter(exclude_modules=[__name__])
+    coro = user_job()
+    coro.close()
+    assert coro.cr_frame is None
+    assert not is_user_task(SimpleNamespace(coro=coro))
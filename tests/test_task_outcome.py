@@ -0,0 +1,94 @@
+import outcome
+import pytest
+import trio
+
+from trio_vis.task_outcome import (NurseryOutcomes, describe_outcome,
+                                   exited_outcome, format_outcomes,
+                                   is_cancelled)
+
+
+def make_cancelled() -> trio.Cancelled:
+    # trio.Cancelled can't be instantiated directly
+    async def cancelled() -> trio.Cancelled:
+        with trio.CancelScope() as scope:
+            scope.cancel()
+            try:
+                await trio.sleep(0)
+            except trio.Cancelled as error:
+                return error
+        raise AssertionError("not cancelled")
+
+    return trio.run(cancelled)
+
+
+def test_describe_outcome():
+    assert describe_outcome(None) == {}
+    assert describe_outcome(outcome.Value(1)) == {"outcome": "ok"}
+    assert describe_outcome(outcome.Error(KeyError())) == {
+        "outcome": "error",
+        "exception": "KeyError",
+    }
+    assert describe_outcome(outcome.Error(make_cancelled())) == {"outcome": "cancelled"}
+    assert describe_outcome(outcome.Error(trio.TooSlowError())) == {
+        "outcome": "error",
+        "exception": "trio.TooSlowError",
+    }
+
+
+@pytest.mark.parametrize(
+    "excs, cancelled",
+    [
+        ([make_cancelled(), make_cancelled()], True),
+        ([make_cancelled(), ValueError()], False),
+    ],
+)
+def test_cancelled_group(excs, cancelled):
+    assert is_cancelled(BaseExceptionGroup("", excs)) is cancelled
+
+
+def test_nursery_outcomes():
+    outcomes = NurseryOutcomes()
+    outcomes.record("nursery-0", {"outcome": "ok"}, ts=10)
+    for ts in range(3):
+        outcomes.record("nursery-1", {"outcome": "cancelled"}, ts=ts)
+    outcomes.record("nursery-1", {"outcome": "error", "exception": "KeyError"}, 2500)
+    outcomes.record("nursery-1", {"outcome": "error", "exception": "OSError"}, 3000)
+    outcomes.record("nursery-2", {}, ts=10)
+
+    summary = outcomes.summary()
+    assert summary == {
+        "nursery-1": {
+            "cancelled": 3,
+            "errored": 2,
+            "firstErrorNs": 2500,
+            "firstError": "KeyError",
+        }
+    }
+    assert format_outcomes(summary) == [
+        "nursery-1: 3 cancelled, 2 errored, first error at t=0.003ms (KeyError)"
+    ]
+
+
+def test_nursery_outcomes_bounded():
+    outcomes = NurseryOutcomes(nm_nurseries=2)
+    for i in range(5):
+        for ts in range(i + 1):
+            outcomes.record(f"nursery-{i}", {"outcome": "cancelled"}, ts=ts)
+        outcomes.close(f"nursery-{i}")
+    outcomes.record("nursery-5", {"outcome": "cancelled"}, ts=10)
+
+    # exited ones are kept only among the worst, the live ones are all kept
+    assert list(outcomes.summary()) == ["nursery-4", "nursery-3", "nursery-5"]
+    assert len(outcomes.exited) == 2 and list(outcomes.nurseries) == ["nursery-5"]
+
+
+def test_exited_outcome_unknown_trio(mocker):
+    class Runner:
+        main_task = None
+
+        def task_exited(self, task, result):
+            return exited_outcome(task)
+
+    mocker.patch("trio_vis.task_outcome._runner", return_value=Runner())
+    with pytest.warns(UserWarning, match="no outcome argument"):
+        assert Runner().task_exited(object(), result=None) is None
@@ -0,0 +1,105 @@
+import io
+import json
+
+from trio_vis.trace_export import (TraceEventConverter, export_trace,
+                                   write_trace)
+
+EVENTS = [
+    {"time": 0, "desc": "created", "name": "main-0__TRIO_VIS_Tscope", "type": "scope"},
+    {
+        "time": 1,
+        "desc": "created",
+        "name": "main-0",
+        "type": "task",
+        "parent": "main-0__TRIO_VIS_Tscope",
+        "ts": 1000,
+    },
+    {
+        "time": 2,
+        "desc": "created",
+        "name": "nursery-0",
+        "type": "scope",
+        "parent": "main-0__TRIO_VIS_Tscope",
+        "ts": 2000,
+    },
+    {
+        "time": 3,
+        "desc": "created",
+        "name": "job-0",
+        "type": "task",
+        "parent": "job-0__TRIO_VIS_Tscope",
+        "ts": 3000,
+    },
+    {
+        "time": 4,
+        "desc": "slow-step",
+        "name": "job-0",
+        "type": "task",
+        "parent": "job-0__TRIO_VIS_Tscope",
+        "ts": 9000,
+        "durationNs": 5000,
+    },
+    {
+        "time": 5,
+        "desc": "exited",
+        "name": "job-0",
+        "type": "task",
+        "parent": "job-0__TRIO_VIS_Tscope",
+        "ts": 10000,
+        "steps": 2,
+    },
+    {
+        "time": 6,
+        "desc": "exited",
+        "name": "nursery-0",
+        "type": "scope",
+        "parent": "main-0__TRIO_VIS_Tscope",
+        "ts": 11000,
+    },
+]
+
+
+def test_convert_tracks():
+    converter = TraceEventConverter()
+    trace = [e for event in EVENTS[1:] for e in converter.convert(event)]
+    slices = [(e["ph"], e["name"], e["tid"]) for e in trace if e["ph"] != "M"]
+    assert slices == [
+        ("B", "main-0", 1),
+        ("B", "nursery-0", 1),
+        ("B", "job-0", 2),
+        ("X", "slow step", 2),
+        ("E", "job-0", 2),
+        ("E", "nursery-0", 1),
+    ]
+    slow_step = next(e for e in trace if e["ph"] == "X")
+    assert slow_step["ts"] == 4.0 and slow_step["dur"] == 5.0
+    assert trace[-2]["args"] == {"steps": 2}
+    # only live scopes are remembered
+    assert converter.task_tids == {"main-0": 1}
+    assert converter.nursery_tids == {}
+
+
+def test_logical_clock_fallback():
+    converter = TraceEventConverter()
+    assert converter.convert(EVENTS[0]) == []
+    assert converter.timestamp(EVENTS[0]) == 0.0
+
+
+def test_write_trace_array_layout():
+    out = io.StringIO()
+    write_trace(EVENTS, out, array=True)
+    # a truncated array trace is still valid once closed
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "["
+    partial = "\n".join(lines[:4]).rstrip(",") + "]"
+    assert len(json.loads(partial)) == 3
+
+
+def test_export_trace_from_ndjson(tmp_path):
+    ndjson = tmp_path / "sc-logs.ndjson"
+    ndjson.write_text("\n".join(json.dumps(e) for e in EVENTS) + "\n")
+    trace_file = tmp_path / "sc-trace.json"
+    export_trace(str(ndjson), str(trace_file))
+
+    trace = json.loads(trace_file.read_text())
+    assert sum(1 for e in trace["traceEvents"] if e["ph"] in "BE") == 5
@@ -1,2 +1,29 @@
-from .config import VisConfig
-from .sc_monitor import SC_Monitor
+import sys
+from typing import TYPE_CHECKING
+
+# Exports are imported on first access, so `import trio_vis` doesn't pay for
+# pydantic (config validation) or rich (rendering) until they are used
+_EXPORTS = {
+    "VisConfig": ".config",
+    "SC_Monitor": ".sc_monitor",
+    "LoopMetrics": ".loop_metrics",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+if TYPE_CHECKING or sys.version_info < (3, 7):
+    # no module level __getattr__ before Python 3.7
+    from .config import VisConfig
+    from .loop_metrics import LoopMetrics
+    from .sc_monitor import SC_Monitor
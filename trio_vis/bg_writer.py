@@ -0,0 +1,98 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, Optional
+
+from .log_sink import RawEvent
+
+""" Background writer
+
+    Move event serialization & file writes off the Trio run loop.
+
+    The instrument callbacks only push raw event tuples into a deque, whose
+    `append`/`popleft` are atomic, so no lock is taken on the hot path.
+    A daemon thread drains the queue in batches and writes them to the sink.
+    If the sink fails, later events are dropped and `stop()` raises the error.
+"""
+
+
+class BackgroundWriter:
+    def __init__(
+        self,
+        write: Callable[[RawEvent], None],
+        max_queue_size: int = 65536,
+        batch_size: int = 1024,
+        interval: float = 0.05,
+    ):
+        # encode & hand an event to the sink
+        self.write: Callable[[RawEvent], None] = write
+        self.max_queue_size: int = max_queue_size
+        self.batch_size: int = batch_size
+        self.interval: float = interval
+
+        self.queue: Deque[RawEvent] = deque()
+        # events discarded because the queue was full
+        self.dropped: int = 0
+        # events handed to the sink
+        self.written: int = 0
+        # what stopped the thread early, raised by `stop()`
+        self.error: Optional[BaseException] = None
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="trio-vis-writer", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.queue)
+
+    def put(self, event: RawEvent):
+        """Called from the Trio thread, never blocks"""
+        if len(self.queue) >= self.max_queue_size or self.error is not None:
+            self.dropped += 1
+            return
+        self.queue.append(event)
+
+    def _drain(self) -> int:
+        """Write at most one batch, return the number of events written"""
+        popleft = self.queue.popleft
+        write = self.write
+        count = 0
+        try:
+            while count < self.batch_size:
+                try:
+                    event = popleft()
+                except IndexError:
+                    break
+                write(event)
+                count += 1
+        finally:
+            self.written += count
+        return count
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                if self._drain() < self.batch_size:
+                    self._stop.wait(self.interval)
+            while self._drain() > 0:
+                pass
+        except BaseException as error:
+            # the failed event & everything queued are lost
+            self.dropped += len(self.queue) + 1
+            self.queue.clear()
+            self.error = error
+
+    def stop(self):
+        """Stop the thread after everything queued is written
+
+        Raise a RuntimeError if writing failed
+        """
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+        if self.error is not None:
+            raise RuntimeError(
+                f"[trio-vis] failed to write the log, {self.dropped} events dropped"
+            ) from self.error
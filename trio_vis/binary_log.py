@@ -0,0 +1,340 @@
+import argparse
+import json
+import lzma
+import struct
+import zlib
+from pathlib import Path
+from typing import IO, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from .log_index import LogIndexBuilder
+from .log_sink import EventSink, RawEvent, SCVisWriter
+
+""" Compact binary event log
+
+    File layout:
+        header: MAGIC, version(u8), compression(u8)
+        blocks: block_type(u8), raw_size(u32), stored_size(u32), payload
+
+    An event block carries the names first seen in that block, followed by
+    fixed-width event records. `SCLogger` hands the sink raw events, scopes
+    are mapped from their integer refs to name ids, a name is only encoded
+    the first time its scope shows up. Ids of exited scopes are handed out again to
+    later names, but never within the block they were freed in, so the
+    string table is updated block by block while reading and only grows with
+    the number of scopes alive at once.
+
+        payload of an event block:
+            nm_names(u32), [name_id(u32), name_len(u16), utf-8 name] * nm_names
+            nm_records(u32), [RECORD] * nm_records
+            nm_extras(u32), [record_index(u32), json_len(u32), json] * nm_extras
+
+    The outcome of a task is packed in a byte of the record, the low bits
+    tell the outcome (OUTCOMES), CANCEL_CALLED flags a cancelled nursery.
+    Fields beyond the fixed record (e.g. task step stats, exception types)
+    are kept as JSON extras, only the few events carrying them pay for it.
+
+    The config block (JSON) is written once the log is closed.
+"""
+
+MAGIC = b"TVISBIN\0"
+VERSION = 4
+
+BLOCK_EVENTS = 0
+BLOCK_CONFIG = 1
+
+COMPRESSIONS: Tuple[Optional[str], ...] = (None, "zlib", "lzma")
+
+# time, ts, type, desc, outcome, name_id, parent_id
+RECORD = struct.Struct("<QQBBBII")
+HEADER = struct.Struct("<8sBB")
+BLOCK_HEADER = struct.Struct("<BII")
+COUNT = struct.Struct("<I")
+EXTRA_HEADER = struct.Struct("<II")
+NAME_HEADER = struct.Struct("<IH")
+MAX_NAME_LEN = 0xFFFF
+
+NO_PARENT = 0xFFFFFFFF
+
+TYPES = ("scope", "task")
+DESCS = ("created", "exited", "slow-step")
+TYPE_IDS = {t: i for i, t in enumerate(TYPES)}
+# fields of an encoded event outside of its extra ones
+EVENT_FIELDS = ("time", "desc", "name", "type", "parent", "ts")
+# fields packed in the record
+RECORD_FIELDS = EVENT_FIELDS + ("outcome", "cancelCalled")
+DESC_IDS = {d: i for i, d in enumerate(DESCS)}
+
+# 0 for events without an outcome
+OUTCOMES = (None, "ok", "cancelled", "error")
+OUTCOME_IDS = {o: i for i, o in enumerate(OUTCOMES)}
+OUTCOME_MASK = 0x3
+CANCEL_CALLED = 0x4
+
+
+def binary_filename_of(log_filename: str) -> str:
+    return str(Path(log_filename).with_suffix(".bin"))
+
+
+def _compress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == "zlib":
+        return zlib.compress(data)
+    if compression == "lzma":
+        return lzma.compress(data)
+    return data
+
+
+def _decompress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "lzma":
+        return lzma.decompress(data)
+    return data
+
+
+class BinarySink(EventSink):
+    """Write events as fixed-width records with interned names"""
+
+    def __init__(
+        self,
+        filename: str,
+        batch_size: int = 4096,
+        compression: Optional[str] = None,
+    ):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"[trio-vis] unknown compression: {compression}")
+        self.filename: str = filename
+        self.batch_size: int = batch_size
+        self.compression: Optional[str] = compression
+        self.closed: bool = False
+
+        # ref (or name) -> name id, only for scopes still alive
+        self.name_ids: Dict[Hashable, int] = {}
+        # size of the string table
+        self.nm_names: int = 0
+        # ids freed before the current block, and within it
+        self._free_ids: List[int] = []
+        self._freed_ids: List[int] = []
+
+        self._new_names: List[Tuple[int, bytes]] = []
+        self._records = bytearray()
+        self._nm_records: int = 0
+        self._extras: List[bytes] = []
+
+        self._file: IO[bytes] = open(filename, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, COMPRESSIONS.index(compression)))
+
+    def _intern(self, key: Hashable, name: str) -> int:
+        name_id = self.name_ids.get(key, None)
+        if name_id is None:
+            encoded = name.encode()
+            if len(encoded) > MAX_NAME_LEN:
+                raise ValueError(
+                    f"[trio-vis] name longer than {MAX_NAME_LEN} bytes: {name[:80]}..."
+                )
+            if self._free_ids:
+                name_id = self._free_ids.pop()
+            else:
+                name_id = self.nm_names
+                self.nm_names += 1
+            self.name_ids[key] = name_id
+            self._new_names.append((name_id, encoded))
+        return name_id
+
+    def emit_raw(self, event: RawEvent):
+        """Write a raw event of `SCLogger`, scopes are told apart by their refs"""
+        time, desc, ref, name, type, parent, parent_name, extra, ts = event
+        name_id = self._intern(ref, name)
+        parent_id = NO_PARENT if parent is None else self._intern(parent, parent_name)
+        outcome = 0
+        if extra is not None:
+            outcome = OUTCOME_IDS[extra.get("outcome", None)]
+            nm_packed = int(outcome != 0)
+            if extra.get("cancelCalled", False):
+                outcome |= CANCEL_CALLED
+                nm_packed += 1
+            if len(extra) > nm_packed:
+                rest = {k: v for k, v in extra.items() if k not in RECORD_FIELDS}
+                data = json.dumps(rest).encode()
+                self._extras.append(
+                    EXTRA_HEADER.pack(self._nm_records, len(data)) + data
+                )
+        self._records += RECORD.pack(
+            time,
+            ts,
+            TYPE_IDS[type],
+            DESC_IDS[desc],
+            outcome,
+            name_id,
+            parent_id,
+        )
+        self._nm_records += 1
+        if desc == "exited":
+            # an exited scope would never be referenced again
+            freed = self.name_ids.pop(ref, None)
+            if freed is not None:
+                self._freed_ids.append(freed)
+        if self._nm_records >= self.batch_size:
+            self.flush()
+
+    def emit(self, event: Dict):
+        """Write an encoded event, scopes are told apart by their names"""
+        name, parent = event["name"], event.get("parent", None)
+        extra = {k: v for k, v in event.items() if k not in EVENT_FIELDS}
+        self.emit_raw(
+            (
+                event["time"],
+                event["desc"],
+                name,
+                name,
+                event["type"],
+                parent,
+                parent,
+                extra or None,
+                event["ts"],
+            )
+        )
+
+    def _write_block(self, block_type: int, data: bytes):
+        stored = _compress(data, self.compression)
+        self._file.write(BLOCK_HEADER.pack(block_type, len(data), len(stored)))
+        self._file.write(stored)
+
+    def flush(self):
+        if self._nm_records == 0:
+            return
+        chunks = [COUNT.pack(len(self._new_names))]
+        for name_id, name in self._new_names:
+            chunks.append(NAME_HEADER.pack(name_id, len(name)))
+            chunks.append(name)
+        chunks.append(COUNT.pack(self._nm_records))
+        chunks.append(bytes(self._records))
+        chunks.append(COUNT.pack(len(self._extras)))
+        chunks.extend(self._extras)
+        self._write_block(BLOCK_EVENTS, b"".join(chunks))
+
+        self._new_names.clear()
+        # records of the block are written, their names can be replaced
+        self._free_ids.extend(self._freed_ids)
+        self._freed_ids.clear()
+        self._records = bytearray()
+        self._nm_records = 0
+        self._extras.clear()
+
+    def close(self, config: Dict):
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        self._write_block(BLOCK_CONFIG, json.dumps(config).encode())
+        self._file.close()
+
+
+class BinaryLogReader:
+    """Read a binary log block by block"""
+
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        # filled once the config block is read
+        self.config: Optional[Dict] = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        names: List[str] = []
+        with open(self.filename, "rb") as f:
+            magic, version, compression_id = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"[trio-vis] not a trio-vis binary log: {self}")
+            compression = COMPRESSIONS[compression_id]
+
+            while True:
+                block_header = f.read(BLOCK_HEADER.size)
+                if len(block_header) < BLOCK_HEADER.size:
+                    break
+                block_type, _, stored_size = BLOCK_HEADER.unpack(block_header)
+                data = _decompress(f.read(stored_size), compression)
+                if block_type == BLOCK_CONFIG:
+                    self.config = json.loads(data)
+                    continue
+                yield from self._iter_block(data, names)
+
+    def _iter_block(self, data: bytes, names: List[str]) -> Iterator[Dict]:
+        (nm_names,) = COUNT.unpack_from(data, 0)
+        offset = COUNT.size
+        for _ in range(nm_names):
+            name_id, name_len = NAME_HEADER.unpack_from(data, offset)
+            offset += NAME_HEADER.size
+            name = data[offset : offset + name_len].decode()
+            offset += name_len
+            if name_id < len(names):
+                names[name_id] = name
+            else:
+                names.append(name)
+
+        (nm_records,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        records = data[offset : offset + nm_records * RECORD.size]
+        offset += len(records)
+
+        extras: Dict[int, Dict] = {}
+        (nm_extras,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        for _ in range(nm_extras):
+            index, size = EXTRA_HEADER.unpack_from(data, offset)
+            offset += EXTRA_HEADER.size
+            extras[index] = json.loads(data[offset : offset + size])
+            offset += size
+
+        for index, (
+            time,
+            ts,
+            type_id,
+            desc_id,
+            outcome,
+            name_id,
+            parent_id,
+        ) in enumerate(RECORD.iter_unpack(records)):
+            event = {
+                "time": time,
+                "desc": DESCS[desc_id],
+                "name": names[name_id],
+                "type": TYPES[type_id],
+            }
+            if parent_id != NO_PARENT:
+                event["parent"] = names[parent_id]
+            event["ts"] = ts
+            if outcome & OUTCOME_MASK:
+                event["outcome"] = OUTCOMES[outcome & OUTCOME_MASK]
+            if outcome & CANCEL_CALLED:
+                event["cancelCalled"] = True
+            if index in extras:
+                event.update(extras[index])
+            yield event
+
+    def __repr__(self):
+        return f"<BinaryLogReader: {self.filename}>"
+
+
+def binary_to_sc_vis(binary_filename: str, log_filename: str, index: bool = False):
+    """Expand a binary log into the sc-vis log format, event by event"""
+    reader = BinaryLogReader(binary_filename)
+    writer = SCVisWriter(log_filename, index=LogIndexBuilder() if index else None)
+    for event in reader:
+        writer.write(json.dumps(event), event)
+    # the config block comes last
+    writer.close({} if reader.config is None else reader.config)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a trio-vis binary log to the sc-vis log format"
+    )
+    parser.add_argument("binary_log")
+    parser.add_argument("log_file", nargs="?", default="./sc-logs.json")
+    parser.add_argument(
+        "--index", action="store_true", help="write an index next to the log"
+    )
+    args = parser.parse_args()
+    binary_to_sc_vis(args.binary_log, args.log_file, index=args.index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import array
+import json
+from typing import (TYPE_CHECKING, Any, Dict, Iterable, Iterator, List,
+                    Optional, Tuple)
+
+from .binary_log import (CANCEL_CALLED, DESC_IDS, DESCS, NO_PARENT,
+                         OUTCOME_IDS, OUTCOME_MASK, OUTCOMES, RECORD_FIELDS,
+                         TYPE_IDS, TYPES)
+from .log_index import LogIndexBuilder
+from .log_sink import EventSink, SCVisWriter
+from .registry import SCOPE_SUFFIX, base_name
+
+if TYPE_CHECKING:
+    import numpy
+
+""" Columnar event store
+
+    Events are kept column by column in `array` buffers instead of a list of
+    dicts, about 30 bytes per event plus the names, which are interned.
+    The columns are viewed as NumPy arrays without copying, analytics over
+    millions of events then run in vectorized NumPy code.
+
+    Columns, one value per event:
+        seq: logical clock (`time` of the event)
+        ts: nanoseconds since the logger started, -1 if unknown
+        desc, type, outcome: ids as in the binary log (binary_log.py)
+        name, parent: ids of interned names, NO_PARENT for none
+
+    Fields beyond these (e.g. step stats, exception types) are kept in a
+    sparse table by event index.
+
+    NumPy is an optional dependency, only needed for the analytics.
+"""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "[trio-vis] the columnar analytics require numpy: pip install numpy"
+        ) from e
+    return numpy
+
+
+CREATED = DESC_IDS["created"]
+EXITED = DESC_IDS["exited"]
+TASK = TYPE_IDS["task"]
+
+
+class EventColumns:
+    def __init__(self):
+        self.seq = array.array("Q")
+        self.ts = array.array("q")
+        self.desc = array.array("B")
+        self.type = array.array("B")
+        self.outcome = array.array("B")
+        self.name = array.array("I")
+        self.parent = array.array("I")
+
+        self.names: List[str] = []
+        self.name_ids: Dict[str, int] = {}
+        # event index -> fields beyond the columns
+        self.extras: Dict[int, Dict] = {}
+
+    def _intern(self, name: str) -> int:
+        name_id = self.name_ids.get(name, None)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def append(self, event: Dict):
+        parent = event.get("parent", None)
+        outcome = OUTCOME_IDS[event.get("outcome", None)]
+        nm_fields = 4 + (parent is not None) + ("ts" in event) + (outcome != 0)
+        if event.get("cancelCalled", False):
+            outcome |= CANCEL_CALLED
+            nm_fields += 1
+        if len(event) > nm_fields:
+            self.extras[len(self.seq)] = {
+                k: v for k, v in event.items() if k not in RECORD_FIELDS
+            }
+        self.seq.append(event["time"])
+        self.ts.append(event.get("ts", -1))
+        self.desc.append(DESC_IDS[event["desc"]])
+        self.type.append(TYPE_IDS[event["type"]])
+        self.outcome.append(outcome)
+        self.name.append(self._intern(event["name"]))
+        self.parent.append(NO_PARENT if parent is None else self._intern(parent))
+
+    @classmethod
+    def from_events(cls, events: Iterable[Dict]) -> "EventColumns":
+        columns = cls()
+        for event in events:
+            columns.append(event)
+        return columns
+
+    @classmethod
+    def from_log(cls, filename: str) -> "EventColumns":
+        """Load any log format, streaming"""
+        from .log_reader import iter_log_events
+
+        return cls.from_events(iter_log_events(filename))
+
+    def __len__(self) -> int:
+        return len(self.seq)
+
+    def event(self, index: int) -> Dict:
+        """Materialize an event, the fields of `SCEvent` then `ts` & the extra ones"""
+        event: Dict[str, Any] = {
+            "time": self.seq[index],
+            "desc": DESCS[self.desc[index]],
+            "name": self.names[self.name[index]],
+            "type": TYPES[self.type[index]],
+        }
+        parent = self.parent[index]
+        if parent != NO_PARENT:
+            event["parent"] = self.names[parent]
+        if self.ts[index] >= 0:
+            event["ts"] = self.ts[index]
+        outcome = self.outcome[index]
+        if outcome & OUTCOME_MASK:
+            event["outcome"] = OUTCOMES[outcome & OUTCOME_MASK]
+        if outcome & CANCEL_CALLED:
+            event["cancelCalled"] = True
+        if index in self.extras:
+            event.update(self.extras[index])
+        return event
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self.event(index)
+
+    def to_numpy(self) -> Dict[str, "numpy.ndarray"]:
+        """Views of the columns, valid until more events are appended"""
+        np = _numpy()
+        return {
+            "seq": np.frombuffer(self.seq, dtype=np.uint64),
+            "ts": np.frombuffer(self.ts, dtype=np.int64),
+            "desc": np.frombuffer(self.desc, dtype=np.uint8),
+            "type": np.frombuffer(self.type, dtype=np.uint8),
+            "outcome": np.frombuffer(self.outcome, dtype=np.uint8),
+            "name": np.frombuffer(self.name, dtype=np.uint32),
+            "parent": np.frombuffer(self.parent, dtype=np.uint32),
+        }
+
+    # Analytics, all of them need numpy
+
+    def _task_scope_names(self) -> "numpy.ndarray":
+        """Whether each name is the scope wrapping a task"""
+        np = _numpy()
+        return np.fromiter(
+            (n.endswith(SCOPE_SUFFIX) for n in self.names),
+            dtype=bool,
+            count=len(self.names),
+        )
+
+    def _scope_times(
+        self, mask: "numpy.ndarray"
+    ) -> Tuple["numpy.ndarray", "numpy.ndarray"]:
+        """Creation & exit timestamps by name id, -1 if missing"""
+        np = _numpy()
+        cols = self.to_numpy()
+        created = np.full(len(self.names), -1, dtype=np.int64)
+        exited = np.full(len(self.names), -1, dtype=np.int64)
+        is_created = mask & (cols["desc"] == CREATED)
+        is_exited = mask & (cols["desc"] == EXITED)
+        created[cols["name"][is_created]] = cols["ts"][is_created]
+        exited[cols["name"][is_exited]] = cols["ts"][is_exited]
+        return created, exited
+
+    def _task_events(self) -> "numpy.ndarray":
+        cols = self.to_numpy()
+        is_scope = self._task_scope_names()
+        return (cols["type"] == TASK) & ~is_scope[cols["name"]] & (cols["ts"] >= 0)
+
+    def concurrency(
+        self, bucket_ns: Optional[int] = None
+    ) -> Tuple["numpy.ndarray", "numpy.ndarray"]:
+        """Live tasks after each task event, as (ts, live)
+
+        With `bucket_ns`, the max within each bucket (by its start), counting
+        the tasks alive as the bucket starts. Buckets without events are left
+        out
+        """
+        np = _numpy()
+        cols = self.to_numpy()
+        mask = self._task_events()
+        mask &= (cols["desc"] == CREATED) | (cols["desc"] == EXITED)
+        ts, desc = cols["ts"][mask], cols["desc"][mask]
+        order = np.argsort(ts, kind="stable")
+        ts = ts[order]
+        live = np.cumsum(np.where(desc[order] == CREATED, 1, -1))
+        if bucket_ns is None or len(ts) == 0:
+            return ts, live
+        buckets = ts // bucket_ns
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        before = np.r_[0, live[:-1]][starts]
+        peaks = np.maximum(np.maximum.reduceat(live, starts), before)
+        return buckets[starts] * bucket_ns, peaks
+
+    def lifetimes(self) -> Dict[str, Dict]:
+        """Distribution of task lifetimes by coroutine name (in ns)"""
+        np = _numpy()
+        created, exited = self._scope_times(self._task_events())
+        ids = np.flatnonzero((created >= 0) & (exited >= 0))
+        if len(ids) == 0:
+            return {}
+        life = exited[ids] - created[ids]
+
+        groups: Dict[str, int] = {}
+        base_ids = np.fromiter(
+            (groups.setdefault(base_name(self.names[i]), len(groups)) for i in ids),
+            dtype=np.int64,
+            count=len(ids),
+        )
+        order = np.lexsort((life, base_ids))
+        life, base_ids = life[order], base_ids[order]
+        starts = np.flatnonzero(np.r_[True, base_ids[1:] != base_ids[:-1]])
+        ends = np.r_[starts[1:], len(life)]
+        counts = ends - starts
+        totals = np.add.reduceat(life, starts)
+
+        def rank(q: float) -> "numpy.ndarray":
+            # nearest rank within each sorted group
+            return life[starts + ((counts - 1) * q).astype(np.int64)]
+
+        p50, p90, p99 = rank(0.5), rank(0.9), rank(0.99)
+        names = {i: name for name, i in groups.items()}
+        return {
+            names[int(base_ids[s])]: {
+                "count": int(counts[g]),
+                "meanNs": float(totals[g] / counts[g]),
+                "p50Ns": int(p50[g]),
+                "p90Ns": int(p90[g]),
+                "p99Ns": int(p99[g]),
+                "maxNs": int(life[ends[g] - 1]),
+            }
+            for g, s in enumerate(starts)
+        }
+
+    def spawn_rates(self, n: Optional[int] = None) -> Dict[str, Dict]:
+        """Tasks spawned by each nursery over its lifetime, most spawns first
+
+        Nurseries still open at the end of the log count until the last event
+        """
+        np = _numpy()
+        cols = self.to_numpy()
+        if len(self) == 0:
+            return {}
+        is_scope = self._task_scope_names()
+        spawned = (
+            (cols["desc"] == CREATED)
+            & is_scope[cols["name"]]
+            & (cols["parent"] != NO_PARENT)
+        )
+        counts = np.bincount(cols["parent"][spawned], minlength=len(self.names))
+        nurseries = np.flatnonzero(counts)
+        nurseries = nurseries[np.argsort(-counts[nurseries], kind="stable")][:n]
+
+        created, exited = self._scope_times(np.ones(len(self), dtype=bool))
+        end = np.where(exited[nurseries] >= 0, exited[nurseries], cols["ts"].max())
+        duration = end - created[nurseries]
+        return {
+            self.names[i]: {
+                "spawned": int(counts[i]),
+                "durationNs": int(d),
+                "perSec": float(counts[i] * 1e9 / d) if d > 0 else 0.0,
+            }
+            for i, d in zip(nurseries, duration)
+        }
+
+
+class ColumnarSink(EventSink):
+    """Keep events in an `EventColumns` store for analysis after the run
+
+    The sc-vis log is written from the columns when closed
+    """
+
+    def __init__(self, log_filename: str, index: bool = False):
+        self.log_filename: str = log_filename
+        self.index: bool = index
+        self.columns: EventColumns = EventColumns()
+        self.closed: bool = False
+
+    def emit(self, event: Dict):
+        self.columns.append(event)
+
+    def close(self, config: Dict):
+        if self.closed:
+            return
+        self.closed = True
+        writer = SCVisWriter(
+            self.log_filename,
+            config=config,
+            index=LogIndexBuilder() if self.index else None,
+        )
+        for event in self.columns:
+            writer.write(json.dumps(event), event)
+        writer.close()
@@ -1,6 +1,8 @@
 from pathlib import Path
+from typing import List, Optional
 
 from pydantic import BaseModel, validator
+from typing_extensions import Literal
 
 
 class VisConfig(BaseModel):
@@ -10,11 +12,99 @@ class VisConfig(BaseModel):
     # so we would like to disable this config while testing
     only_vis_user_scope: bool = True
 
+    # Rules to tell user tasks from internal ones, include rules take precedence
+    # module prefixes match the module of a task function ("trio" matches "trio.abc")
+    # path globs match the filename of a task function, with "/" as separator
+    # Tasks are classified once per distinct function
+    include_modules: List[str] = []
+    exclude_modules: List[str] = []
+    include_paths: List[str] = []
+    exclude_paths: List[str] = ["*trio/_core/*"]
+
+    # Show the task tree live in the terminal, redrawn `live_view_fps` times
+    # per second from a background thread
     print_task_tree: bool = True
+    live_view_fps: float = 4.0
+
+    # The task tree is updated incrementally on every event,
+    # turn this on to compare it against a full rebuild after each update (slow)
+    check_task_tree: bool = False
+
+    # Only keep weak references to trio's Task/Nursery objects, so a missed
+    # exit event never keeps a task (and its frames) alive
+    weak_registry: bool = False
+
+    # Count the time spent in the monitor's own callbacks, reported by
+    # `SC_Monitor.overhead()` and in the log config. Off by default, the
+    # timing wraps every hook including the per-step ones
+    track_overhead: bool = False
+
+    # Record how every task ended (ok, cancelled or the exception type) on
+    # its exit event, summarized by nursery in the log config. Off by
+    # default, it reads trio's internals on every task exit
+    track_outcomes: bool = False
+
+    # Measure run time, step count and longest step of every task,
+    # attached to the exit event of each task
+    time_task_steps: bool = False
+
+    # Log a "slow-step" event whenever a task step runs longer than this
+    # (in seconds), at most `slow_step_max_per_sec` events per second.
+    # With `slow_step_sample_stack`, a thread samples the stack of such steps
+    slow_step_threshold: Optional[float] = None
+    slow_step_max_per_sec: float = 10.0
+    slow_step_sample_stack: bool = False
+
+    # Sampling, decide for every child of the root task whether to trace its
+    # subtree, descendants of an untraced task are skipped altogether
+    # "random": trace with probability `sample_rate`
+    # "hash": trace by hashing the coroutine name and its spawn index, so the
+    #   same subtrees are chosen in every run
+    # `sample_max_per_sec_per_name` caps traced subtrees per coroutine name
+    sample_mode: Optional[Literal["random", "hash"]] = None
+    sample_rate: float = 1.0
+    sample_max_per_sec_per_name: Optional[float] = None
+    sample_seed: Optional[int] = None
 
     log_overwrite_if_exists: bool = True
     log_filename: str = "./sc-logs.json"
 
+    # Stream events into a NDJSON file (next to `log_filename`) in batches
+    # instead of keeping all of them in memory until the program exits
+    log_streaming: bool = False
+    log_batch_size: int = 1024
+
+    # Write an index next to the sc-vis log (`.index.json`), mapping every
+    # scope to the offsets of its records and timestamps to offsets.
+    # Not written for the binary log, see `python -m trio_vis.binary_log`
+    log_index: bool = False
+
+    # Write a compact binary log (`.bin` next to `log_filename`) instead,
+    # convert it with `python -m trio_vis.binary_log`
+    log_binary: bool = False
+    log_compression: Optional[Literal["zlib", "lzma"]] = None
+
+    # Keep events column-wise in memory (`SCLogger.sink.columns`, see
+    # columnar.py) for analysis after the run, the analytics require numpy
+    log_columnar: bool = False
+
+    # Serialize & write events in a background thread, the instrument callbacks
+    # only enqueue raw events. Events are dropped when the queue is full.
+    # Otherwise names are looked up & events built on the Trio thread, as
+    # every event is handed to the sink
+    log_in_background: bool = False
+    log_queue_size: int = 65536
+
+    # Flight recorder: keep only the latest `flight_recorder_size` events in a
+    # ring buffer, nothing is written at exit. The buffer is dumped to
+    # `log_filename` by `SC_Monitor.dump_flight_recorder()`, on receiving
+    # `flight_recorder_signal`, or when the root task raises.
+    # `flight_recorder_seconds` limits dumps to the latest events in time
+    flight_recorder: bool = False
+    flight_recorder_size: int = 65536
+    flight_recorder_seconds: Optional[float] = None
+    flight_recorder_signal: Optional[str] = "SIGUSR1"
+
     @validator("log_filename")
     def log_file_should_not_be_overwritten_unless_required(cls, filename: str, values):
         if Path(filename).exists() and values["log_overwrite_if_exists"] is False:
@@ -22,3 +112,11 @@ class VisConfig(BaseModel):
                 f"[trio-vis] file exists with overwrite set to false:{filename}"
             )
         return filename
+
+    @validator("flight_recorder")
+    def flight_recorder_needs_synchronous_logging(cls, enabled: bool, values):
+        if enabled and values.get("log_in_background", False):
+            raise ValueError(
+                "[trio-vis] flight_recorder can't be used with log_in_background"
+            )
+        return enabled
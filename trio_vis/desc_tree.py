@@ -1,11 +1,16 @@
 import typing
-from typing import Any, Dict, Optional, Union, cast
-
-from rich.console import Console, ConsoleOptions, RenderResult
-from rich.tree import Tree
+import weakref
+from collections import deque
+from typing import (TYPE_CHECKING, Any, Callable, Deque, Iterator, List,
+                    Optional, Union, cast)
 
 from .protocol import TrioNursery, TrioTask
-from .registry import RegisteredSCInfo, SCRegistry
+from .registry import (TYPE_TRIO_NURSERY, TYPE_TRIO_TASK, RegisteredSCInfo,
+                       SCRegistry, parse_obj_type)
+
+if TYPE_CHECKING:
+    from rich.console import Console, ConsoleOptions, RenderResult
+    from rich.tree import Tree
 
 """ Description Tree
 
@@ -14,6 +19,7 @@ from .registry import RegisteredSCInfo, SCRegistry
     This tree must support:
     1. Build up a state tree based on a TrioTask
     2. Given a task, find it's parent
+    3. Update itself incrementally while tasks are spawned/exited
 """
 
 
@@ -21,22 +27,45 @@ TrioNode = Union[TrioNursery, TrioTask]
 
 
 class DescNode:
-    def __init__(self, node: TrioNode, registry: SCRegistry):
+    def __init__(
+        self,
+        node: TrioNode,
+        registry: SCRegistry,
+        collected: Optional[Deque["DescNode"]] = None,
+    ):
         self.parent: Optional[DescNode] = None
         self.children: typing.List[DescNode] = []
-        self._registry: SCRegistry = registry
+        # bumped whenever the subtree changes, lets views skip unchanged parts
+        self.version: int = 0
+
+        # kept, so the node can still be named once its ref is collected
+        self.info: RegisteredSCInfo = registry.get_info(node)
 
         # ref to the actual node
-        self.ref: typing.Union[TrioTask, TrioNursery] = node
+        # If `collected` is given, tasks & nurseries are only weakly referenced.
+        # The node of a task is put into `collected` once the task is garbage
+        # collected. A nursery may be collected as soon as it's closed, its node
+        # stays until the nursery is seen closed (`ref` is None by then)
+        self._ref: Optional[TrioNode] = node
+        self._weak_ref: Optional[weakref.ref] = None
+        if collected is not None:
+            self._ref = None
+            if parse_obj_type(node) == TYPE_TRIO_TASK:
+                self._weak_ref = weakref.ref(node, lambda _: collected.append(self))
+            else:
+                self._weak_ref = weakref.ref(node)
 
     @property
-    def info(self) -> RegisteredSCInfo:
-        return self._registry.get_info(self.ref)
+    def ref(self) -> Optional[TrioNode]:
+        """The task or nursery, None once collected in weak mode"""
+        if self._weak_ref is not None:
+            return self._weak_ref()
+        return self._ref
 
     def __repr__(self):
         return f"<DescNode:{self.info.name}: {self.children}>"
 
-    def _rich_node(self, parent: Tree):
+    def _rich_node(self, parent: "Tree"):
         cur_node = parent.add(f"[yellow] name: {self.info.name}")
         [n._rich_node(parent=cur_node) for n in self.children]
 
@@ -48,10 +77,19 @@ class DescTree:
         reg: Any = SCRegistry() if registry == None else registry
         self._registry: SCRegistry = reg
 
-        self.ref_2node: Dict[Union[TrioTask, TrioNursery], DescNode] = {}
-
+        self.ref_2node: typing.MutableMapping[Union[TrioTask, TrioNursery], DescNode]
         # only used for debugging
-        self._nodes: Dict[str, DescNode] = {}
+        self._nodes: typing.MutableMapping[str, DescNode]
+
+        # Follow the registry, don't keep trio objects alive in weak mode
+        self._collected: Optional[Deque[DescNode]] = None
+        if self._registry.weak:
+            self.ref_2node = weakref.WeakKeyDictionary()
+            self._nodes = weakref.WeakValueDictionary()
+            self._collected = deque()
+        else:
+            self.ref_2node = {}
+            self._nodes = {}
 
     @property
     def registry(self):
@@ -68,55 +106,192 @@ class DescTree:
 
     @classmethod
     def build(
-        cls, root_task: TrioTask, registry: Optional[SCRegistry] = None
+        cls,
+        root_task: TrioTask,
+        registry: Optional[SCRegistry] = None,
+        should_trace: Optional[Callable[[TrioTask], bool]] = None,
     ) -> "DescTree":
-        """Build a tree of from source"""
-
-        _registry: SCRegistry = SCRegistry() if registry is None else registry
-
-        root_desc = DescNode(root_task, _registry)
+        """Build a tree of from source
 
-        tree = cls(root=root_desc, registry=_registry)
+        Tasks rejected by `should_trace` are left out along with their subtrees
+        """
 
-        def register(node: DescNode):
-            name = tree._registry.get_name(node.ref)
-            tree.ref_2node[node.ref] = node
+        _registry: SCRegistry = SCRegistry() if registry is None else registry
 
-            # only used for debugging
-            tree._nodes[name] = node
+        tree = cls(root=None, registry=_registry)
+        root_desc = tree.root = tree._new_node(root_task)
 
         def build_task(task_desc: DescNode):
             task = cast(TrioTask, task_desc.ref)
             # build for it's child nurseries
             for n in task.child_nurseries:
-                child_desc = DescNode(node=n, registry=_registry)
-                child_desc.parent = task_desc
-                task_desc.children.append(child_desc)
-                register(child_desc)
-                build_nursery(child_desc)
+                build_nursery(tree._attach(n, parent=task_desc))
 
         def build_nursery(nursery_desc: DescNode):
             nursery = cast(TrioNursery, nursery_desc.ref)
             # build for it's child tasks
             for t in nursery.child_tasks:
-                child_desc = DescNode(node=t, registry=_registry)
-                child_desc.parent = nursery_desc
-                nursery_desc.children.append(child_desc)
-                register(child_desc)
-                build_task(child_desc)
+                if should_trace is not None and not should_trace(t):
+                    continue
+                build_task(tree._attach(t, parent=nursery_desc))
 
-        register(root_desc)
+        tree._register(root_desc)
         build_task(root_desc)
         return tree
 
+    def _register(self, node: DescNode):
+        ref = node.ref
+        if ref is None:
+            raise RuntimeError("Bug: register a collected ref")
+        self.ref_2node[ref] = node
+
+        # only used for debugging
+        self._nodes[node.info.name] = node
+
+    def _new_node(self, ref: TrioNode) -> DescNode:
+        return DescNode(node=ref, registry=self._registry, collected=self._collected)
+
+    def _attach(self, ref: TrioNode, parent: DescNode) -> DescNode:
+        node = self._new_node(ref)
+        node.parent = parent
+        parent.children.append(node)
+        self._register(node)
+        self._touch(parent)
+        return node
+
+    @staticmethod
+    def _touch(node: Optional[DescNode]):
+        """Mark the subtree of the node and all its ancestors as changed"""
+        while node is not None:
+            node.version += 1
+            node = node.parent
+
+    def insert_task(self, task: TrioTask) -> List[DescNode]:
+        """Insert a newly spawned task under its parent nursery
+
+        Trio never tells us about nurseries, so the parent nursery is
+        discovered lazily when its first traced task is spawned.
+
+        Return the inserted nodes from top to bottom, an empty list means the
+        task is not reachable from the traced tree
+        """
+        self.purge_collected()
+        if task in self.ref_2node:
+            return []
+        nursery = task.parent_nursery
+        if nursery is None:
+            return []
+
+        inserted: List[DescNode] = []
+        nursery_node = self.ref_2node.get(nursery, None)
+        if nursery_node is None:
+            parent_task_node = self.ref_2node.get(nursery.parent_task, None)
+            if parent_task_node is None:
+                return []
+            nursery_node = self._attach(nursery, parent=parent_task_node)
+            inserted.append(nursery_node)
+        inserted.append(self._attach(task, parent=nursery_node))
+        return inserted
+
+    def purge_collected(self):
+        """Drop tasks which were garbage collected without exiting (weak mode)
+
+        Their subtrees are dropped silently since the names are already gone
+        """
+        if not self._collected:
+            return
+        while self._collected:
+            node = self._collected.popleft()
+            if node.parent is not None and node in node.parent.children:
+                node.parent.children.remove(node)
+                self._touch(node.parent)
+                node.parent = None
+            self._drop_subtree(node)
+
+    def _drop_subtree(self, node: DescNode):
+        for child in node.children:
+            self._drop_subtree(child)
+        node.children = []
+        ref = node.ref
+        if ref is not None:
+            self.ref_2node.pop(ref, None)
+            self._registry.registered.pop(ref, None)
+
+    def empty_nurseries(self, task: TrioTask) -> List[DescNode]:
+        """Nurseries of a task without any child left in the tree"""
+        task_node = self.ref_2node.get(task, None)
+        if task_node is None:
+            return []
+        return [n for n in task_node.children if len(n.children) == 0]
+
+    def closed_nurseries(self, task: TrioTask) -> List[DescNode]:
+        """Nodes of the nurseries of a task which are already closed
+
+        A nursery stays in the tree after its last child exited, since we
+        cannot tell whether the parent task would spawn into it again.
+        Once it's no longer listed in `task.child_nurseries`, it's closed.
+        """
+        empty = self.empty_nurseries(task)
+        if not empty:
+            return []
+        opened = task.child_nurseries
+        return [n for n in empty if n.ref is None or n.ref not in opened]
+
+    def check_consistency(
+        self,
+        root_task: TrioTask,
+        should_trace: Optional[Callable[[TrioTask], bool]] = None,
+    ):
+        """Compare the tree against a full rebuild from `root_task`
+
+        Walk through the whole Trio task graph, only meant for debugging
+        """
+        fresh = DescTree.build(root_task, registry=SCRegistry())
+
+        def parent_ref(node: DescNode) -> Optional[TrioNode]:
+            return node.parent.ref if node.parent is not None else None
+
+        for ref, node in self.ref_2node.items():
+            fresh_node = fresh.ref_2node.get(ref, None)
+            if fresh_node is None:
+                # closed nurseries are only dropped after the next step of their
+                # parent task
+                if parse_obj_type(ref) == TYPE_TRIO_NURSERY and not node.children:
+                    continue
+                raise RuntimeError(f"bug: stale node in tree: {node}")
+            if parent_ref(fresh_node) is not parent_ref(node):
+                raise RuntimeError(f"bug: wrong parent for node: {node}")
+
+        for ref, fresh_node in fresh.ref_2node.items():
+            if ref in self.ref_2node or parse_obj_type(ref) != TYPE_TRIO_TASK:
+                continue
+            if should_trace is not None and not should_trace(cast(TrioTask, ref)):
+                continue
+            # a task is missing if the task which opened its nursery is traced
+            nursery_node = fresh_node.parent
+            if nursery_node is None or nursery_node.parent is None:
+                continue
+            if nursery_node.parent.ref in self.ref_2node:
+                raise RuntimeError(f"bug: missing task in tree: {ref}")
+
     def __rich_console__(
-        self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
+        self, console: "Console", options: "ConsoleOptions"
+    ) -> "RenderResult":
         """Support Python `rich` lib"""
+        from rich.tree import Tree
+
         root = Tree("DescTree")
         self.root._rich_node(parent=root)
         yield root
 
+    def walk(self) -> Iterator[DescNode]:
+        """Every node of the tree, parents before their children"""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
     def get_parent_ref(self, target: TrioNode) -> Optional[TrioNode]:
         """Directly retrieve the parent nursery of a task"""
         node = self.ref_2node.get(target, None)
@@ -124,40 +299,69 @@ class DescTree:
             return node.parent.ref
         return None
 
+    def ancestry(self, target: TrioNode) -> List[TrioNode]:
+        """Path of refs from the root down to the target"""
+        path: List[TrioNode] = []
+        node = self.ref_2node.get(target, None)
+        while node is not None:
+            # a collected nursery has no child left, ancestors are alive
+            ref = node.ref
+            if ref is not None:
+                path.append(ref)
+            node = node.parent
+        path.reverse()
+        return path
+
     def ensure_node_in_tree(self, node: DescNode):
         if node != self._nodes[node.info.name]:
             raise RuntimeError(f"bug: node not exists in tree: {node}")
-        if self.ref_2node.get(node.ref, None) is None:
-            raise RuntimeError(f"bug: ref not exists in tree: {node.ref}")
+        ref = node.ref
+        if ref is not None and self.ref_2node.get(ref, None) is None:
+            raise RuntimeError(f"bug: ref not exists in tree: {ref}")
 
     def ensure_node_not_in_tree(self, node: DescNode):
         if node in self._nodes:
             raise RuntimeError(f"bug: node already exists in tree: {node}")
-        if self.ref_2node.get(node.ref, None) is not None:
-            raise RuntimeError(f"bug: ref already exists in tree: {node.ref}")
+        ref = node.ref
+        if ref is not None and self.ref_2node.get(ref, None) is not None:
+            raise RuntimeError(f"bug: ref already exists in tree: {ref}")
 
     def remove_ref(self, target: TrioNode):
         node = self.ref_2node.get(target, None)
         if node == None:
             raise RuntimeError("Bug: remove unexisting ref from registry")
-        node = cast(DescNode, node)
+        self.remove(cast(DescNode, node))
+
+    def remove(self, node: DescNode, unregister: bool = True):
+        """Remove a node without children, its ref may be collected already
+
+        Without `unregister` the registry keeps the name of the ref
+        """
         if len(node.children) > 0:
             raise RuntimeError("Child remains, cannot remove")
 
+        ref = node.ref
+        if ref is not None:
+            self.ref_2node.pop(ref)
+        self._nodes.pop(node.info.name, None)
+
         # remove node from its parent
         if node.parent:
             node.parent.children.remove(node)
+            self._touch(node.parent)
             node.parent = None
-        # remove node from registry
-        self._registry.remove(node.ref)
+        # remove node from registry, a collected ref is already gone
+        if ref is not None and unregister:
+            self._registry.remove(ref)
 
     def remove_node(self, node: DescNode):
         """Remove node and all of it's children from Desc tree,
         also break the link to it's parent"""
 
-        print(f"[remove] receive node: {node}")
         self.ensure_node_in_tree(node)
-        self.ref_2node.pop(node.ref)
+        ref = node.ref
+        if ref is not None:
+            self.ref_2node.pop(ref)
         self._nodes.pop(node.info.name)
 
         # unregister all children in the tree
@@ -173,4 +377,5 @@ class DescTree:
                 self.remove_node(node.parent)
             node.parent = None
 
-        self._registry.remove(node.ref)
+        if ref is not None:
+            self._registry.remove(ref)
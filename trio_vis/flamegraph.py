@@ -0,0 +1,160 @@
+import argparse
+from typing import IO, Dict, Iterable, List, Optional, Tuple
+
+from typing_extensions import Literal
+
+from .log_reader import iter_log_events
+from .registry import SCOPE_SUFFIX, base_name
+
+""" Export time spent per scope path as folded stacks
+
+    Each line is a scope path followed by its weight in microseconds, the
+    input of flamegraph.pl, speedscope, inferno, ...
+
+        main;nursery;do_job 1234
+
+    The path of a scope is rebuilt from the parent links in the log within
+    a single pass, only paths of live scopes are kept. Tasks (and nurseries)
+    spawned from the same coroutine are aggregated by dropping the serial
+    number from their names, so a run with 100k tasks stays readable.
+
+    Weights are the self time of each task, since consumers add the weight
+    of a path into every frame above it:
+    1. wall: lifetime of each task, minus the time any of its children was
+        alive. Concurrent children still make a parent wider than the time it
+        actually lived
+    2. cpu: time the task actually ran, the `runNs` field of exit events
+        (requires `VisConfig.time_task_steps`)
+"""
+
+Weight = Literal["wall", "cpu"]
+Path = Tuple[str, ...]
+
+
+class FoldedStacks:
+    def __init__(self, weight: Weight = "wall", aggregate: bool = True):
+        if weight not in ("wall", "cpu"):
+            raise ValueError(f"[trio-vis] unknown weight: {weight}")
+        self.weight: Weight = weight
+        self.aggregate: bool = aggregate
+
+        # folded path -> weight in ns
+        self.stacks: Dict[str, int] = {}
+        # live scope name -> its path
+        self.paths: Dict[str, Path] = {}
+        # live task name -> creation timestamp
+        self.started: Dict[str, int] = {}
+        # live scope or task -> the task it's in
+        self.owners: Dict[str, Optional[str]] = {}
+        # live task -> [live children, since when, time covered by children]
+        self.children: Dict[str, List[int]] = {}
+
+    def _frame(self, name: str) -> str:
+        return base_name(name) if self.aggregate else name
+
+    def _path_of(self, name: Optional[str]) -> Path:
+        return () if name is None else self.paths.get(name, ())
+
+    def _owner_of(self, parent: Optional[str]) -> Optional[str]:
+        if parent is not None and parent.endswith(SCOPE_SUFFIX):
+            # a nursery opened by the task
+            return parent[: -len(SCOPE_SUFFIX)]
+        return None if parent is None else self.owners.get(parent, None)
+
+    def add(self, event: Dict):
+        name: str = event["name"]
+        desc: str = event["desc"]
+        ts: int = event.get("ts", event["time"])
+        if desc == "created":
+            parent = event.get("parent", None)
+            if name.endswith(SCOPE_SUFFIX):
+                # replaced by the task path once the task is created
+                self.paths[name] = self._path_of(parent)
+                self.owners[name] = self._owner_of(parent)
+            elif event["type"] == "task":
+                task_path = self._path_of(parent) + (self._frame(name),)
+                self.paths[name] = self.paths[name + SCOPE_SUFFIX] = task_path
+                self.started[name] = ts
+                owner = self.owners[name] = self.owners.get(parent, None)
+                self._child_started(owner, ts)
+                self.children[name] = [0, 0, 0]
+            else:
+                self.paths[name] = self._path_of(parent) + (self._frame(name),)
+                self.owners[name] = self._owner_of(parent)
+        elif desc == "exited":
+            owner = self.owners.pop(name, None)
+            path = self.paths.pop(name, None)
+            started = self.started.pop(name, None)
+            if path is None or started is None:
+                return
+            covered = self._covered(name, ts)
+            self._child_exited(owner, ts)
+            if self.weight == "wall":
+                value = ts - started - covered
+            else:
+                value = event.get("runNs", 0)
+            if value > 0:
+                folded = ";".join(path)
+                self.stacks[folded] = self.stacks.get(folded, 0) + value
+
+    def _child_started(self, owner: Optional[str], ts: int):
+        stats = self.children.get(owner, None) if owner is not None else None
+        if stats is None:
+            return
+        if stats[0] == 0:
+            stats[1] = ts
+        stats[0] += 1
+
+    def _child_exited(self, owner: Optional[str], ts: int):
+        stats = self.children.get(owner, None) if owner is not None else None
+        if stats is None or stats[0] == 0:
+            return
+        stats[0] -= 1
+        if stats[0] == 0:
+            stats[2] += ts - stats[1]
+
+    def _covered(self, task: str, ts: int) -> int:
+        """Time any child of the task was alive, up to `ts`"""
+        live, since, covered = self.children.pop(task, (0, 0, 0))
+        return covered + (ts - since if live > 0 else 0)
+
+    def write(self, out: IO[str]):
+        for folded, value in sorted(self.stacks.items()):
+            out.write(f"{folded} {max(1, value // 1000)}\n")
+
+
+def fold_events(
+    events: Iterable[Dict], weight: Weight = "wall", aggregate: bool = True
+) -> FoldedStacks:
+    stacks = FoldedStacks(weight=weight, aggregate=aggregate)
+    for event in events:
+        stacks.add(event)
+    return stacks
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export time spent per scope path of a trio-vis log "
+        "as folded stacks for flamegraphs"
+    )
+    parser.add_argument("log_file", help="sc-vis log, NDJSON or binary log")
+    parser.add_argument("folded_file", nargs="?", default="./sc-stacks.folded")
+    parser.add_argument("--weight", choices=["wall", "cpu"], default="wall")
+    parser.add_argument(
+        "--no-aggregate",
+        action="store_true",
+        help="keep serial numbers, one frame per task",
+    )
+    args = parser.parse_args()
+
+    stacks = fold_events(
+        iter_log_events(args.log_file),
+        weight=args.weight,
+        aggregate=not args.no_aggregate,
+    )
+    with open(args.folded_file, "w") as out:
+        stacks.write(out)
+
+
+if __name__ == "__main__":
+    main()
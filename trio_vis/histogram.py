@@ -0,0 +1,86 @@
+from typing import Dict, List, Tuple
+
+""" HDR-style histogram
+
+    Values are bucketed log-linearly: every power-of-two range is split into
+    `2 ** sub_bucket_bits` equal sub-buckets, so the relative error of any
+    reported value is bounded (12.5% with the default 3 bits) while a few
+    hundred counters cover the whole 64-bit range.
+"""
+
+
+class Histogram:
+    def __init__(self, sub_bucket_bits: int = 3):
+        self.sub_bucket_bits: int = sub_bucket_bits
+        self.counts: List[int] = []
+        self.count: int = 0
+        self.total: int = 0
+        self.min: int = 0
+        self.max: int = 0
+
+    def index_of(self, value: int) -> int:
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        if shift <= 0:
+            return value
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def bounds_of(self, index: int) -> Tuple[int, int]:
+        """[lower, upper) values counted by a bucket"""
+        sub_buckets = 1 << self.sub_bucket_bits
+        if index < sub_buckets << 1:
+            return index, index + 1
+        shift = (index >> self.sub_bucket_bits) - 1
+        top = index - (shift << self.sub_bucket_bits)
+        return top << shift, (top + 1) << shift
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        index = self.index_of(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, pct: float) -> int:
+        """Highest value equivalent to the given percentile (0 - 100)"""
+        if self.count == 0:
+            return 0
+        target = max(1, int(self.count * pct / 100 + 0.5))
+        seen = 0
+        for index, nm in enumerate(self.counts):
+            seen += nm
+            if seen >= target:
+                return min(self.bounds_of(index)[1] - 1, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def buckets(self) -> List[Tuple[int, int]]:
+        """(lower bound, count) of every non-empty bucket"""
+        return [
+            (self.bounds_of(index)[0], nm)
+            for index, nm in enumerate(self.counts)
+            if nm > 0
+        ]
+
+    def as_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "buckets": self.buckets(),
+        }
@@ -0,0 +1,124 @@
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+from rich.console import RenderableType
+from rich.live import Live
+from rich.text import Text
+from rich.tree import Tree
+
+from .desc_tree import DescNode, DescTree
+from .registry import RegisteredSCInfo, base_name
+from .step_timer import perf_counter_ns
+
+""" Live terminal view of the task tree
+
+    Rendering the whole tree on every event is far slower than the traced
+    program itself. Instead, rich's `Live` redraws the tree at a fixed frame
+    rate from its own thread, while the instrument callbacks only update
+    the tree.
+
+    Sibling tasks of the same coroutine are collapsed into a single line with
+    a count. Rendered subtrees are cached by the version of their node, so
+    only subtrees that changed since the last frame are rendered again.
+"""
+
+
+class LiveTreeView:
+    def __init__(self, fps: float = 4.0):
+        self.fps: float = fps
+        self.tree: Optional[DescTree] = None
+        # latest message from the monitor
+        self.status: str = ""
+
+        self._cache: MutableMapping[DescNode, Tuple[int, Tree]] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._last_frame: RenderableType = Text("")
+        # time spent rendering, in the refresh thread
+        self.frames: int = 0
+        self.render_ns: int = 0
+        self._live: Optional[Live] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._live is not None
+
+    def start(self, tree: DescTree):
+        self.tree = tree
+        if self._live is None:
+            self._live = Live(
+                self, auto_refresh=True, refresh_per_second=self.fps, transient=False
+            )
+            self._live.start()
+
+    def stop(self):
+        if self._live is not None:
+            live, self._live = self._live, None
+            live.stop()
+
+    def __rich__(self) -> RenderableType:
+        """Called by the refresh thread of `Live`"""
+        with self._lock:
+            start = perf_counter_ns()
+            try:
+                frame = self.render()
+            except RuntimeError:
+                # the tree changed while walking it, show the last frame
+                frame = self._last_frame
+            self._last_frame = frame
+            self.frames += 1
+            self.render_ns += perf_counter_ns() - start
+            return frame
+
+    def render(self) -> RenderableType:
+        frame = Tree(f"DescTree [blue]{self.status}")
+        if self.tree is not None and self.tree.root is not None:
+            root = self._render_node(self.tree.root, count=1)
+            if root is not None:
+                frame.children.append(root)
+        return frame
+
+    def _info(self, node: DescNode) -> Optional[RegisteredSCInfo]:
+        # never register anything from this thread
+        if self.tree is None:
+            return None
+        return self.tree.registry.registered.get(node.ref, None)
+
+    def _render_node(self, node: DescNode, count: int) -> Optional[Tree]:
+        version = node.version
+        cached = self._cache.get(node, None)
+        if cached is not None and cached[0] == version and count == 1:
+            return cached[1]
+
+        info = self._info(node)
+        if info is None:
+            return None
+        if count > 1:
+            # collapsed siblings, their subtrees are not shown
+            return Tree(f"[yellow]{base_name(info.name)}[reset] x {count}")
+
+        tree = Tree(f"[yellow]{info.name}")
+        for child, nm in self._group_children(node):
+            rendered = self._render_node(child, count=nm)
+            if rendered is not None:
+                tree.children.append(rendered)
+        self._cache[node] = (version, tree)
+        return tree
+
+    def _group_children(self, node: DescNode) -> List[Tuple[DescNode, int]]:
+        """Group child tasks by coroutine name, in order of first appearance"""
+        groups: Dict[str, List] = OrderedDict()
+        for child in list(node.children):
+            info = self._info(child)
+            if info is None:
+                continue
+            key = base_name(info.name) if info.type == "task" else info.name
+            group = groups.get(key, None)
+            if group is None:
+                groups[key] = [child, 1]
+            else:
+                group[1] += 1
+        return [(child, nm) for child, nm in groups.values()]
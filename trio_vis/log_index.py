@@ -0,0 +1,131 @@
+import bisect
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, cast
+
+from .registry import SCOPE_SUFFIX
+
+""" Sidecar index of a sc-vis log
+
+    Written next to the log (`sc-logs.index.json`) by the sink producing
+    the log, filled record by record while the events are written, so no
+    second pass over the log is needed.
+
+    The index relies on the layout of `SCVisWriter`: one event per line.
+        scopes: name -> [offset of its created record, of its exited record]
+        times: [ts, offset] of the first event of every `intervalNs`
+    Offsets are in bytes from the start of the log file.
+"""
+
+INDEX_VERSION = 1
+
+
+def index_filename_of(log_filename: str) -> str:
+    return str(Path(log_filename).with_suffix(".index.json"))
+
+
+class LogIndexBuilder:
+    def __init__(self, interval_ns: int = 10_000_000):
+        self.interval_ns: int = interval_ns
+        self.scopes: Dict[str, List[Optional[int]]] = {}
+        self.times: List[Tuple[int, int]] = []
+        self.nm_events: int = 0
+        self._next_ts: int = 0
+
+    def add(self, event: Dict, offset: int):
+        """Called for each record written, in the order of the log"""
+        desc = event["desc"]
+        if desc == "created":
+            self.scopes[event["name"]] = [offset, None]
+        elif desc == "exited":
+            entry = self.scopes.get(event["name"], None)
+            if entry is not None:
+                entry[1] = offset
+        ts = event.get("ts", None)
+        if ts is not None and ts >= self._next_ts:
+            self.times.append((ts, offset))
+            self._next_ts = (ts // self.interval_ns + 1) * self.interval_ns
+        self.nm_events += 1
+
+    def write(self, log_filename: str) -> str:
+        filename = index_filename_of(log_filename)
+        index = {
+            "version": INDEX_VERSION,
+            "log": Path(log_filename).name,
+            "events": self.nm_events,
+            "intervalNs": self.interval_ns,
+            "scopes": self.scopes,
+            "times": self.times,
+        }
+        with open(filename, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        return filename
+
+
+class LogIndex:
+    """Jump into a sc-vis log through its index"""
+
+    def __init__(self, log_filename: str, index: Dict):
+        if index.get("version", None) != INDEX_VERSION:
+            raise ValueError(f"[trio-vis] unsupported log index: {log_filename}")
+        self.log_filename: str = log_filename
+        self.scopes: Dict[str, List[Optional[int]]] = index["scopes"]
+        self.times: List[List[int]] = index["times"]
+        self._time_keys: List[int] = [ts for ts, _ in self.times]
+
+    @classmethod
+    def load(cls, log_filename: str) -> Optional["LogIndex"]:
+        """The index of the log, None if there's none"""
+        filename = index_filename_of(log_filename)
+        if not Path(filename).exists():
+            return None
+        with open(filename, "r") as f:
+            return cls(log_filename, json.load(f))
+
+    def read(self, start: int, end: Optional[int] = None) -> Iterator[Dict]:
+        """Events from the record at `start` up to the one at `end`"""
+        with open(self.log_filename, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if end is not None and offset > end:
+                    return
+                offset += len(line)
+                record = line.rstrip(b",\r\n")
+                if record.startswith(b"]"):
+                    return
+                yield json.loads(record)
+
+    def subtree_range(self, name: str) -> Optional[Tuple[int, Optional[int]]]:
+        """Offsets of the first & last record of a scope, with its task scope"""
+        entries = [
+            self.scopes[n] for n in (name, name + SCOPE_SUFFIX) if n in self.scopes
+        ]
+        if not entries:
+            return None
+        start = min(cast(int, e[0]) for e in entries)
+        if any(e[1] is None for e in entries):
+            # still alive when the log was written
+            return start, None
+        return start, max(cast(int, e[1]) for e in entries)
+
+    def offset_at(self, ts: int) -> Optional[int]:
+        """Offset to start reading from to see every event since `ts`"""
+        if not self.times:
+            return None
+        i = bisect.bisect_right(self._time_keys, ts) - 1
+        return self.times[max(i, 0)][1]
+
+    def window(self, start_ns: int, end_ns: int) -> Iterator[Dict]:
+        """Events with a timestamp within [start_ns, end_ns]"""
+        offset = self.offset_at(start_ns)
+        if offset is None:
+            return
+        for event in self.read(offset):
+            ts = event.get("ts", None)
+            if ts is None:
+                continue
+            if ts > end_ns:
+                return
+            if ts >= start_ns:
+                yield event
@@ -0,0 +1,165 @@
+import json
+import re
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, Optional
+
+from typing_extensions import Literal
+
+""" Read events back from any of the log formats
+
+    1. *.bin: binary log (binary_log.py), read block by block
+    2. NDJSON: streamed events, read line by line
+    3. sc-vis log: a single JSON document, its `runRecords` are decoded one
+        event at a time, so memory stays bounded by the largest event
+
+    Files other than *.bin are told apart by their first bytes, NDJSON logs
+    start with an event while sc-vis logs start with a top-level key.
+"""
+
+LogFormat = Literal["binary", "ndjson", "sc-vis"]
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SEPARATOR = re.compile(r"[ \t\n\r]*,?[ \t\n\r]*")
+_SC_VIS_HEAD = re.compile(r'\s*\{\s*"(runRecords|config)"')
+
+
+def log_format(filename: str) -> LogFormat:
+    if Path(filename).suffix == ".bin":
+        return "binary"
+    if Path(filename).suffix == ".ndjson":
+        return "ndjson"
+    with open(filename, "r") as f:
+        head = f.read(64)
+    return "sc-vis" if _SC_VIS_HEAD.match(head) or not head.strip() else "ndjson"
+
+
+def iter_log_events(filename: str) -> Iterator[Dict]:
+    fmt = log_format(filename)
+    if fmt == "binary":
+        from .binary_log import BinaryLogReader
+
+        yield from BinaryLogReader(filename)
+    elif fmt == "ndjson":
+        with open(filename, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    else:
+        yield from SCVisLogReader(filename)
+
+
+class _JSONStream:
+    """Decode JSON values one after another from a file read in chunks"""
+
+    def __init__(self, f: IO[str], chunk_size: int):
+        self._file: IO[str] = f
+        self.chunk_size: int = chunk_size
+        self.text: str = ""
+        self.pos: int = 0
+        self.eof: bool = False
+        self._decode = json.JSONDecoder().raw_decode
+
+    def _fill(self) -> bool:
+        """Read the next chunk, drop what's consumed, False at the end"""
+        if self.eof:
+            return False
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next non-whitespace character, "" at the end"""
+        while True:
+            # both patterns match the empty string
+            match = _WHITESPACE.match(self.text, self.pos)
+            assert match is not None
+            self.pos = match.end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"[trio-vis] malformed log, expect {char!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number may continue in the next chunk
+            if end < len(self.text) or not self._fill():
+                self.pos = end
+                return value
+
+    def items(self) -> Iterator[Any]:
+        """Values of the array starting at the current position
+
+        The hot loop of reading a log
+        """
+        self.expect("[")
+        decode = self._decode
+        separator = _SEPARATOR.match
+        while True:
+            text = self.text
+            match = separator(text, self.pos)
+            assert match is not None
+            pos = match.end()
+            if pos < len(text) and text[pos] == "]":
+                self.pos = pos + 1
+                return
+            try:
+                value, end = decode(text, pos)
+            except json.JSONDecodeError:
+                # the value continues in the next chunk
+                self.pos = pos
+                if not self._fill():
+                    raise ValueError("[trio-vis] malformed log, truncated array")
+                continue
+            if end == len(text) and not self.eof:
+                self.pos = pos
+                self._fill()
+                continue
+            self.pos = end
+            yield value
+
+
+class SCVisLogReader:
+    """Stream the events of a sc-vis log without loading the whole document"""
+
+    def __init__(self, filename: str, chunk_size: int = 1 << 16):
+        self.filename: str = filename
+        self.chunk_size: int = chunk_size
+        # filled once the config is read, it may come after the events
+        self.config: Optional[Dict] = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        with open(self.filename, "r") as f:
+            stream = _JSONStream(f, self.chunk_size)
+            stream.expect("{")
+            while stream.peek() not in ("}", ""):
+                if stream.peek() == ",":
+                    stream.expect(",")
+                    continue
+                key = stream.value()
+                stream.expect(":")
+                if key != "runRecords":
+                    value = stream.value()
+                    if key == "config":
+                        self.config = value
+                    continue
+                yield from stream.items()
+
+    def __repr__(self):
+        return f"<SCVisLogReader: {self.filename}>"
@@ -0,0 +1,298 @@
+import json
+from abc import abstractmethod
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from typing_extensions import Protocol
+
+from .log_index import LogIndexBuilder
+
+if TYPE_CHECKING:
+    from .config import VisConfig
+
+""" Sinks for structured-concurrency events
+
+    A sink decides where the events produced by `SCLogger` go
+    1. MemorySink: keep every event, write the sc-vis file at once when closed
+    2. NDJSONSink: stream events into a newline-delimited JSON file in batches,
+        memory usage stays constant no matter how long the program runs
+    3. BinarySink (binary_log.py): compact binary records, converted to the
+        sc-vis format afterwards
+    4. RingBufferSink: flight recorder, only keep the latest events and dump
+        them on demand
+    5. ColumnarSink (columnar.py): keep events column-wise for analysis
+        after the run
+"""
+
+
+# (time, desc, ref, name, type, parent ref, parent name, extra, ts)
+RawEvent = Tuple
+
+
+class EventSink(Protocol):
+    """Sinks take encoded events, a sink with an `emit_raw(event: RawEvent)`
+    method is handed the raw events of `SCLogger` instead
+    """
+
+    @abstractmethod
+    def emit(self, event: Dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self, config: Dict):
+        """Flush all events and write the sc-vis log file"""
+        raise NotImplementedError
+
+
+class SCVisWriter:
+    """Write a sc-vis log event by event, one event per line
+
+    With an index builder, the offset of each record is handed to it as the
+    record is written (see log_index.py)
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        config: Optional[Dict] = None,
+        index: Optional[LogIndexBuilder] = None,
+    ):
+        self.filename: str = filename
+        self.index: Optional[LogIndexBuilder] = index
+        self._file: IO[bytes] = open(filename, "wb")
+        self._first: bool = True
+        self.offset: int = 0
+        if config is not None:
+            self._write(f'{{"config": {json.dumps(config)}, "runRecords": [\n')
+        else:
+            self._write('{"runRecords": [\n')
+
+    def _write(self, text: str):
+        data = text.encode()
+        self._file.write(data)
+        self.offset += len(data)
+
+    def write(self, record: str, event: Optional[Dict] = None):
+        """Write an encoded event, `event` saves decoding it for the index"""
+        if not self._first:
+            self._write(",\n")
+        self._first = False
+        if self.index is not None:
+            self.index.add(json.loads(record) if event is None else event, self.offset)
+        self._write(record)
+
+    def close(self, config: Optional[Dict] = None):
+        """`config` goes after the events if it wasn't given at first"""
+        if config is not None:
+            self._write(f'\n],\n"config": {json.dumps(config)}}}\n')
+        else:
+            self._write("\n]}\n")
+        self._file.close()
+        if self.index is not None:
+            self.index.write(self.filename)
+
+
+def write_sc_vis_log(
+    filename: str, config: Dict, events: List[Dict], index: bool = False
+):
+    writer = SCVisWriter(
+        filename, config=config, index=LogIndexBuilder() if index else None
+    )
+    for event in events:
+        writer.write(json.dumps(event), event)
+    writer.close()
+
+
+def ndjson_to_sc_vis(
+    ndjson_filename: str, log_filename: str, config: Dict, index: bool = False
+):
+    """Convert a NDJSON event stream to the sc-vis log format line by line"""
+    writer = SCVisWriter(
+        log_filename, config=config, index=LogIndexBuilder() if index else None
+    )
+    with open(ndjson_filename, "r") as src:
+        for line in src:
+            line = line.strip()
+            if line:
+                writer.write(line)
+    writer.close()
+
+
+def ndjson_filename_of(log_filename: str) -> str:
+    return str(Path(log_filename).with_suffix(".ndjson"))
+
+
+class MemorySink(EventSink):
+    """Keep all events in memory"""
+
+    def __init__(self, log_filename: str, index: bool = False):
+        self.log_filename: str = log_filename
+        self.index: bool = index
+        self.events: List[Dict] = []
+        self.closed: bool = False
+
+    def emit(self, event: Dict):
+        self.events.append(event)
+
+    def close(self, config: Dict):
+        if self.closed:
+            return
+        self.closed = True
+        write_sc_vis_log(self.log_filename, config, self.events, index=self.index)
+
+
+class NDJSONSink(EventSink):
+    """Stream events into a NDJSON file in fixed-size batches
+
+    The sc-vis log file is produced from the NDJSON file when closed
+    """
+
+    def __init__(
+        self,
+        log_filename: str,
+        batch_size: int = 1024,
+        ndjson_filename: Optional[str] = None,
+        index: bool = False,
+    ):
+        self.log_filename: str = log_filename
+        self.index: bool = index
+        self.ndjson_filename: str = (
+            ndjson_filename_of(log_filename)
+            if ndjson_filename is None
+            else ndjson_filename
+        )
+        self.batch_size: int = batch_size
+        self.batch: List[str] = []
+        self.closed: bool = False
+        self._file: IO[str] = open(self.ndjson_filename, "w")
+        self._encode = json.JSONEncoder(separators=(",", ":")).encode
+
+    def emit(self, event: Dict):
+        self.batch.append(self._encode(event))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.batch.append("")
+            self._file.write("\n".join(self.batch))
+            self.batch.clear()
+        self._file.flush()
+
+    def close(self, config: Dict):
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        self._file.close()
+        ndjson_to_sc_vis(
+            self.ndjson_filename, self.log_filename, config, index=self.index
+        )
+
+
+class RingBufferSink(EventSink):
+    """Flight recorder, keep the latest `capacity` events
+
+    Nothing is written when closed, call `dump` to write the buffered events.
+
+    Scopes created before the oldest buffered event but still alive are
+    tracked as well, their creation events are put in front of a dump so
+    the dumped history stays complete.
+    """
+
+    def __init__(self, log_filename: str, capacity: int = 65536, index: bool = False):
+        if capacity <= 0:
+            raise ValueError(f"[trio-vis] invalid ring buffer size: {capacity}")
+        self.log_filename: str = log_filename
+        self.capacity: int = capacity
+        self.index: bool = index
+        self.buffer: List[Optional[Dict]] = [None] * capacity
+        # next slot to write
+        self.pos: int = 0
+        # events ever recorded
+        self.recorded: int = 0
+        # creation events of live scopes evicted from the buffer
+        self.live: Dict[str, Dict] = {}
+
+    def emit(self, event: Dict):
+        pos = self.pos
+        evicted = self.buffer[pos]
+        if evicted is not None:
+            self._evict(evicted, self.live)
+        self.buffer[pos] = event
+        self.pos = pos + 1 if pos + 1 < self.capacity else 0
+        self.recorded += 1
+
+    @staticmethod
+    def _evict(event: Dict, live: Dict[str, Dict]):
+        if event["desc"] == "created":
+            live[event["name"]] = event
+        elif event["desc"] == "exited":
+            live.pop(event["name"], None)
+
+    def snapshot(self, max_age_ns: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Buffered events, oldest first, preceded by creations of live scopes
+
+        With `max_age_ns`, only events within that duration before the latest
+        event are kept. Return the events and the number of events left out
+        """
+        pos = self.pos
+        window = [e for e in self.buffer[pos:] + self.buffer[:pos] if e is not None]
+        live = self.live
+        if max_age_ns is not None and window and "ts" in window[-1]:
+            since = window[-1]["ts"] - max_age_ns
+            cut = 0
+            while cut < len(window) and window[cut].get("ts", since) < since:
+                cut += 1
+            if cut > 0:
+                live = dict(live)
+                for event in window[:cut]:
+                    self._evict(event, live)
+                window = window[cut:]
+        return list(live.values()) + window, self.recorded - len(window)
+
+    def dump(
+        self,
+        config: Dict,
+        filename: Optional[str] = None,
+        max_age_ns: Optional[int] = None,
+    ) -> str:
+        """Write the buffered events as a sc-vis log"""
+        events, left_out = self.snapshot(max_age_ns=max_age_ns)
+        config = dict(config)
+        config["flightRecorder"] = {
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "leftOut": left_out,
+        }
+        filename = self.log_filename if filename is None else filename
+        write_sc_vis_log(filename, config, events, index=self.index)
+        return filename
+
+    def close(self, config: Dict):
+        # only dumped on demand
+        pass
+
+
+def sink_from_config(cfg: "VisConfig") -> EventSink:
+    if cfg.flight_recorder:
+        return RingBufferSink(
+            cfg.log_filename, capacity=cfg.flight_recorder_size, index=cfg.log_index
+        )
+    if cfg.log_binary:
+        from .binary_log import BinarySink, binary_filename_of
+
+        return BinarySink(
+            binary_filename_of(cfg.log_filename),
+            batch_size=cfg.log_batch_size,
+            compression=cfg.log_compression,
+        )
+    if cfg.log_columnar:
+        from .columnar import ColumnarSink
+
+        return ColumnarSink(cfg.log_filename, index=cfg.log_index)
+    if cfg.log_streaming:
+        return NDJSONSink(
+            cfg.log_filename, batch_size=cfg.log_batch_size, index=cfg.log_index
+        )
+    return MemorySink(cfg.log_filename, index=cfg.log_index)
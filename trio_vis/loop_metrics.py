@@ -0,0 +1,88 @@
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional
+
+from .histogram import Histogram
+from .protocol import TrioLoopInstrument, TrioTask
+from .step_timer import perf_counter_ns
+
+if TYPE_CHECKING:
+    from .config import VisConfig
+
+""" Event loop metrics
+
+    An instrument used next to `SC_Monitor`, answering where the time of the
+    run goes rather than how scopes are structured
+    1. I/O wait: time trio spends blocked waiting for I/O or timeouts
+    2. Task steps: time spent running tasks
+    3. Scheduling latency: from a task being rescheduled to it actually running
+
+    A summary of the histograms is written next to the sc-vis log when the
+    run ends.
+"""
+
+
+def metrics_filename_of(log_filename: str) -> str:
+    return str(Path(log_filename).with_suffix(".metrics.json"))
+
+
+class LoopMetrics(TrioLoopInstrument):
+    def __init__(self, config: Optional["VisConfig"] = None):
+        if config is None:
+            from .config import VisConfig
+
+            config = VisConfig()
+        self.filename: Optional[str] = metrics_filename_of(config.log_filename)
+
+        self.io_wait = Histogram()
+        self.task_step = Histogram()
+        self.sched_latency = Histogram()
+
+        self.run_start: int = 0
+        self.run_ns: int = 0
+
+        # tasks rescheduled but not run yet
+        self._scheduled: Dict[TrioTask, int] = {}
+        self._io_wait_start: int = 0
+        self._step_start: int = 0
+
+    def before_run(self):
+        self.run_start = perf_counter_ns()
+
+    def after_run(self):
+        self.run_ns = perf_counter_ns() - self.run_start
+        self._scheduled.clear()
+        if self.filename is not None:
+            with open(self.filename, "w") as f:
+                json.dump(self.summary(), f, indent=4)
+
+    def before_io_wait(self, timeout: float):
+        self._io_wait_start = perf_counter_ns()
+
+    def after_io_wait(self, timeout: float):
+        self.io_wait.record(perf_counter_ns() - self._io_wait_start)
+
+    def task_scheduled(self, task: TrioTask):
+        self._scheduled[task] = perf_counter_ns()
+
+    def before_task_step(self, task: TrioTask):
+        now = self._step_start = perf_counter_ns()
+        scheduled = self._scheduled.pop(task, None)
+        if scheduled is not None:
+            self.sched_latency.record(now - scheduled)
+
+    def after_task_step(self, task: TrioTask):
+        self.task_step.record(perf_counter_ns() - self._step_start)
+
+    def task_exited(self, task: TrioTask):
+        self._scheduled.pop(task, None)
+
+    def summary(self) -> Dict:
+        return {
+            "runNs": self.run_ns,
+            "ioWaitNs": self.io_wait.total,
+            "taskRunNs": self.task_step.total,
+            "ioWait": self.io_wait.as_dict(),
+            "taskStep": self.task_step.as_dict(),
+            "schedLatency": self.sched_latency.as_dict(),
+        }
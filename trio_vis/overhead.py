@@ -0,0 +1,86 @@
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .step_timer import perf_counter_ns
+
+""" Measure the monitor itself
+
+    Callbacks are wrapped with a pair of clock reads adding to plain
+    counters, cheap next to the work done in any callback.
+    Nested measurements (logging, tree maintenance) are part of the callback
+    calling them, only top level callbacks add up to the monitor's time.
+"""
+
+
+class OverheadCounters:
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.ns: Dict[str, int] = {}
+        # span of the traced run
+        self.start_ns: Optional[int] = None
+        self.end_ns: Optional[int] = None
+        # when the top level callback running was entered
+        self.entered_ns: int = 0
+
+    def timed(self, name: str, fn: Callable, top_level: bool = False) -> Callable:
+        calls, total = self.calls, self.ns
+        calls.setdefault(name, 0)
+        total.setdefault(name, 0)
+        clock = perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            if top_level:
+                self.entered_ns = start
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                now = clock()
+                total[name] += now - start
+                calls[name] += 1
+                # the callback ending the run is part of it
+                if top_level and self.end_ns is not None:
+                    self.end_ns = now
+
+        return wrapper
+
+    def run_started(self):
+        """Called from a top level callback, the run starts when it's entered"""
+        self.start_ns = self.entered_ns
+        self.end_ns = None
+
+    def run_ended(self):
+        self.end_ns = perf_counter_ns()
+
+    def add(self, name: str, ns: int, calls: int = 1):
+        self.ns[name] = self.ns.get(name, 0) + ns
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def summary(self, top_level: Iterable[str]) -> Dict:
+        monitor_ns = sum(self.ns.get(name, 0) for name in top_level)
+        elapsed_ns = 0
+        if self.start_ns is not None:
+            end_ns = perf_counter_ns() if self.end_ns is None else self.end_ns
+            elapsed_ns = end_ns - self.start_ns
+        return {
+            "monitorNs": monitor_ns,
+            "elapsedNs": elapsed_ns,
+            # share of the run spent in the monitor
+            "share": monitor_ns / elapsed_ns if elapsed_ns else 0.0,
+            "callbacks": {
+                name: {"calls": self.calls[name], "ns": self.ns[name]}
+                for name in self.ns
+            },
+        }
+
+
+class TimedLogger:
+    """Count the time spent in the logging methods of a logger"""
+
+    def __init__(self, logger: Any, counters: OverheadCounters):
+        self._logger = logger
+        self.log_start = counters.timed("logging", logger.log_start)
+        self.log_exit = counters.timed("logging", logger.log_exit)
+        self.log_slow_step = counters.timed("logging", logger.log_slow_step)
+
+    def __getattr__(self, name: str):
+        return getattr(self._logger, name)
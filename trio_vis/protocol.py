@@ -1,4 +1,4 @@
-from typing import Coroutine, List
+from typing import Coroutine, List, Optional
 
 from typing_extensions import Protocol
 
@@ -10,6 +10,7 @@ class TrioNursery(Protocol):
     """Represent trio's internal `Nursery` type"""
 
     child_tasks: List["TrioTask"]
+    parent_task: "TrioTask"
 
 
 class TrioTask(Protocol):
@@ -17,6 +18,7 @@ class TrioTask(Protocol):
 
     name: str
     child_nurseries: List["TrioNursery"]
+    parent_nursery: Optional["TrioNursery"]
 
     # Internal object link to the coroutine
     coro: Coroutine
@@ -34,3 +36,36 @@ class TrioInstrument(Protocol):
 
     def task_spawned(self, task: TrioTask):
         pass
+
+
+class TrioStepInstrument(Protocol):
+    """Hooks called around every task step
+
+    Trio only calls the hooks an instrument defines, so these are attached
+    to an instrument only when needed, they're called very frequently
+    """
+
+    def before_task_step(self, task: TrioTask):
+        pass
+
+    def after_task_step(self, task: TrioTask):
+        pass
+
+
+class TrioLoopInstrument(TrioStepInstrument, Protocol):
+    """Hooks around the event loop itself"""
+
+    def before_run(self):
+        pass
+
+    def after_run(self):
+        pass
+
+    def before_io_wait(self, timeout: float):
+        pass
+
+    def after_io_wait(self, timeout: float):
+        pass
+
+    def task_scheduled(self, task: TrioTask):
+        pass
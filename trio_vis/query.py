@@ -0,0 +1,510 @@
+import argparse
+import heapq
+import json
+import sys
+from typing import IO, Dict, Iterable, List, Optional, Tuple, Union
+
+from .log_index import LogIndex
+from .log_reader import iter_log_events, log_format
+from .registry import SCOPE_SUFFIX
+from .task_outcome import NurseryOutcomes, format_outcomes
+
+""" Answer questions about a log in a single streaming pass
+
+    python -m trio_vis.query sc-logs.json longest -n 20
+    python -m trio_vis.query sc-logs.json concurrency --bucket-ms 100
+    python -m trio_vis.query sc-logs.json fanout
+    python -m trio_vis.query sc-logs.json subtree do_job-3
+    python -m trio_vis.query sc-logs.json window 120 150
+    python -m trio_vis.query sc-logs.json outcomes
+    python -m trio_vis.query sc-logs.json critical-path -n 5
+
+    Every query only keeps state for scopes which are still alive at the
+    current point of the log, plus its (bounded) result, so memory doesn't
+    grow with the size of the log.
+
+    Scopes wrapping a task (`SCOPE_SUFFIX`) live exactly as long as their
+    task, they are left out of the results.
+
+    `subtree` and `window` jump right to the events they need if the log
+    has an index (`VisConfig.log_index`), otherwise they scan the log.
+"""
+
+
+def event_ts(event: Dict) -> int:
+    """Timestamp in ns, logs without timestamps fall back to the event order"""
+    return event.get("ts", event["time"])
+
+
+def is_task_scope(name: str) -> bool:
+    return name.endswith(SCOPE_SUFFIX)
+
+
+class LongestScopes:
+    """Top-N longest lived tasks and nurseries"""
+
+    def __init__(self, n: int = 10):
+        self.n: int = n
+        # live scope -> (creation ts, type)
+        self.started: Dict[str, Tuple[int, str]] = {}
+        # min-heap of (duration, name, type, start)
+        self.longest: List[Tuple[int, str, str, int]] = []
+
+    def add(self, event: Dict):
+        name = event["name"]
+        if is_task_scope(name):
+            return
+        if event["desc"] == "created":
+            self.started[name] = (event_ts(event), event["type"])
+        elif event["desc"] == "exited":
+            started = self.started.pop(name, None)
+            if started is None:
+                return
+            entry = (event_ts(event) - started[0], name, started[1], started[0])
+            if len(self.longest) < self.n:
+                heapq.heappush(self.longest, entry)
+            elif entry > self.longest[0]:
+                heapq.heapreplace(self.longest, entry)
+
+    def result(self) -> List[Dict]:
+        return [
+            {"name": name, "type": type, "startNs": start, "durationNs": duration}
+            for duration, name, type, start in sorted(self.longest, reverse=True)
+        ]
+
+    def lines(self) -> List[str]:
+        return [
+            f"{r['durationNs'] / 1e6:12.3f} ms  {r['name']} ({r['type']})"
+            for r in self.result()
+        ]
+
+
+class Concurrency:
+    """Number of live tasks over time, the max within each time bucket
+
+    Memory grows with the duration of the run over the bucket size
+    """
+
+    def __init__(self, bucket_ns: int = 10_000_000):
+        self.bucket_ns: int = bucket_ns
+        self.live: int = 0
+        self.peak: int = 0
+        self.peak_ts: Optional[int] = None
+        # bucket index -> max live tasks
+        self.buckets: Dict[int, int] = {}
+        self._last_bucket: Optional[int] = None
+
+    def add(self, event: Dict):
+        if event["type"] != "task" or is_task_scope(event["name"]):
+            return
+        if event["desc"] not in ("created", "exited"):
+            return
+        ts = event_ts(event)
+        bucket = ts // self.bucket_ns
+        last = self._last_bucket
+        if last is None or bucket > last:
+            # buckets in between had the count left by the last event
+            start = bucket if last is None else last + 1
+            for idle in range(start, bucket + 1):
+                self.buckets[idle] = max(self.buckets.get(idle, 0), self.live)
+            self._last_bucket = bucket
+
+        if event["desc"] == "created":
+            self.live += 1
+        else:
+            self.live = max(0, self.live - 1)
+        self.buckets[bucket] = max(self.buckets.get(bucket, 0), self.live)
+        if self.live > self.peak:
+            self.peak, self.peak_ts = self.live, ts
+
+    def result(self) -> Dict:
+        return {
+            "peak": self.peak,
+            "peakNs": self.peak_ts,
+            "bucketNs": self.bucket_ns,
+            "series": [
+                [bucket * self.bucket_ns, live]
+                for bucket, live in sorted(self.buckets.items())
+            ],
+        }
+
+    def lines(self) -> List[str]:
+        result = self.result()
+        if result["peakNs"] is None:
+            return ["no tasks"]
+        lines = [f"peak: {result['peak']} tasks at {result['peakNs'] / 1e6:.3f} ms"]
+        for start, live in result["series"]:
+            lines.append(f"{start / 1e6:12.3f} ms  {live}")
+        return lines
+
+
+class FanOut:
+    """Nurseries which spawned the most tasks"""
+
+    def __init__(self, n: int = 10):
+        self.n: int = n
+        # live nursery -> [spawned, live, max live, parent task]
+        self.nurseries: Dict[str, List] = {}
+        # min-heap of (spawned, max live, name, parent task)
+        self.largest: List[Tuple[int, int, str, Optional[str]]] = []
+
+    def add(self, event: Dict):
+        name, desc = event["name"], event["desc"]
+        parent = event.get("parent", None)
+        if is_task_scope(name):
+            stats = self.nurseries.get(parent, None) if parent is not None else None
+            if stats is None:
+                return
+            if desc == "created":
+                stats[0] += 1
+                stats[1] += 1
+                stats[2] = max(stats[2], stats[1])
+            elif desc == "exited":
+                stats[1] -= 1
+        elif event["type"] == "scope":
+            if desc == "created":
+                owner = parent[: -len(SCOPE_SUFFIX)] if parent else None
+                self.nurseries[name] = [0, 0, 0, owner]
+            elif desc == "exited" and name in self.nurseries:
+                self._finish(name)
+
+    def _finish(self, name: str):
+        spawned, _, max_live, owner = self.nurseries.pop(name)
+        entry = (spawned, max_live, name, owner)
+        if len(self.largest) < self.n:
+            heapq.heappush(self.largest, entry)
+        elif entry[:3] > self.largest[0][:3]:
+            heapq.heapreplace(self.largest, entry)
+
+    def result(self) -> List[Dict]:
+        # nurseries still open when the log ends
+        for name in list(self.nurseries):
+            self._finish(name)
+        return [
+            {"name": name, "task": owner, "spawned": spawned, "maxConcurrent": most}
+            for spawned, most, name, owner in sorted(
+                self.largest, key=lambda e: e[:3], reverse=True
+            )
+        ]
+
+    def lines(self) -> List[str]:
+        return [
+            f"{r['spawned']:>10} spawned  {r['maxConcurrent']:>10} at once"
+            f"  {r['name']} (in {r['task']})"
+            for r in self.result()
+        ]
+
+
+class Subtree:
+    """Events of a scope and everything below it"""
+
+    def __init__(self, name: str):
+        self.roots = {name, name + SCOPE_SUFFIX}
+        # live scopes in the subtree
+        self.members: set = set()
+
+    def add(self, event: Dict) -> bool:
+        """Whether the event belongs to the subtree"""
+        name = event["name"]
+        if event["desc"] == "created":
+            if name in self.roots or event.get("parent", None) in self.members:
+                self.members.add(name)
+                return True
+            return False
+        if name not in self.members:
+            return False
+        if event["desc"] == "exited":
+            self.members.discard(name)
+        return True
+
+
+class Outcomes:
+    """Cancelled & errored tasks by nursery"""
+
+    def __init__(self):
+        self.outcomes: NurseryOutcomes = NurseryOutcomes()
+        # live scope wrapping a task -> its nursery
+        self.nursery_of: Dict[str, str] = {}
+
+    def add(self, event: Dict):
+        name, desc = event["name"], event["desc"]
+        parent = event.get("parent", None)
+        if is_task_scope(name):
+            if desc == "created" and parent is not None:
+                self.nursery_of[name] = parent
+            elif desc == "exited":
+                self.nursery_of.pop(name, None)
+        elif desc == "exited" and event["type"] == "task":
+            nursery = self.nursery_of.get(parent, None)
+            if nursery is not None:
+                self.outcomes.record(nursery, event, event_ts(event))
+        elif desc == "exited":
+            self.outcomes.close(name)
+
+    def result(self) -> Dict:
+        return self.outcomes.summary()
+
+    def lines(self) -> List[str]:
+        return format_outcomes(self.result()) or ["no cancelled or errored tasks"]
+
+
+# (name, type, start, end) of a scope on a critical path, then the rest of the
+# path below it. Paths share their tails, a nursery only links the path of its
+# slowest child
+Hop = Tuple[str, str, int, Optional[int]]
+Path = Optional[Tuple[Hop, "Path"]]
+
+
+def path_hops(path: Path) -> List[Dict]:
+    hops = []
+    while path is not None:
+        (name, type, start, end), path = path
+        hops.append({"name": name, "type": type, "startNs": start, "endNs": end})
+    return hops
+
+
+class CriticalPath:
+    """Chain of scopes which bounded the duration of the root & each nursery
+
+    A nursery exits once its last child did, the path goes from a nursery to
+    its child exiting last, then to the nursery of that task exiting last,
+    and so on. The slack of a child is how much later it could have exited
+    without delaying its nursery.
+
+    Each scope is visited once when it exits, the `n` longest nurseries are
+    kept with the slack of their children.
+    """
+
+    def __init__(self, n: int = 10):
+        self.n: int = n
+        # live scope wrapping a task -> its nursery
+        self.nursery_of: Dict[str, Optional[str]] = {}
+        # live task -> [start, nursery, end of its last nursery, path of it]
+        self.tasks: Dict[str, List] = {}
+        # live nursery -> [start, task, {child: end}, end of last child, path]
+        self.nurseries: Dict[str, List] = {}
+        # min-heap of (duration, name, task, start, slack by child, path)
+        self.longest: List[Tuple[int, str, Optional[str], int, Dict, Path]] = []
+        # the root task exiting last
+        self.root_end: int = -1
+        self.root_path: Path = None
+
+    def add(self, event: Dict):
+        name, desc = event["name"], event["desc"]
+        parent = event.get("parent", None)
+        if is_task_scope(name):
+            if desc == "created":
+                self.nursery_of[name] = parent
+            elif desc == "exited":
+                self.nursery_of.pop(name, None)
+        elif event["type"] == "task":
+            if desc == "created":
+                nursery = self.nursery_of.get(parent, None)
+                self.tasks[name] = [event_ts(event), nursery, -1, None]
+            elif desc == "exited" and name in self.tasks:
+                self._task_exited(name, event_ts(event))
+        elif desc == "created":
+            owner = parent[: -len(SCOPE_SUFFIX)] if parent else None
+            self.nurseries[name] = [event_ts(event), owner, {}, -1, None]
+        elif desc == "exited" and name in self.nurseries:
+            self._nursery_exited(name, event_ts(event))
+
+    def _task_exited(self, name: str, end: int):
+        start, nursery, _, below = self.tasks.pop(name)
+        path: Path = ((name, "task", start, end), below)
+        stats = self.nurseries.get(nursery, None) if nursery is not None else None
+        if stats is None:
+            if nursery is None and end >= self.root_end:
+                self.root_end, self.root_path = end, path
+            return
+        stats[2][name] = end
+        if end >= stats[3]:
+            stats[3], stats[4] = end, path
+
+    def _nursery_exited(self, name: str, end: int):
+        start, owner, children, last_end, below = self.nurseries.pop(name)
+        # the exit is logged a bit after the last child's, at the next step of
+        # the owner, the nursery is bounded by that child
+        bound = last_end if children else end
+        path: Path = ((name, "nursery", start, bound), below)
+        task = self.tasks.get(owner, None) if owner is not None else None
+        if task is not None and bound >= task[2]:
+            task[2], task[3] = bound, path
+
+        entry = (end - start, name, owner, start, children, path)
+        if len(self.longest) < self.n:
+            heapq.heappush(self.longest, entry)
+        elif entry[:2] > self.longest[0][:2]:
+            heapq.heapreplace(self.longest, entry)
+        else:
+            return
+        # only the kept nurseries pay for their slack
+        for child, child_end in children.items():
+            children[child] = bound - child_end
+
+    def result(self) -> Dict:
+        root = self.root_path
+        if root is None:
+            # the log ends before the root task exits
+            live = [n for n, t in self.tasks.items() if t[1] is None]
+            if live:
+                start, _, _, below = self.tasks[live[0]]
+                root = ((live[0], "task", start, None), below)
+        return {
+            "root": path_hops(root),
+            "nurseries": [
+                {
+                    "name": name,
+                    "task": owner,
+                    "startNs": start,
+                    "durationNs": duration,
+                    "criticalPath": path_hops(path)[1:],
+                    "slackNs": dict(sorted(slack.items(), key=lambda s: s[1])),
+                }
+                for duration, name, owner, start, slack, path in sorted(
+                    self.longest, key=lambda e: e[:2], reverse=True
+                )
+            ],
+        }
+
+    def lines(self) -> List[str]:
+        result = self.result()
+        if not result["root"]:
+            return ["no root task"]
+        lines = ["critical path:"]
+        for hop in result["root"]:
+            end = "..." if hop["endNs"] is None else f"{hop['endNs'] / 1e6:.3f}"
+            lines.append(
+                f"{hop['startNs'] / 1e6:12.3f} -> {end:>12} ms"
+                f"  {hop['name']} ({hop['type']})"
+            )
+        for nursery in result["nurseries"]:
+            lines.append("")
+            lines.append(
+                f"{nursery['name']} (in {nursery['task']})"
+                f" {nursery['durationNs'] / 1e6:.3f} ms: "
+                + (
+                    " -> ".join(hop["name"] for hop in nursery["criticalPath"])
+                    or "no children"
+                )
+            )
+            slack = list(nursery["slackNs"].items())
+            for child, ns in slack[:5]:
+                lines.append(f"{ns / 1e6:12.3f} ms slack  {child}")
+            if len(slack) > 5:
+                lines.append(f"{'':>12}    ... {len(slack) - 5} more")
+        return lines
+
+
+Query = Union[LongestScopes, Concurrency, FanOut, CriticalPath, Outcomes]
+
+
+def run_query(query: Query, events: Iterable[Dict]):
+    for event in events:
+        query.add(event)
+    return query
+
+
+def load_index(log_filename: str) -> Optional[LogIndex]:
+    if log_format(log_filename) != "sc-vis":
+        return None
+    return LogIndex.load(log_filename)
+
+
+def subtree_events(log_filename: str, name: str) -> Iterable[Dict]:
+    """Events which may belong to the subtree, only its span with an index"""
+    index = load_index(log_filename)
+    if index is None:
+        return iter_log_events(log_filename)
+    span = index.subtree_range(name)
+    return () if span is None else index.read(*span)
+
+
+def window_events(log_filename: str, start_ns: int, end_ns: int) -> Iterable[Dict]:
+    index = load_index(log_filename)
+    if index is not None:
+        return index.window(start_ns, end_ns)
+    return (
+        e
+        for e in iter_log_events(log_filename)
+        if start_ns <= e.get("ts", -1) <= end_ns
+    )
+
+
+def write_events(events: Iterable[Dict], out: IO[str]) -> int:
+    """Write events as NDJSON, return the number of events"""
+    count = 0
+    for event in events:
+        out.write(json.dumps(event))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def write_subtree(name: str, events: Iterable[Dict], out: IO[str]) -> int:
+    """Write events of the subtree as NDJSON, return the number of events"""
+    subtree = Subtree(name)
+    return write_events((e for e in events if subtree.add(e)), out)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Query a trio-vis log in a single streaming pass"
+    )
+    parser.add_argument("log_file", help="sc-vis log, NDJSON or binary log")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    queries = parser.add_subparsers(dest="query")
+    # not a keyword argument before Python 3.7
+    queries.required = True
+
+    longest = queries.add_parser("longest", help="longest lived tasks & nurseries")
+    longest.add_argument("-n", type=int, default=10)
+    concurrency = queries.add_parser("concurrency", help="live tasks over time")
+    concurrency.add_argument("--bucket-ms", type=float, default=10.0)
+    fanout = queries.add_parser("fanout", help="tasks spawned per nursery")
+    fanout.add_argument("-n", type=int, default=10)
+    subtree = queries.add_parser("subtree", help="events below a scope, as NDJSON")
+    subtree.add_argument("name", help="name of a task or nursery, e.g. do_job-3")
+    window = queries.add_parser("window", help="events in a time range, as NDJSON")
+    window.add_argument("start_ms", type=float)
+    window.add_argument("end_ms", type=float)
+    queries.add_parser("outcomes", help="cancelled & errored tasks per nursery")
+    critical = queries.add_parser(
+        "critical-path", help="scopes bounding the run & each nursery, with slack"
+    )
+    critical.add_argument("-n", type=int, default=10, help="longest nurseries")
+    args = parser.parse_args(argv)
+
+    if args.query == "subtree":
+        write_subtree(args.name, subtree_events(args.log_file, args.name), sys.stdout)
+        return
+    if args.query == "window":
+        start_ns, end_ns = int(args.start_ms * 1e6), int(args.end_ms * 1e6)
+        write_events(window_events(args.log_file, start_ns, end_ns), sys.stdout)
+        return
+
+    events = iter_log_events(args.log_file)
+
+    query: Query
+    if args.query == "longest":
+        query = LongestScopes(n=args.n)
+    elif args.query == "concurrency":
+        query = Concurrency(bucket_ns=max(1, int(args.bucket_ms * 1e6)))
+    elif args.query == "fanout":
+        query = FanOut(n=args.n)
+    elif args.query == "critical-path":
+        query = CriticalPath(n=args.n)
+    else:
+        query = Outcomes()
+    run_query(query, events)
+
+    if args.json:
+        json.dump(query.result(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for line in query.lines():
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
+import weakref
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import Any, Dict, Optional, Union, cast
+from typing import Any, Dict, MutableMapping, Optional, Union, cast
 
+import attr
 from typing_extensions import Literal
 
 from .protocol import TrioNursery, TrioTask
@@ -36,24 +37,60 @@ def parse_obj_type(object):
     return TYPE_UNKOWN
 
 
-# TODO: slotted? freezed?
-@dataclass
+# Suffix for the name of the scope wrapping a task
+SCOPE_SUFFIX = "__TRIO_VIS_Tscope"
+
+
+def base_name(name: str) -> str:
+    """Name without its serial number, "do_job-3" -> "do_job" """
+    base, sep, serial = name.rpartition("-")
+    return base if sep and serial.isdigit() else name
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
 class RegisteredSCInfo:
-    """Store Information about a scope-like object (Task, Nursery)"""
+    """Store Information about a scope-like object (Task, Nursery)
+
+    `id` is given at registration and never reused. Events refer to scopes by
+    integer refs: `ref` for the object itself, `scope_ref` for the scope
+    wrapping a task, names are only looked up when events are encoded. That's
+    in the writer thread with `log_in_background`, else right as they're logged
+    """
 
+    id: int
     name: str
     serial_num: Optional[int]
     type: Literal["nursery", "task"]
+    # name of the scope wrapping a task, computed once at registration
+    scope_name: Optional[str] = None
+
+    @property
+    def ref(self) -> int:
+        return self.id << 1
+
+    @property
+    def scope_ref(self) -> int:
+        if self.type != "task":
+            raise RuntimeError("Can only call this method with task object")
+        return (self.id << 1) | 1
 
     @classmethod
-    def from_task(cls, task: TrioTask, serial_num: SerialNumberGen):
+    def from_task(cls, task: TrioTask, serial_num: SerialNumberGen, sc_id: int):
         task_name: str = task.coro.cr_code.co_name
         num = serial_num.draw(task_name)
         name = f"{task_name}-{num}"
-        return cls(name=name, serial_num=num, type="task")
+        return cls(
+            id=sc_id,
+            name=name,
+            serial_num=num,
+            type="task",
+            scope_name=f"{name}{SCOPE_SUFFIX}",
+        )
 
     @classmethod
-    def from_nursery(cls, _nursery: TrioNursery, serial_num: SerialNumberGen):
+    def from_nursery(
+        cls, _nursery: TrioNursery, serial_num: SerialNumberGen, sc_id: int
+    ):
         # TODO: parse from more specific info
         num = serial_num.draw("nursery")
 
@@ -62,7 +99,7 @@ class RegisteredSCInfo:
             name = self_defined_name
         else:
             name = f"nursery-{num}"
-        return cls(name=name, serial_num=num, type="nursery")
+        return cls(id=sc_id, name=name, serial_num=num, type="nursery")
 
 
 class SCRegistry:
@@ -72,11 +109,20 @@ class SCRegistry:
     inside the registry
 
     here we would register Trio's Task/Nursery object
+
+    With `weak` set, objects are only weakly referenced so their entries are
+    dropped once Trio releases them, even if we never see them exit
     """
 
-    def __init__(self):
+    def __init__(self, weak: bool = False):
         self.serial_drawer = SerialNumberGen()
-        self.registered: Dict[Any, RegisteredSCInfo] = {}
+        self.next_id: int = 0
+        self.weak: bool = weak
+        self.registered: MutableMapping[Any, RegisteredSCInfo]
+        if weak:
+            self.registered = weakref.WeakKeyDictionary()
+        else:
+            self.registered = {}
 
     def get_name(self, obj: Union[TrioTask, TrioNursery]):
         if obj in self.registered:
@@ -93,13 +139,16 @@ class SCRegistry:
         obj_type = parse_obj_type(obj)
         info: RegisteredSCInfo
         if obj_type is TYPE_TRIO_TASK:
-            info = RegisteredSCInfo.from_task(cast(TrioTask, obj), self.serial_drawer)
+            info = RegisteredSCInfo.from_task(
+                cast(TrioTask, obj), self.serial_drawer, self.next_id
+            )
         elif obj_type is TYPE_TRIO_NURSERY:
             info = RegisteredSCInfo.from_nursery(
-                cast(TrioNursery, obj), self.serial_drawer
+                cast(TrioNursery, obj), self.serial_drawer, self.next_id
             )
         else:
             raise RuntimeError("[registry] Unkown type")
+        self.next_id += 1
         self.registered[obj] = info
         return info
 
@@ -0,0 +1,100 @@
+import random
+import zlib
+from typing import TYPE_CHECKING, Dict, Optional
+
+from typing_extensions import Literal
+
+from .protocol import TrioTask
+from .slow_step import RateLimiter
+
+if TYPE_CHECKING:
+    from .config import VisConfig
+
+""" Trace only a fraction of the subtrees
+
+    Whether to trace is decided once for every child of the root task, the
+    whole subtree of a child follows its decision.
+
+    1. random: trace with probability `rate`
+    2. hash: trace if the hash of the coroutine name and its spawn index
+        falls below `rate`, so the same subtrees are traced in every run
+    3. `max_per_sec_per_name` caps traced subtrees of each coroutine name
+
+    Counts of seen & traced subtrees per coroutine name are kept, so that
+    counts in the log can be scaled back.
+"""
+
+SampleMode = Literal["random", "hash"]
+
+HASH_RANGE = 1 << 32
+
+
+class SamplingPolicy:
+    def __init__(
+        self,
+        mode: Optional[SampleMode] = None,
+        rate: float = 1.0,
+        max_per_sec_per_name: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        if mode not in (None, "random", "hash"):
+            raise ValueError(f"[trio-vis] unknown sampling mode: {mode}")
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError(f"[trio-vis] sampling rate out of range: {rate}")
+        self.mode: Optional[SampleMode] = mode
+        self.rate: float = rate
+        self.max_per_sec_per_name: Optional[float] = max_per_sec_per_name
+        self._random = random.Random(seed)
+        self._threshold: int = int(rate * HASH_RANGE)
+        self._limiters: Dict[str, RateLimiter] = {}
+
+        # coroutine name -> subtrees seen / traced
+        self.seen: Dict[str, int] = {}
+        self.traced: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, cfg: "VisConfig") -> Optional["SamplingPolicy"]:
+        if cfg.sample_mode is None and cfg.sample_max_per_sec_per_name is None:
+            return None
+        return cls(
+            mode=cfg.sample_mode,
+            rate=cfg.sample_rate,
+            max_per_sec_per_name=cfg.sample_max_per_sec_per_name,
+            seed=cfg.sample_seed,
+        )
+
+    def should_trace(self, task: TrioTask) -> bool:
+        name = task.coro.cr_code.co_name
+        index = self.seen.get(name, 0)
+        self.seen[name] = index + 1
+
+        if self.mode == "random":
+            sampled = self._random.random() < self.rate
+        elif self.mode == "hash":
+            sampled = zlib.crc32(f"{name}-{index}".encode()) < self._threshold
+        else:
+            sampled = True
+
+        if sampled and self.max_per_sec_per_name is not None:
+            limiter = self._limiters.get(name, None)
+            if limiter is None:
+                limiter = self._limiters[name] = RateLimiter(self.max_per_sec_per_name)
+            sampled = limiter.allow()
+
+        if sampled:
+            self.traced[name] = self.traced.get(name, 0) + 1
+        return sampled
+
+    def summary(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "rate": self.rate,
+            "maxPerSecPerName": self.max_per_sec_per_name,
+            "seen": self.seen,
+            "traced": self.traced,
+            # observed ratio, to scale counts in the log back
+            "ratios": {
+                name: self.traced.get(name, 0) / seen
+                for name, seen in self.seen.items()
+            },
+        }
@@ -1,23 +1,54 @@
 # Logger for structure-concurrent events
 import atexit
+import heapq
 import json
 from abc import abstractmethod
-from typing import Dict, List, Optional, cast
+from typing import Callable, Dict, List, Optional, Tuple, Union, cast
 
 import attr
 from typing_extensions import Protocol
 
+from .bg_writer import BackgroundWriter
 from .desc_tree import TrioNode
-from .registry import RegisteredSCInfo, SCRegistry
+from .log_sink import EventSink, MemorySink, RawEvent, RingBufferSink
+from .registry import RegisteredSCInfo, SCRegistry, base_name
+from .step_timer import perf_counter_ns
+from .task_outcome import NurseryOutcomes
+
+# A scope, or its registered info once trio released it (a closed nursery)
+LogTarget = Union[TrioNode, RegisteredSCInfo]
 
 
 class Logger(Protocol):
     @abstractmethod
-    def log_start(self, child: TrioNode, parent: Optional[TrioNode]):
+    def log_start(
+        self, child: TrioNode, parent: Optional[TrioNode], extra: Optional[Dict] = None
+    ):
+        """`extra` holds additional fields for the event of the task or nursery,
+        not for the scope wrapping a task"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def log_exit(
+        self, child: LogTarget, parent: Optional[TrioNode], extra: Optional[Dict] = None
+    ):
+        """`extra` is the same as in `log_start`"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def log_slow_step(self, task: TrioNode, extra: Dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_config_source(self, source: Callable[[], Dict]):
+        """`source` gives additional fields of the log config"""
         raise NotImplementedError
 
     @abstractmethod
-    def log_exit(self, child: TrioNode, parent: Optional[TrioNode]):
+    def dump(
+        self, filename: Optional[str] = None, max_age_ns: Optional[int] = None
+    ) -> str:
+        """Write the events kept by a flight recorder"""
         raise NotImplementedError
 
 
@@ -34,58 +65,230 @@ class SCEvent:
         return {k: v for k, v in attr.asdict(self).items() if v is not None}
 
 
+class NameTable:
+    """Map scope refs to names for encoding events
+
+    Only used by the Trio thread while logging, raw events carry the names
+    they refer to, so whoever encodes them (possibly the writer thread) never
+    reads the table. A name is dropped once the exit event of its scope is
+    emitted, since nothing refers to it afterwards.
+    """
+
+    def __init__(self):
+        self.names: Dict[int, str] = {}
+        self.durations: ScopeDurations = ScopeDurations()
+
+    def add(self, info: RegisteredSCInfo):
+        self.names[info.ref] = info.name
+        if info.scope_name is not None:
+            self.names[info.scope_ref] = info.scope_name
+
+    def raw_event(
+        self,
+        time: int,
+        desc: str,
+        ref: int,
+        type: str,
+        parent: Optional[int],
+        extra: Optional[Dict],
+        ts: int,
+    ) -> RawEvent:
+        """Pick the names of an event, on the Trio thread"""
+        names = self.names
+        name = names[ref]
+        parent_name = None if parent is None else names[parent]
+        if desc == "exited":
+            del names[ref]
+        return (time, desc, ref, name, type, parent, parent_name, extra, ts)
+
+    def track(self, event: RawEvent):
+        """Add a raw event to the scope durations, by whoever writes it"""
+        desc = event[1]
+        if desc == "created":
+            self.durations.start(event[2], event[-1])
+        elif desc == "exited":
+            self.durations.stop(event[2], event[3], event[-1])
+
+    def encode(self, event: RawEvent) -> Dict:
+        """Encode a raw event, the fields of `SCEvent` then `ts` & the extra ones"""
+        self.track(event)
+        time, desc, _, name, type, _, parent_name, extra, ts = event
+        encoded = {"time": time, "desc": desc, "name": name, "type": type}
+        if parent_name is not None:
+            encoded["parent"] = parent_name
+        encoded["ts"] = ts
+        if extra is not None:
+            encoded.update(extra)
+        return encoded
+
+
+class ScopeDurations:
+    """Summarize how long scopes lived
+
+    Durations are aggregated by the name of the task function (or nursery)
+    without its serial number, only the slowest scopes are kept by name.
+    Scopes wrapping a task are skipped since they live as long as the task.
+    """
+
+    def __init__(self, nm_slowest: int = 10):
+        self.nm_slowest: int = nm_slowest
+        self.started: Dict[int, int] = {}
+        # group -> [count, total, max]
+        self.groups: Dict[str, List[int]] = {}
+        # min-heap of (duration, name)
+        self.slowest: List[Tuple[int, str]] = []
+
+    def start(self, ref: int, ts: int):
+        if not ref & 1:
+            self.started[ref] = ts
+
+    def stop(self, ref: int, name: str, ts: int):
+        started = self.started.pop(ref, None)
+        if started is None:
+            return
+        duration = ts - started
+
+        key = base_name(name)
+        group = self.groups.get(key, None)
+        if group is None:
+            group = self.groups[key] = [0, 0, 0]
+        group[0] += 1
+        group[1] += duration
+        if duration > group[2]:
+            group[2] = duration
+
+        if len(self.slowest) < self.nm_slowest:
+            heapq.heappush(self.slowest, (duration, name))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, name))
+
+    def summary(self) -> Dict:
+        return {
+            "byName": {
+                name: {"count": count, "totalNs": total, "maxNs": max_ns}
+                for name, (count, total, max_ns) in sorted(
+                    self.groups.items(), key=lambda item: -item[1][1]
+                )
+            },
+            "slowest": [
+                {"name": name, "durationNs": duration}
+                for duration, name in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
 def get_info(
-    target: Optional[TrioNode], registry: SCRegistry
+    target: Optional[LogTarget], registry: SCRegistry
 ) -> Optional[RegisteredSCInfo]:
     if target == None:
         return None
+    if isinstance(target, RegisteredSCInfo):
+        return target
     target = cast(TrioNode, target)
     return registry.get_info(target)
 
 
-def scope_name(task_info: RegisteredSCInfo):
+def scope_name(task_info: RegisteredSCInfo) -> str:
     if task_info.type != "task":
         raise RuntimeError("Can only call this method with task object")
-    return f"{task_info.name}__TRIO_VIS_Tscope"
+    return cast(str, task_info.scope_name)
 
 
 class SCLogger(Logger):
-    def __init__(self, registry: SCRegistry, log_filename: str):
+    def __init__(
+        self,
+        registry: SCRegistry,
+        log_filename: str,
+        sink: Optional[EventSink] = None,
+        background: bool = False,
+        queue_size: int = 65536,
+    ):
         self.event_id: int = 0
         self.registry: SCRegistry = registry
-        self.events: List[Dict] = []
         self.log_filename: str = log_filename
+        self.sink: EventSink = MemorySink(log_filename) if sink is None else sink
+        self.names: NameTable = NameTable()
+        # timestamps of events are relative to this
+        self.start_ns: int = perf_counter_ns()
+        self.config_sources: List[Callable[[], Dict]] = []
+        self.outcomes: NurseryOutcomes = NurseryOutcomes()
+
+        # sinks referring to scopes by integers (the binary log) skip the
+        # dict of every event
+        self._emit_raw: Optional[Callable[[RawEvent], None]] = getattr(
+            self.sink, "emit_raw", None
+        )
+        self._write: Callable[[RawEvent], None] = self._write_encoded
+        if self._emit_raw is not None:
+            self._write = self._write_raw
+        # serialize & write events in another thread
+        self.writer: Optional[BackgroundWriter] = None
+        if background:
+            self.writer = BackgroundWriter(self._write, max_queue_size=queue_size)
         atexit.register(self._write_log)
 
+    def _emit(
+        self,
+        desc: str,
+        name: int,
+        type: str,
+        parent: Optional[int],
+        extra: Optional[Dict] = None,
+    ) -> int:
+        """Emit an event, scopes are referred by their integer refs
+
+        Most sinks take encoded events, so without a background writer they
+        are encoded here, on the Trio thread
+
+        Return the timestamp of the event
+        """
+        # the timestamp goes last, only the integer is allocated for it
+        ts = perf_counter_ns() - self.start_ns
+        event = self.names.raw_event(self.time, desc, name, type, parent, extra, ts)
+        if self.writer is not None:
+            self.writer.put(event)
+            return ts
+        self._write(event)
+        return ts
+
+    def _write_encoded(self, event: RawEvent):
+        self.sink.emit(self.names.encode(event))
+
+    def _write_raw(self, event: RawEvent):
+        emit_raw = self._emit_raw
+        assert emit_raw is not None
+        self.names.track(event)
+        emit_raw(event)
+
     def _get_info(self, child, parent):
         if child is None:
             raise RuntimeError("target should not be none")
         child_info = get_info(child, self.registry)
         parent_info = get_info(parent, self.registry)
+        self.names.add(child_info)
+        if parent_info is not None:
+            self.names.add(parent_info)
         return (child_info, parent_info)
 
-    def log_start(self, child: TrioNode, parent: Optional[TrioNode]):
+    def log_start(
+        self, child: TrioNode, parent: Optional[TrioNode], extra: Optional[Dict] = None
+    ):
         child_info, parent_info = self._get_info(child, parent)
         if parent_info is None:
             # Root Scope
-            self.events.append(
-                SCEvent(
-                    time=self.time,
-                    name=scope_name(child_info),
-                    desc="created",
-                    parent=None,
-                    type="scope",
-                ).as_dict()
+            self._emit(
+                desc="created",
+                name=child_info.scope_ref,
+                type="scope",
+                parent=None,
             )
             # Root task
-            self.events.append(
-                SCEvent(
-                    time=self.time,
-                    name=child_info.name,
-                    desc="created",
-                    parent=scope_name(child_info),
-                    type="task",
-                ).as_dict()
+            self._emit(
+                desc="created",
+                name=child_info.ref,
+                type="task",
+                parent=child_info.scope_ref,
+                extra=extra,
             )
 
             # print(f"Create root scope: {scope_name(child_info)}")
@@ -94,24 +297,19 @@ class SCLogger(Logger):
             # )
         elif child_info.type == "task" and parent_info.type == "nursery":
             # Scope for child task
-            self.events.append(
-                SCEvent(
-                    type="scope",
-                    time=self.time,
-                    name=scope_name(child_info),
-                    desc="created",
-                    parent=parent_info.name,
-                ).as_dict()
+            self._emit(
+                desc="created",
+                name=child_info.scope_ref,
+                type="scope",
+                parent=parent_info.ref,
             )
             # Child task
-            self.events.append(
-                SCEvent(
-                    type="task",
-                    time=self.time,
-                    name=child_info.name,
-                    desc="created",
-                    parent=scope_name(child_info),
-                ).as_dict()
+            self._emit(
+                desc="created",
+                name=child_info.ref,
+                type="task",
+                parent=child_info.scope_ref,
+                extra=extra,
             )
             # print(
             #     f"Create scope: {scope_name(child_info)} under scope:{parent_info.name}"
@@ -120,14 +318,12 @@ class SCLogger(Logger):
             #     f"Create task: {child_info.name} under scope:{scope_name(child_info)}"
             # )
         elif child_info.type == "nursery" and parent_info.type == "task":
-            self.events.append(
-                SCEvent(
-                    type="scope",
-                    time=self.time,
-                    name=child_info.name,
-                    desc="created",
-                    parent=scope_name(parent_info),
-                ).as_dict()
+            self._emit(
+                desc="created",
+                name=child_info.ref,
+                type="scope",
+                parent=parent_info.scope_ref,
+                extra=extra,
             )
             # print(
             #     f"Create scope: {child_info.name} under scope: {scope_name(parent_info)}"
@@ -135,75 +331,101 @@ class SCLogger(Logger):
         else:
             print("spawn unknown")
 
-    def log_exit(self, child: TrioNode, parent: Optional[TrioNode]):
+    def log_exit(
+        self, child: LogTarget, parent: Optional[TrioNode], extra: Optional[Dict] = None
+    ):
         child_info, parent_info = self._get_info(child, parent)
         if parent_info is None:
             # root exit
             # print(f"Exit task: {child_info.name} under scope:{scope_name(child_info)}")
             # print(f"Exit scope: {scope_name(child_info)}")
             # Root task
-            self.events.append(
-                SCEvent(
-                    time=self.time,
-                    name=child_info.name,
-                    desc="exited",
-                    parent=scope_name(child_info),
-                    type="task",
-                ).as_dict()
+            self._emit(
+                desc="exited",
+                name=child_info.ref,
+                type="task",
+                parent=child_info.scope_ref,
+                extra=extra,
             )
             # Root scope
-            self.events.append(
-                SCEvent(
-                    time=self.time,
-                    name=scope_name(child_info),
-                    desc="exited",
-                    parent=None,
-                    type="task",
-                ).as_dict()
+            self._emit(
+                desc="exited",
+                name=child_info.scope_ref,
+                type="task",
+                parent=None,
             )
         elif child_info.type == "task" and parent_info.type == "nursery":
             # print(f"Exit task:{child_info.name} under scope:{scope_name(child_info)}")
             # print(f"Exit scope:{scope_name(child_info)} under scope:{parent_info.name}")
-            self.events.append(
-                SCEvent(
-                    time=self.time,
-                    name=child_info.name,
-                    desc="exited",
-                    parent=scope_name(child_info),
-                    type="task",
-                ).as_dict()
+            ts = self._emit(
+                desc="exited",
+                name=child_info.ref,
+                type="task",
+                parent=child_info.scope_ref,
+                extra=extra,
             )
-            self.events.append(
-                SCEvent(
-                    time=self.time,
-                    name=scope_name(child_info),
-                    desc="exited",
-                    parent=parent_info.name,
-                    type="scope",
-                ).as_dict()
+            if extra is not None:
+                self.outcomes.record(parent_info.name, extra, ts)
+            self._emit(
+                desc="exited",
+                name=child_info.scope_ref,
+                type="scope",
+                parent=parent_info.ref,
             )
 
         elif child_info.type == "nursery" and parent_info.type == "task":
             # print(f"Exit scope:{child_info.name} under scope:{scope_name(parent_info)}")
-            self.events.append(
-                SCEvent(
-                    time=self.time,
-                    name=child_info.name,
-                    desc="exited",
-                    parent=scope_name(parent_info),
-                    type="scope",
-                ).as_dict()
+            self._emit(
+                desc="exited",
+                name=child_info.ref,
+                type="scope",
+                parent=parent_info.scope_ref,
+                extra=extra,
             )
+            self.outcomes.close(child_info.name)
         else:
             print("exit unknown")
 
+    def log_slow_step(self, task: TrioNode, extra: Dict):
+        """A step of the task blocked the event loop for too long"""
+        task_info, _ = self._get_info(task, None)
+        self._emit(
+            desc="slow-step",
+            name=task_info.ref,
+            type="task",
+            parent=task_info.scope_ref,
+            extra=extra,
+        )
+
+    def log_config(self) -> Dict:
+        config: Dict = {"makeDirectScopeTransparent": True}
+        if self.writer is not None:
+            config["droppedEvents"] = self.writer.dropped
+        config["scopeDurations"] = self.names.durations.summary()
+        config["nurseryOutcomes"] = self.outcomes.summary()
+        for source in self.config_sources:
+            config.update(source())
+        return config
+
+    def add_config_source(self, source: Callable[[], Dict]):
+        self.config_sources.append(source)
+
+    def dump(
+        self, filename: Optional[str] = None, max_age_ns: Optional[int] = None
+    ) -> str:
+        if not isinstance(self.sink, RingBufferSink):
+            raise RuntimeError("only a flight recorder can be dumped")
+        return self.sink.dump(
+            self.log_config(), filename=filename, max_age_ns=max_age_ns
+        )
+
     def _write_log(self):
-        sc_logs = {
-            "config": {"makeDirectScopeTransparent": True},
-            "runRecords": self.events,
-        }
-        with open(self.log_filename, "w") as log_file:
-            json.dump(sc_logs, log_file, indent=4)
+        try:
+            if self.writer is not None:
+                # drain the queue before reading the drop counter
+                self.writer.stop()
+        finally:
+            self.sink.close(self.log_config())
 
     @property
     def time(self) -> int:
@@ -213,7 +435,7 @@ class SCLogger(Logger):
 
 
 def log():
-    event = SCEvent(2, "t0", "start", "n0")
+    event = SCEvent(2, "created", "t0", "task", "n0")
     print(json.dumps(event.as_dict()))
 
 
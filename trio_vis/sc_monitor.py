@@ -1,21 +1,25 @@
-from typing import Optional
+import signal
+import threading
+import warnings
+import weakref
+from typing import TYPE_CHECKING, Callable, Dict, Optional, cast
 
-import rich
-
-from trio_vis.config import VisConfig
-from trio_vis.desc_tree import DescNode, DescTree
+from trio_vis.desc_tree import DescNode, DescTree, TrioNode
+from trio_vis.log_sink import sink_from_config
+from trio_vis.overhead import OverheadCounters, TimedLogger
 from trio_vis.protocol import TrioInstrument, TrioNursery, TrioTask
 from trio_vis.registry import SCRegistry
-from trio_vis.sc_logger import Logger, SCLogger
-
-
-def is_user_task(task):
-    filename = None
-    filename = task.coro.cr_frame.f_code.co_filename
-    if "trio/_core" in filename:
-        return False
-    return True
+from trio_vis.sampling import SamplingPolicy
+from trio_vis.sc_logger import Logger, LogTarget, SCLogger
+from trio_vis.slow_step import RateLimiter, StackSampler
+from trio_vis.step_timer import StepTimer, TaskStepStats
+from trio_vis.task_filter import TaskFilter
+from trio_vis.task_outcome import (cancel_called, describe_outcome,
+                                   exited_outcome, main_task_error)
 
+if TYPE_CHECKING:
+    from trio_vis.config import VisConfig
+    from trio_vis.live_view import LiveTreeView
 
 """Capture cases
 + -- task spawned
@@ -33,35 +37,299 @@ def parent_from_registry(target, registry: SCRegistry):
     pass
 
 
+# Callbacks called by trio (or the user), which add up to the monitor's time
+TOP_LEVEL_CALLBACKS = (
+    "task_spawned",
+    "task_exited",
+    "before_task_step",
+    "after_task_step",
+    # step hook of the NurseryCloser
+    "close_emptied",
+    "attach",
+    "detach",
+)
+
+
+class NurseryCloser:
+    """Step hook of a monitor, installed only while a task it traces has a
+    nursery without children
+    """
+
+    def __init__(self, monitor: "SC_Monitor"):
+        self.monitor = monitor
+
+    def after_task_step(self, task: TrioTask):
+        self.monitor.close_emptied(task)
+
+
 class SC_Monitor(TrioInstrument):
     """SC Monitor
     Monitoring key structured-concurreny events happend in Trio
     """
 
-    def __init__(self, config: VisConfig = VisConfig(), sc_logger=SCLogger):
-        self.registry = SCRegistry()
+    def __init__(self, config: Optional["VisConfig"] = None, sc_logger=SCLogger):
+        if config is None:
+            from trio_vis.config import VisConfig
+
+            config = VisConfig()
+        self.cfg: "VisConfig" = config
+        self.is_user_task = TaskFilter.from_config(self.cfg)
+
+        self.registry = SCRegistry(weak=self.cfg.weak_registry)
         self.root_task: Optional[TrioTask] = None
         self.desc_tree: Optional[DescTree] = None
         self.root_exited = False
-
-        self.cfg: VisConfig = config
+        # tasks with a nursery left without children in the tree, the nursery
+        # is dropped once it's closed by a step of the task
+        self.emptied: "weakref.WeakSet[TrioTask]" = weakref.WeakSet()
+        self.closer = NurseryCloser(self)
+        # scopes alive at the last detach, they keep their names until the
+        # next attach finds them exited
+        self.detached: "weakref.WeakSet[TrioNode]" = weakref.WeakSet()
 
         self.event_id: int = 0
         self.called_id: int = 0
+        # rich is only imported once the tree is printed
+        self.live_view: Optional["LiveTreeView"] = None
+        if self.cfg.print_task_tree:
+            from trio_vis.live_view import LiveTreeView
+
+            self.live_view = LiveTreeView(fps=self.cfg.live_view_fps)
 
         # the logger would write the entire file right before the program exit
         self.sc_logger: Logger = sc_logger(
-            self.registry, log_filename=self.cfg.log_filename
+            self.registry,
+            log_filename=self.cfg.log_filename,
+            sink=sink_from_config(self.cfg),
+            background=self.cfg.log_in_background,
+            queue_size=self.cfg.log_queue_size,
         )
 
+        # Subtrees not chosen by the sampling policy, only their tasks alive
+        self.sampler: Optional[SamplingPolicy] = SamplingPolicy.from_config(self.cfg)
+        self.unsampled: "weakref.WeakSet[TrioTask]" = weakref.WeakSet()
+        if self.sampler is not None:
+            sampler = self.sampler
+            self.sc_logger.add_config_source(lambda: {"sampling": sampler.summary()})
+
+        # Trio only calls step hooks an instrument has,
+        # so they're only attached when enabled
+        self.step_timer: Optional[StepTimer] = None
+        self.slow_step_limiter: Optional[RateLimiter] = None
+        self.stack_sampler: Optional[StackSampler] = None
+        if self.cfg.time_task_steps or self.cfg.slow_step_threshold is not None:
+            self.step_timer = StepTimer()
+            self.before_task_step = self.step_timer.before_task_step
+            self.after_task_step = self.step_timer.after_task_step
+        if self.step_timer is not None and self.cfg.slow_step_threshold is not None:
+            threshold_ns = int(self.cfg.slow_step_threshold * 1e9)
+            self.step_timer.slow_step_ns = threshold_ns
+            self.step_timer.on_slow_step = self.slow_step
+            self.slow_step_limiter = RateLimiter(self.cfg.slow_step_max_per_sec)
+            if self.cfg.slow_step_sample_stack:
+                self.stack_sampler = StackSampler(self.step_timer, threshold_ns)
+                self.before_run = self.stack_sampler.start
+                self.after_run = self.stack_sampler.stop
+
+        # set by the dump signal when it can't reach the Trio thread
+        self.dump_requested = False
+        if self.cfg.flight_recorder and self.cfg.flight_recorder_signal is not None:
+            self._install_dump_signal(self.cfg.flight_recorder_signal)
+
+        self.overhead_counters: Optional[OverheadCounters] = None
+        if self.cfg.track_overhead:
+            self._track_overhead()
+
+    def _track_overhead(self):
+        counters = self.overhead_counters = OverheadCounters()
+        for name in TOP_LEVEL_CALLBACKS:
+            if hasattr(self, name):
+                setattr(self, name, counters.timed(name, getattr(self, name), True))
+        self._build_tree = counters.timed("tree", self._build_tree)
+        self.tree_updated = counters.timed("tree", self.tree_updated)
+        self.sc_logger = cast(Logger, TimedLogger(self.sc_logger, counters))
+        self.sc_logger.add_config_source(lambda: {"monitorOverhead": self.overhead()})
+
+    def overhead(self) -> Dict:
+        """Time spent in the monitor itself
+
+        `share` is the ratio of the traced run spent in the monitor's
+        callbacks, the live view renders in another thread and is not part
+        of it
+        """
+        if self.overhead_counters is None:
+            return {}
+        summary = self.overhead_counters.summary(TOP_LEVEL_CALLBACKS)
+        if self.live_view is not None:
+            summary["render"] = {
+                "frames": self.live_view.frames,
+                "ns": self.live_view.render_ns,
+            }
+        return summary
+
+    def _run_started(self):
+        if self.overhead_counters is not None:
+            self.overhead_counters.run_started()
+
+    def _run_ended(self):
+        if self.overhead_counters is not None:
+            self.overhead_counters.run_ended()
+
+    def _install_dump_signal(self, name: str):
+        signum = getattr(signal, name, None)
+        if signum is None:
+            # e.g. SIGUSR1 on Windows
+            warnings.warn(f"[trio-vis] {name} is not available, no dump on signal")
+            return
+        if threading.current_thread() is not threading.main_thread():
+            warnings.warn(f"[trio-vis] not in the main thread, no dump on {name}")
+            return
+        import trio
+
+        previous = signal.getsignal(signum)
+
+        def dump_and_chain(sig, frame):
+            # the handler may run in the middle of a callback changing the
+            # events, the dump is deferred to the Trio thread
+            try:
+                token = trio.lowlevel.current_trio_token()
+                token.run_sync_soon(self.dump_flight_recorder)
+            except (RuntimeError, trio.RunFinishedError):
+                # no run in this thread, dumped by the next callback
+                self.dump_requested = True
+            if callable(previous):
+                previous(sig, frame)
+
+        signal.signal(signum, dump_and_chain)
+
+    def dump_flight_recorder(self, filename: Optional[str] = None) -> str:
+        """Write the latest events kept by the flight recorder as a sc-vis log
+
+        Return the name of the written file
+        """
+        self.dump_requested = False
+        seconds = self.cfg.flight_recorder_seconds
+        max_age_ns = None if seconds is None else int(seconds * 1e9)
+        return self.sc_logger.dump(filename=filename, max_age_ns=max_age_ns)
+
+    # Attach & detach at runtime
+
+    def attach(self):
+        """Start tracing in the middle of `trio.run`, call it from the Trio thread
+
+        The tree is built once from the running tasks, which are logged as
+        created with the field "attached" set
+        """
+        import trio
+
+        if self.root_task is not None and not self.root_exited:
+            return
+        root = self._find_root(trio.lowlevel.current_root_task())
+        if root is None:
+            raise RuntimeError("[trio-vis] no task to trace")
+
+        self.root_task = root
+        self.root_exited = False
+        self._run_started()
+        self.desc_tree = self._build_tree(root, should_trace=self.should_trace)
+        for ref in list(self.detached):
+            if ref not in self.desc_tree.ref_2node and ref in self.registry.registered:
+                self.registry.remove(ref)
+        self.detached.clear()
+        self.log(f"attached, root task: {self._name(root)}")
+        for node in self.desc_tree.walk():
+            parent = node.parent.ref if node.parent is not None else None
+            self.sc_logger.log_start(
+                child=node.ref, parent=parent, extra={"attached": True}
+            )
+        if self.stack_sampler is not None:
+            self.stack_sampler.start()
+        trio.lowlevel.add_instrument(self)
+        self.tree_updated()
+
+    def detach(self):
+        """Stop tracing, scopes still running are logged as exited with the
+        field "detached" set
+
+        They stay registered, so they keep their names if traced again
+        """
+        import trio
+
+        try:
+            trio.lowlevel.remove_instrument(self)
+        except KeyError:
+            pass
+        if self.stack_sampler is not None:
+            self.stack_sampler.stop()
+        if self.desc_tree is None or self.root_exited:
+            return
+
+        self.log("detached")
+        for node in reversed(list(self.desc_tree.walk())):
+            parent = node.parent.ref if node.parent is not None else None
+            self.sc_logger.log_exit(
+                child=self._log_target(node), parent=parent, extra={"detached": True}
+            )
+            # still alive, the names stay the same across a re-attach
+            if node.ref is not None:
+                self.detached.add(node.ref)
+            if parent is not None:
+                self.desc_tree.remove(node, unregister=False)
+        self._run_ended()
+        self.hide_tree()
+        self.root_task = None
+        self.desc_tree = None
+        self.unsampled.clear()
+        self.emptied.clear()
+        self._watch_steps(False)
+        if self.step_timer is not None:
+            self.step_timer.stats.clear()
+
+    def _find_root(self, task: TrioTask) -> Optional[TrioTask]:
+        """The first traced task from trio's root task, breadth first"""
+        tasks = [task]
+        for task in tasks:
+            if not self.cfg.only_vis_user_scope or self.is_user_task(task):
+                return task
+            for nursery in task.child_nurseries:
+                tasks.extend(nursery.child_tasks)
+        return None
+
+    async def trace_for(self, seconds: float):
+        """Trace the program for a while"""
+        import trio
+
+        self.attach()
+        try:
+            await trio.sleep(seconds)
+        finally:
+            self.detach()
+
+    def toggle(self):
+        if self.root_task is not None and not self.root_exited:
+            self.detach()
+        else:
+            self.attach()
+
+    def toggle_on_signal(self, name: str = "SIGUSR2"):
+        """Attach/detach whenever the signal is received, call it from the Trio
+        thread"""
+        import trio
+
+        signum = getattr(signal, name, None)
+        if signum is None:
+            raise ValueError(f"[trio-vis] unknown signal: {name}")
+        token = trio.lowlevel.current_trio_token()
+        # the only safe way to get into the Trio thread from a signal handler
+        signal.signal(signum, lambda *_: token.run_sync_soon(self.toggle))
+
     def log(self, msg):
         self.event_id += 1
-        if self.cfg.print_task_tree is True:
-            rich.print(f"[red]event-{self.event_id}[reset] - [blue]{msg}")
+        if self.live_view is not None:
+            # shown with the next frame
+            self.live_view.status = f"[red]event-{self.event_id}[reset] - {msg}"
 
     def api_called(self):
-        if self.cfg.print_task_tree is True:
-            rich.print(f"[yellow]api called-{self.called_id}[reset]")
         self.called_id += 1
 
     @classmethod
@@ -77,36 +345,47 @@ class SC_Monitor(TrioInstrument):
         """Get parsed info from trio's task/nursery"""
         return self.registry.get_info(obj).name
 
+    def _build_tree(
+        self,
+        root: TrioTask,
+        should_trace: Optional[Callable[[TrioTask], bool]] = None,
+    ) -> DescTree:
+        return DescTree.build(root, registry=self.registry, should_trace=should_trace)
+
     def rebuild_tree(self):
         self.desc_tree = DescTree.build(
             root_task=self.root_task, registry=self.registry
         )
 
     def task_spawned(self, task):
-        if self.cfg.only_vis_user_scope is True and not is_user_task(task):
+        if self.dump_requested:
+            self.dump_flight_recorder()
+        if self.cfg.only_vis_user_scope is True and not self.is_user_task(task):
             return
         self.api_called()
         if not self.root_task:
             self.root_task = task
-            self.desc_tree = DescTree.build(task, registry=self.registry)
+            self._run_started()
+            self.desc_tree = self._build_tree(task)
             self.log(f"root task added:{self._name(task)}")
             self.sc_logger.log_start(child=task, parent=None)
+            self.tree_updated()
             return
 
-        # Rebuild: becuase parent nursery might be added without notify our monitor
-        # in that case we might need to detect these changes ourself
-        # However, to keep it simple, we simply rebuild the whole tree here
-        self.rebuild_tree()
-        if self.cfg.print_task_tree:
-            rich.print(self.desc_tree)
+        if self.sampler is not None and not self.sampled(task):
+            return
 
-        parent_nursery: TrioNursery = self.desc_tree.get_parent_ref(task)
-        if parent_nursery is None:
+        # Parent nursery might be added without notify our monitor,
+        # the tree would discover it while inserting the task
+        inserted = self.desc_tree.insert_task(task)
+        if len(inserted) == 0:
             self.log("Error!!!")
             return
 
-        if len(parent_nursery.child_tasks) == 1:
-            grand_parent = self.desc_tree.get_parent_ref(parent_nursery)
+        parent_nursery: TrioNursery = inserted[-1].parent.ref
+        if len(inserted) > 1:
+            grand_parent = inserted[0].parent.ref
+            self.exit_closed_nurseries(grand_parent)
             self.log(f"nursery started: {self._name(parent_nursery)}")
             self.sc_logger.log_start(child=parent_nursery, parent=grand_parent)
 
@@ -114,36 +393,186 @@ class SC_Monitor(TrioInstrument):
             f"task started: {self._name(task)}, parent:{self._name(parent_nursery)}"
         )
         self.sc_logger.log_start(child=task, parent=parent_nursery)
+        self.tree_updated()
+
+    def sampled(self, task: TrioTask) -> bool:
+        """Apply the sampling policy on children of the root task
+
+        Descendants follow their ancestor without touching the tree
+        """
+        parent_nursery = task.parent_nursery
+        parent = parent_nursery.parent_task if parent_nursery is not None else None
+        sampler = cast(SamplingPolicy, self.sampler)
+        if parent in self.unsampled or (
+            parent is self.root_task and not sampler.should_trace(task)
+        ):
+            self.unsampled.add(task)
+            return False
+        return True
+
+    def exit_closed_nurseries(self, task: TrioTask) -> int:
+        """Log & drop nurseries which are closed by the task before
+
+        Return the number of nurseries dropped
+        """
+        desc_tree = self.desc_tree
+        assert desc_tree is not None
+        closed = desc_tree.closed_nurseries(task)
+        for node in closed:
+            self.log(f"nursery exited: {node.info.name}")
+            self.sc_logger.log_exit(child=self._log_target(node), parent=task)
+            desc_tree.remove(node)
+        return len(closed)
+
+    @staticmethod
+    def _log_target(node: DescNode) -> LogTarget:
+        """A closed nursery may be collected already with a weak registry"""
+        ref = node.ref
+        return node.info if ref is None else ref
+
+    def close_emptied(self, task: TrioTask):
+        """Drop nurseries the task closed during the step
+
+        Trio wakes the parent task once the last child of a nursery exited,
+        the nursery is closed within that step, unless the task spawns into
+        it again
+        """
+        if task not in self.emptied or self.desc_tree is None:
+            return
+        if self.exit_closed_nurseries(task) > 0:
+            self.tree_updated()
+        if not self.desc_tree.empty_nurseries(task):
+            self.emptied.discard(task)
+            if not self.emptied:
+                self._watch_steps(False)
+
+    def _watch_steps(self, enabled: bool):
+        """Only pay for a step hook while a task has an empty nursery"""
+        import trio
+
+        closer = cast("trio.abc.Instrument", self.closer)
+        try:
+            if enabled:
+                trio.lowlevel.add_instrument(closer)
+            else:
+                trio.lowlevel.remove_instrument(closer)
+        except KeyError:
+            # not installed
+            pass
+        except RuntimeError:
+            # outside of trio.run, there are no steps
+            pass
+
+    def should_trace(self, task: TrioTask) -> bool:
+        if task in self.unsampled:
+            return False
+        return not self.cfg.only_vis_user_scope or self.is_user_task(task)
+
+    def tree_updated(self):
+        if self.cfg.check_task_tree:
+            self.desc_tree.check_consistency(
+                self.root_task,
+                should_trace=self.should_trace,
+            )
+        if self.live_view is not None and not self.live_view.running:
+            self.live_view.start(self.desc_tree)
+
+    def hide_tree(self):
+        if self.live_view is not None:
+            self.live_view.stop()
+
+    def exit_extra(self, task: TrioTask, stats: Optional[TaskStepStats]) -> Dict:
+        """Additional fields for the exit event of a traced task, only valid in
+        its `task_exited` hook
+        """
+        extra: Dict = {}
+        if self.cfg.track_outcomes:
+            extra.update(describe_outcome(exited_outcome(task)))
+            if cancel_called(task):
+                extra["cancelCalled"] = True
+        if stats is not None and self.cfg.time_task_steps:
+            extra.update(stats.as_dict())
+        return extra
+
+    def slow_step(self, task: TrioTask, elapsed_ns: int):
+        """Called by the step timer after a step ran too long"""
+        if self.desc_tree is None or task not in self.desc_tree.ref_2node:
+            return
+        limiter = cast(RateLimiter, self.slow_step_limiter)
+        if not limiter.allow():
+            return
+        extra: Dict = {
+            "durationNs": elapsed_ns,
+            "path": [self._name(ref) for ref in self.desc_tree.ancestry(task)],
+            "suppressed": limiter.take_suppressed(),
+        }
+        if self.stack_sampler is not None:
+            stack = self.stack_sampler.take(cast(StepTimer, self.step_timer).step_id)
+            if stack is not None:
+                extra["stack"] = stack
+        self.log(f"slow step: {self._name(task)}, {elapsed_ns / 1e6:.1f} ms")
+        self.sc_logger.log_slow_step(task, extra=extra)
+
+    def log_task_exit(self, task: TrioTask, parent: Optional[TrioNursery], extra: Dict):
+        if extra:
+            self.sc_logger.log_exit(child=task, parent=parent, extra=extra)
+        else:
+            self.sc_logger.log_exit(child=task, parent=parent)
 
     def task_exited(self, task):
+        if self.dump_requested:
+            self.dump_flight_recorder()
+        # always collect, so nothing is left behind for untraced tasks
+        stats = None
+        if self.step_timer is not None:
+            stats = self.step_timer.pop(task)
+
         # we only trace user task
         if self.root_exited:
             return
+        if task in self.unsampled:
+            self.unsampled.discard(task)
+            return
+
+        desc_task: Optional[DescNode] = self.desc_tree.ref_2node.get(task, None)
+        if desc_task is None:
+            # task not traced
+            return
 
         self.api_called()
+        extra = self.exit_extra(task, stats)
         task_name = self._name(task)
-
-        desc_task: DescNode = self.desc_tree.ref_2node[task]
+        if task in self.emptied:
+            self.emptied.discard(task)
+            if not self.emptied:
+                self._watch_steps(False)
         if len(desc_task.children) > 0:
-            for desc_child_nursery in desc_task.children:
-                nursery_name = self._name(desc_child_nursery.ref)
+            for desc_child_nursery in list(desc_task.children):
+                nursery_name = desc_child_nursery.info.name
                 self.log(f"nursery exited: {nursery_name}, parent: {task_name}")
-                self.sc_logger.log_exit(child=desc_child_nursery.ref, parent=task)
-                self.desc_tree.remove_ref(desc_child_nursery.ref)
+                self.sc_logger.log_exit(
+                    child=self._log_target(desc_child_nursery), parent=task
+                )
+                self.desc_tree.remove(desc_child_nursery)
 
         if task == self.root_task:
             self.log(f"root task exited: {task_name}")
             self.root_exited = True
-            self.sc_logger.log_exit(child=task, parent=None)
+            self._run_ended()
+            self.log_task_exit(task, parent=None, extra=extra)
+            if self.cfg.flight_recorder and main_task_error() is not None:
+                self.log(f"dump flight recorder: {self.dump_flight_recorder()}")
+            self.hide_tree()
             # Notice: we shouldn't remove root task from registry
             # since we need to retrieve it's name from registry in the logger
             return
 
         parent_nursery: TrioNursery = self.desc_tree.get_parent_ref(task)
         self.log(f"task exited: {task_name}, parent:{self._name(parent_nursery)}")
-        self.sc_logger.log_exit(child=task, parent=parent_nursery)
+        self.log_task_exit(task, parent=parent_nursery, extra=extra)
         self.desc_tree.remove_ref(task)
-
-        self.rebuild_tree()
-        if self.cfg.print_task_tree:
-            rich.print(self.desc_tree)
+        nursery_node = self.desc_tree.ref_2node.get(parent_nursery, None)
+        if nursery_node is not None and not nursery_node.children:
+            self.emptied.add(cast(TrioTask, parent_nursery.parent_task))
+            self._watch_steps(True)
+        self.tree_updated()
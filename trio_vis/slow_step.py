@@ -0,0 +1,106 @@
+import sys
+import threading
+import traceback
+from typing import List, Optional, Tuple
+
+from .step_timer import StepTimer, perf_counter_ns
+
+""" Detect task steps blocking the event loop
+
+    A step running longer than the threshold starves every other task.
+    The StepTimer reports such steps once they finish; since the blocking code
+    has already returned by then, StackSampler samples the stack of the Trio
+    thread from another thread while the step is still running.
+"""
+
+
+class RateLimiter:
+    """Token bucket, allow at most `rate` events per second on average"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate: float = rate
+        self.capacity: float = max(rate, 1.0) if burst is None else burst
+        self.tokens: float = self.capacity
+        self.last: int = perf_counter_ns()
+        # events refused since the last allowed one
+        self.suppressed: int = 0
+
+    def allow(self) -> bool:
+        now = perf_counter_ns()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last) * self.rate / 1e9
+        )
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.suppressed += 1
+        return False
+
+    def take_suppressed(self) -> int:
+        suppressed, self.suppressed = self.suppressed, 0
+        return suppressed
+
+
+class StackSampler:
+    """Sample the stack of the Trio thread while a step runs too long"""
+
+    def __init__(
+        self,
+        timer: StepTimer,
+        threshold_ns: int,
+        interval: Optional[float] = None,
+        limit: int = 32,
+    ):
+        self.timer: StepTimer = timer
+        self.threshold_ns: int = threshold_ns
+        self.interval: float = threshold_ns / 2e9 if interval is None else interval
+        self.limit: int = limit
+
+        # (step_id, stack) of the latest sample
+        self.sampled: Optional[Tuple[int, List[str]]] = None
+
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start sampling the calling thread"""
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="trio-vis-stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            step = self.timer.running_step()
+            if step is None:
+                continue
+            step_id, start = step
+            if perf_counter_ns() - start < self.threshold_ns:
+                continue
+            if self.sampled is not None and self.sampled[0] == step_id:
+                continue
+            frame = sys._current_frames().get(self._thread_id, None)
+            if frame is None:
+                continue
+            stack = traceback.format_list(
+                traceback.extract_stack(frame, limit=self.limit)
+            )
+            self.sampled = (step_id, stack)
+
+    def take(self, step_id: int) -> Optional[List[str]]:
+        """The stack sampled during the given step, if any"""
+        sampled = self.sampled
+        if sampled is None or sampled[0] != step_id:
+            return None
+        self.sampled = None
+        return sampled[1]
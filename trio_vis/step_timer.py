@@ -0,0 +1,92 @@
+import time
+from typing import Callable, Dict, Optional, Tuple, cast
+
+import attr
+
+from .protocol import TrioStepInstrument, TrioTask
+
+""" Time every task step
+
+    Accumulate how long each task actually runs, measured between trio's
+    `before_task_step` and `after_task_step` hooks.
+"""
+
+perf_counter_ns: Callable[[], int] = getattr(
+    time, "perf_counter_ns", lambda: int(time.perf_counter() * 1e9)
+)
+
+
+@attr.s(auto_attribs=True, slots=True)
+class TaskStepStats:
+    run_ns: int = 0
+    steps: int = 0
+    max_step_ns: int = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "runNs": self.run_ns,
+            "steps": self.steps,
+            "maxStepNs": self.max_step_ns,
+        }
+
+
+class StepTimer(TrioStepInstrument):
+    """Time task steps
+
+    If `slow_step_ns` is given, `on_slow_step(task, elapsed_ns)` is called
+    after every step taking longer than that
+    """
+
+    def __init__(
+        self,
+        slow_step_ns: Optional[int] = None,
+        on_slow_step: Optional[Callable[[TrioTask, int], None]] = None,
+    ):
+        self.stats: Dict[TrioTask, TaskStepStats] = {}
+        self.slow_step_ns: Optional[int] = slow_step_ns
+        self.on_slow_step: Optional[Callable[[TrioTask, int], None]] = on_slow_step
+
+        # the running step, also read by the stack sampler thread
+        self.step_id: int = 0
+        self._current: Optional[TrioTask] = None
+        self._step_start: int = 0
+
+    def before_task_step(self, task: TrioTask):
+        # the step id goes last, a reader seeing it sees the new step
+        self._step_start = perf_counter_ns()
+        self._current = task
+        self.step_id += 1
+
+    def after_task_step(self, task: TrioTask):
+        if self._current is not task:
+            # the step was closed when the task exited
+            return
+        self._current = None
+        elapsed = perf_counter_ns() - self._step_start
+        stats = self.stats.get(task, None)
+        if stats is None:
+            stats = self.stats[task] = TaskStepStats()
+        stats.run_ns += elapsed
+        stats.steps += 1
+        if elapsed > stats.max_step_ns:
+            stats.max_step_ns = elapsed
+        if self.slow_step_ns is not None and elapsed > self.slow_step_ns:
+            cast(Callable[[TrioTask, int], None], self.on_slow_step)(task, elapsed)
+
+    def running_step(self) -> Optional[Tuple[int, int]]:
+        """(step_id, start time) of the running step, safe to call from other threads"""
+        while True:
+            step_id = self.step_id
+            running = self._current is not None
+            start = self._step_start
+            if step_id == self.step_id:
+                return (step_id, start) if running else None
+
+    def pop(self, task: TrioTask) -> Optional[TaskStepStats]:
+        """Stop tracking an exited task
+
+        Trio reports a task exit inside its last step, that step is closed here
+        """
+        if self._current is task:
+            self.after_task_step(task)
+        return self.stats.pop(task, None)
@@ -0,0 +1,96 @@
+import os
+from fnmatch import fnmatchcase
+from types import CodeType
+from typing import TYPE_CHECKING, Dict, Optional, Sequence
+
+from .protocol import TrioTask
+
+if TYPE_CHECKING:
+    from .config import VisConfig
+
+""" Tell user tasks from trio's internal ones
+
+    Tasks are classified by the code object of their coroutine function, the
+    result is cached so the rules are evaluated once per distinct function
+    rather than once per spawned task.
+"""
+
+
+def _match_module(module: Optional[str], prefixes: Sequence[str]) -> bool:
+    if module is None:
+        return False
+    for prefix in prefixes:
+        if module == prefix or module.startswith(prefix + "."):
+            return True
+    return False
+
+
+def _match_path(filename: str, globs: Sequence[str]) -> bool:
+    return any(fnmatchcase(filename, pattern) for pattern in globs)
+
+
+class TaskFilter:
+    """Decide whether a task should be visualized
+
+    Include rules take precedence over exclude rules, tasks matching
+    neither are visualized.
+
+    Module prefixes match the module defining the coroutine function,
+    ("trio" matches "trio._core._run"), path globs match its filename
+    with "/" as separator.
+    """
+
+    def __init__(
+        self,
+        include_modules: Sequence[str] = (),
+        exclude_modules: Sequence[str] = (),
+        include_paths: Sequence[str] = (),
+        exclude_paths: Sequence[str] = (),
+    ):
+        self.include_modules = tuple(include_modules)
+        self.exclude_modules = tuple(exclude_modules)
+        self.include_paths = tuple(include_paths)
+        self.exclude_paths = tuple(exclude_paths)
+        self._cache: Dict[CodeType, bool] = {}
+
+    @classmethod
+    def from_config(cls, cfg: "VisConfig") -> "TaskFilter":
+        return cls(
+            include_modules=cfg.include_modules,
+            exclude_modules=cfg.exclude_modules,
+            include_paths=cfg.include_paths,
+            exclude_paths=cfg.exclude_paths,
+        )
+
+    def __call__(self, task: TrioTask) -> bool:
+        code = task.coro.cr_code
+        try:
+            return self._cache[code]
+        except KeyError:
+            result = self._cache[code] = self.classify(code, self._module_of(task))
+            return result
+
+    def _module_of(self, task: TrioTask) -> Optional[str]:
+        if not (self.include_modules or self.exclude_modules):
+            return None
+        frame = getattr(task.coro, "cr_frame", None)
+        if frame is not None:
+            return frame.f_globals.get("__name__", None)
+
+        # the coroutine has already finished, find its module by filename
+        import inspect
+
+        module = inspect.getmodule(task.coro.cr_code)
+        return module.__name__ if module is not None else None
+
+    def classify(self, code: CodeType, module: Optional[str]) -> bool:
+        filename = getattr(code, "co_filename", "").replace(os.sep, "/")
+        if _match_module(module, self.include_modules) or _match_path(
+            filename, self.include_paths
+        ):
+            return True
+        if _match_module(module, self.exclude_modules) or _match_path(
+            filename, self.exclude_paths
+        ):
+            return False
+        return True
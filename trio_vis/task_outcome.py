@@ -0,0 +1,178 @@
+import heapq
+import sys
+import warnings
+from types import FrameType
+from typing import Any, Dict, List, Optional, Tuple
+
+""" Read how tasks ended
+
+    The instrument API only tells that a task exited, outcomes are read from
+    trio's internal state, so everything here degrades to "unknown" (None)
+    if those internals change. It's known to work from trio 0.19 to 0.22,
+    a warning is raised once the layout it relies on isn't found.
+
+    Only the kind of the outcome and the exception type are kept, never the
+    exception itself, which would keep its traceback and frames alive.
+"""
+
+OK = "ok"
+CANCELLED = "cancelled"
+ERROR = "error"
+
+# frames between trio's `Runner.task_exited` and `exited_outcome`
+_MAX_DEPTH = 8
+# argument of `Runner.task_exited(self, task, outcome)`
+_OUTCOME_ARG = "outcome"
+
+
+def _runner() -> Any:
+    try:
+        from trio._core._run import GLOBAL_RUN_CONTEXT
+
+        return GLOBAL_RUN_CONTEXT.runner
+    except (ImportError, AttributeError):
+        return None
+
+
+def main_task_error() -> Optional[BaseException]:
+    """Exception raised by the main task of the current run, if any
+
+    Only valid once the main task exited, i.e. in its `task_exited` hook
+    """
+    outcome = getattr(_runner(), "main_task_outcome", None)
+    return getattr(outcome, "error", None)
+
+
+def exited_outcome(task: Any) -> Any:
+    """The `outcome` a task exited with, only valid in its `task_exited` hook
+
+    Trio passes the outcome to `Runner.task_exited` but not to instruments,
+    it's picked up from the frame of the runner calling the hook.
+    """
+    runner = _runner()
+    if runner is None:
+        return None
+    if task is getattr(runner, "main_task", None):
+        # the runner keeps it aside and hands the nursery a plain value
+        return getattr(runner, "main_task_outcome", None)
+
+    code = getattr(getattr(type(runner), "task_exited", None), "__code__", None)
+    if code is None or _OUTCOME_ARG not in code.co_varnames[: code.co_argcount]:
+        _unsupported("Runner.task_exited has no outcome argument")
+        return None
+    frame: Optional[FrameType] = sys._getframe(1)
+    for _ in range(_MAX_DEPTH):
+        if frame is None:
+            break
+        if frame.f_code is code:
+            return frame.f_locals.get(_OUTCOME_ARG, None)
+        frame = frame.f_back
+    _unsupported("the hook isn't called from Runner.task_exited")
+    return None
+
+
+def _unsupported(reason: str):
+    # only shown once by the default warning filter
+    warnings.warn(f"[trio-vis] task outcomes are unknown with this trio: {reason}")
+
+
+def is_cancelled(error: BaseException) -> bool:
+    """Whether the error is a `trio.Cancelled`, or a group of nothing else"""
+    exceptions = getattr(error, "exceptions", None)
+    if exceptions is not None:
+        return len(exceptions) > 0 and all(is_cancelled(e) for e in exceptions)
+    return type(error).__name__ == "Cancelled" and type(error).__module__ == "trio"
+
+
+def type_name(error: BaseException) -> str:
+    cls = type(error)
+    if cls.__module__ == "builtins":
+        return cls.__qualname__
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def describe_outcome(outcome: Any) -> Dict:
+    """Fields for the exit event of a task, empty if the outcome is unknown"""
+    if outcome is None:
+        return {}
+    error = getattr(outcome, "error", None)
+    if error is None:
+        return {"outcome": OK}
+    if is_cancelled(error):
+        return {"outcome": CANCELLED}
+    return {"outcome": ERROR, "exception": type_name(error)}
+
+
+def cancel_called(task: Any) -> bool:
+    """Whether the scope of the nursery holding the task was cancelled"""
+    nursery = getattr(task, "parent_nursery", None)
+    scope = getattr(nursery, "cancel_scope", None)
+    return bool(getattr(scope, "cancel_called", False))
+
+
+class NurseryOutcomes:
+    """Count tasks which didn't finish normally, by their parent nursery
+
+    Once a nursery exits, it's only kept if it's among the `nm_nurseries`
+    with the most cancelled & errored tasks.
+    """
+
+    def __init__(self, nm_nurseries: int = 10):
+        self.nm_nurseries: int = nm_nurseries
+        # live nursery -> [cancelled, errored, ts of first error, its exception]
+        self.nurseries: Dict[str, List[Any]] = {}
+        # min-heap of (cancelled + errored, name, counts) of exited nurseries
+        self.exited: List[Tuple[int, str, List[Any]]] = []
+
+    def record(self, nursery: str, fields: Dict, ts: int):
+        outcome = fields.get("outcome", None)
+        if outcome is None or outcome == OK:
+            return
+        counts = self.nurseries.get(nursery, None)
+        if counts is None:
+            counts = self.nurseries[nursery] = [0, 0, None, None]
+        if outcome == CANCELLED:
+            counts[0] += 1
+            return
+        counts[1] += 1
+        if counts[2] is None:
+            counts[2] = ts
+            counts[3] = fields.get("exception", None)
+
+    def close(self, nursery: str):
+        """The nursery exited, no task of it is recorded anymore"""
+        counts = self.nurseries.pop(nursery, None)
+        if counts is None:
+            return
+        entry = (counts[0] + counts[1], nursery, counts)
+        if len(self.exited) < self.nm_nurseries:
+            heapq.heappush(self.exited, entry)
+        elif entry[0] > self.exited[0][0]:
+            heapq.heapreplace(self.exited, entry)
+
+    def summary(self) -> Dict:
+        entries = [(c[0] + c[1], name, c) for name, c in self.nurseries.items()]
+        entries.extend(self.exited)
+        entries.sort(key=lambda entry: -entry[0])
+        summary: Dict = {}
+        for _, name, (cancelled, errored, first_ts, first_exc) in entries:
+            entry: Dict = {"cancelled": cancelled, "errored": errored}
+            if first_ts is not None:
+                entry["firstErrorNs"] = first_ts
+                entry["firstError"] = first_exc
+            summary[name] = entry
+        return summary
+
+
+def format_outcomes(summary: Dict) -> List[str]:
+    """Lines like "nursery-4: 812 cancelled, 3 errored, first error at t=..." """
+    lines = []
+    for name, entry in summary.items():
+        line = f"{name}: {entry['cancelled']} cancelled, {entry['errored']} errored"
+        if "firstErrorNs" in entry:
+            line += (
+                f", first error at t={entry['firstErrorNs'] / 1e6:.3f}ms"
+                f" ({entry['firstError']})"
+            )
+        lines.append(line)
+    return lines
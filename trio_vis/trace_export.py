@@ -0,0 +1,157 @@
+import argparse
+import json
+from typing import IO, Dict, Iterable, List, Optional
+
+from .log_reader import iter_log_events
+from .registry import SCOPE_SUFFIX
+
+""" Export the scope history as Trace Event Format JSON
+
+    The output opens in chrome://tracing and in Perfetto (ui.perfetto.dev).
+    Every task gets its own track (a "thread" of the trace), the lifetime of
+    the task is a slice on that track and nurseries opened by the task are
+    slices nested inside it. Scopes wrapping a task are transparent.
+
+    Events are converted one by one with B/E (begin/end) pairs, only scopes
+    still alive are remembered, so runs of any length are exported in
+    constant memory.
+
+    Two layouts are supported:
+    1. object: {"traceEvents": [...]}, the canonical format
+    2. array: a bare JSON array, the closing bracket may be missing, so a
+        trace cut off in the middle (e.g. a crashed run) still loads
+"""
+
+PID = 1
+EVENT_FIELDS = ("time", "ts", "desc", "name", "type", "parent")
+
+
+def _us(ns: int) -> float:
+    return ns / 1000
+
+
+class TraceEventConverter:
+    """Turn sc-vis events into trace events, keeping state of live scopes"""
+
+    def __init__(self):
+        # task name -> track id
+        self.task_tids: Dict[str, int] = {}
+        # nursery name -> track of the task opening it
+        self.nursery_tids: Dict[str, int] = {}
+        self.next_tid: int = 1
+
+    def timestamp(self, event: Dict) -> float:
+        # fall back to the logical clock for logs without timestamps
+        return _us(event["ts"]) if "ts" in event else float(event["time"])
+
+    def _task_of_scope(self, scope: Optional[str]) -> Optional[str]:
+        if scope is None or not scope.endswith(SCOPE_SUFFIX):
+            return None
+        return scope[: -len(SCOPE_SUFFIX)]
+
+    def convert(self, event: Dict) -> List[Dict]:
+        name: str = event["name"]
+        desc: str = event["desc"]
+        ts = self.timestamp(event)
+        # additional fields, e.g. step stats of a task
+        extra = {k: v for k, v in event.items() if k not in EVENT_FIELDS}
+
+        if desc == "slow-step":
+            tid = self.task_tids.get(name, None)
+            if tid is None:
+                return []
+            duration = _us(event.get("durationNs", 0))
+            return [
+                {
+                    "name": "slow step",
+                    "cat": "slow-step",
+                    "ph": "X",
+                    "ts": ts - duration,
+                    "dur": duration,
+                    "pid": PID,
+                    "tid": tid,
+                    "args": extra,
+                }
+            ]
+
+        if name.endswith(SCOPE_SUFFIX):
+            # transparent, the task itself is shown
+            return []
+
+        if event["type"] == "task":
+            cat = "task"
+            if desc == "created":
+                tid = self.task_tids[name] = self.next_tid
+                self.next_tid += 1
+            else:
+                tid = self.task_tids.pop(name, 0)
+        else:
+            cat = "nursery"
+            if desc == "created":
+                task = self._task_of_scope(event.get("parent", None))
+                tid = 0 if task is None else self.task_tids.get(task, 0)
+                self.nursery_tids[name] = tid
+            else:
+                tid = self.nursery_tids.pop(name, 0)
+
+        trace_event = {
+            "name": name,
+            "cat": cat,
+            "ph": "B" if desc == "created" else "E",
+            "ts": ts,
+            "pid": PID,
+            "tid": tid,
+        }
+        if extra:
+            trace_event["args"] = extra
+        if desc == "created" and cat == "task":
+            meta = {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": PID,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            return [meta, trace_event]
+        return [trace_event]
+
+
+def write_trace(events: Iterable[Dict], out: IO[str], array: bool = False):
+    """Convert events to trace events and write them as they come"""
+    converter = TraceEventConverter()
+    out.write("[\n" if array else '{"displayTimeUnit": "ns", "traceEvents": [\n')
+    out.write(
+        json.dumps(
+            {"name": "process_name", "ph": "M", "pid": PID, "args": {"name": "trio"}}
+        )
+    )
+    for event in events:
+        for trace_event in converter.convert(event):
+            out.write(",\n")
+            out.write(json.dumps(trace_event))
+    out.write("\n]\n" if array else "\n]}\n")
+
+
+def export_trace(log_filename: str, trace_filename: str, array: bool = False):
+    with open(trace_filename, "w") as out:
+        write_trace(iter_log_events(log_filename), out, array=array)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export a trio-vis log as Trace Event Format JSON "
+        "(chrome://tracing, Perfetto)"
+    )
+    parser.add_argument("log_file", help="sc-vis log, NDJSON or binary log")
+    parser.add_argument("trace_file", nargs="?", default="./sc-trace.json")
+    parser.add_argument(
+        "--array",
+        action="store_true",
+        help="write a bare JSON array, which stays loadable if truncated",
+    )
+    args = parser.parse_args()
+    export_trace(args.log_file, args.trace_file, array=args.array)
+
+
+if __name__ == "__main__":
+    main()
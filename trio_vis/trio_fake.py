@@ -138,6 +138,10 @@ class FakeTrioNursery(FakeNode, TrioNursery):
     def child_tasks(self):
         return self._children
 
+    @property
+    def parent_task(self):
+        return self._parent
+
     @property
     def _trio_vis_name(self):
         return self._name
@@ -184,6 +188,10 @@ class FakeTrioTask(FakeNode, TrioTask):
     def child_nurseries(self):
         return self._children
 
+    @property
+    def parent_nursery(self):
+        return self._parent
+
     def _add_nursery(self, nursery: "FakeTrioNursery"):
         self.tree_root.tree_add(nursery, parent_name=self._name)
 